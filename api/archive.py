@@ -0,0 +1,475 @@
+"""
+Холодный архив ошибок.
+
+Ошибки старше ERROR_ARCHIVE_AFTER_MONTHS календарных месяцев переносятся
+из error_logs в сжатые zstd файлы NDJSON: один сегмент на проект и месяц,
+реестр сегментов - таблица error_archives. В файле строки идут от новых к
+старым кадрами zstd по ARCHIVE_FRAME_ROWS строк; смещение каждого кадра и
+ключ (created_at, id) его первой строки хранятся в реестре, поэтому
+страница по курсору распаковывает только нужные кадры. list_errors
+(api.pagination) дочитывает архив, когда горячие строки проекта
+закончились, и клиент видит одну ленту ошибок.
+
+Сегменты старше ERROR_ARCHIVE_RETENTION_MONTHS удаляются целиком (файл и
+строка реестра), без DELETE по error_logs. Счетчики ошибок (api.counters)
+не архивируются, статистика за все время остается точной. Полнотекстовый
+поиск (api.search) идет только по горячим ошибкам.
+
+Архиву нужен пакет zstandard; без него архивация выключена, а уже
+записанные сегменты не читаются.
+
+Запуск вручную (например, из cron): python -m api.archive
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database.models import ErrorArchive, ErrorLog, Project
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Через сколько месяцев ошибки уходят в архив; 0 - архив выключен
+ERROR_ARCHIVE_AFTER_MONTHS = int(os.getenv("ERROR_ARCHIVE_AFTER_MONTHS", "0"))
+
+# Каталог файлов архива; в реестре пути хранятся относительно него
+ERROR_ARCHIVE_DIR = os.getenv("ERROR_ARCHIVE_DIR", "./archive")
+
+# Через сколько месяцев сегменты архива удаляются; 0 - хранить всегда
+ERROR_ARCHIVE_RETENTION_MONTHS = int(os.getenv("ERROR_ARCHIVE_RETENTION_MONTHS", "0"))
+
+ERROR_ARCHIVE_ZSTD_LEVEL = int(os.getenv("ERROR_ARCHIVE_ZSTD_LEVEL", "10"))
+
+# Строк error_logs в одной транзакции удаления после записи сегмента
+ERROR_ARCHIVE_DELETE_CHUNK = int(os.getenv("ERROR_ARCHIVE_DELETE_CHUNK", "5000"))
+
+# Строк в одном кадре zstd: столько распаковывается ради одной страницы
+ARCHIVE_FRAME_ROWS = 1000
+
+ARCHIVE_COLUMNS = (
+    ErrorLog.id,
+    ErrorLog.project_id,
+    ErrorLog.group_id,
+    ErrorLog.error_type,
+    ErrorLog.error_message,
+    ErrorLog.stack_trace,
+    ErrorLog.additional_data,
+    ErrorLog.severity_level,
+    ErrorLog.is_resolved,
+    ErrorLog.created_at,
+)
+
+Key = Tuple[datetime, int]
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def encode_row(row: Dict[str, Any]) -> bytes:
+    row = dict(row, created_at=row["created_at"].isoformat())
+    return json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_row(line: bytes) -> Dict[str, Any]:
+    row = json.loads(line)
+    row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return row
+
+
+def segment_path(project_id: int, month: datetime) -> str:
+    return os.path.join(f"project-{project_id}", f"{month:%Y-%m}.ndjson.zst")
+
+
+def write_segment(db: Session, project_id: int, month: datetime, directory: str, level: int) -> Optional[Dict[str, Any]]:
+    """
+    Пишет ошибки проекта за месяц в файл сегмента. Возвращает поля строки
+    реестра или None, если ошибок за месяц нет
+    """
+    path = segment_path(project_id, month)
+    full_path = os.path.join(directory, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    query = select(*ARCHIVE_COLUMNS).where(
+        ErrorLog.project_id == project_id,
+        ErrorLog.created_at >= month,
+        ErrorLog.created_at < add_months(month, 1)
+    ).order_by(ErrorLog.created_at.desc(), ErrorLog.id.desc())
+
+    compressor = zstandard.ZstdCompressor(level=level)
+    frames: List[list] = []
+    row_count = 0
+    min_id = max_id = None
+    first_created_at = last_created_at = None
+    offset = 0
+    # Пишем во временный файл: недописанный сегмент не должен выглядеть готовым
+    with open(full_path + ".tmp", "wb") as f:
+        for rows in db.execute(query.execution_options(yield_per=ARCHIVE_FRAME_ROWS)).mappings().partitions():
+            frame = compressor.compress(b"".join(encode_row(row) for row in rows))
+            f.write(frame)
+            frames.append([offset, len(frame), rows[0]["created_at"].isoformat(), rows[0]["id"]])
+            offset += len(frame)
+
+            row_count += len(rows)
+            ids = [row["id"] for row in rows]
+            min_id = min(ids) if min_id is None else min(min_id, *ids)
+            max_id = max(ids) if max_id is None else max(max_id, *ids)
+            last_created_at = last_created_at or rows[0]["created_at"]
+            first_created_at = rows[-1]["created_at"]
+        f.flush()
+        os.fsync(f.fileno())
+
+    if not row_count:
+        os.remove(full_path + ".tmp")
+        return None
+    os.replace(full_path + ".tmp", full_path)
+    return {
+        "project_id": project_id,
+        "period_start": month,
+        "path": path,
+        "row_count": row_count,
+        "size_bytes": offset,
+        "first_created_at": first_created_at,
+        "last_created_at": last_created_at,
+        "min_id": min_id,
+        "max_id": max_id,
+        "frames": frames,
+    }
+
+
+def delete_archived_chunk(db: Session, segment: ErrorArchive, chunk_size: int) -> int:
+    """
+    Удаляет до chunk_size горячих строк, уже записанных в сегмент
+    """
+    ids = select(ErrorLog.id).where(
+        ErrorLog.project_id == segment.project_id,
+        ErrorLog.created_at >= segment.period_start,
+        ErrorLog.created_at < add_months(segment.period_start, 1),
+        # Строки, записанные в этот месяц после сегмента, остаются в error_logs
+        ErrorLog.id.between(segment.min_id, segment.max_id)
+    ).limit(chunk_size)
+    deleted = db.execute(
+        delete(ErrorLog).where(ErrorLog.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def months_to_archive(db: Session, cutoff: datetime) -> List[Tuple[int, datetime]]:
+    """
+    (проект, месяц) с горячими ошибками раньше cutoff, по индексу (project_id, created_at)
+    """
+    pending = []
+    for (project_id,) in db.execute(select(Project.id).order_by(Project.id)).all():
+        month = None
+        while True:
+            query = select(func.min(ErrorLog.created_at)).where(
+                ErrorLog.project_id == project_id, ErrorLog.created_at < cutoff
+            )
+            if month is not None:
+                query = query.where(ErrorLog.created_at >= add_months(month, 1))
+            oldest = db.scalar(query)
+            if oldest is None:
+                break
+            month = month_start(oldest)
+            pending.append((project_id, month))
+    return pending
+
+
+def archive_month(
+    db: Session,
+    project_id: int,
+    month: datetime,
+    directory: str = ERROR_ARCHIVE_DIR,
+    level: int = ERROR_ARCHIVE_ZSTD_LEVEL,
+    chunk_size: int = ERROR_ARCHIVE_DELETE_CHUNK
+) -> Tuple[int, int]:
+    """
+    Переносит ошибки проекта за месяц в сегмент архива.
+    Возвращает (записано в архив, удалено из error_logs).
+
+    Порядок: файл, строка реестра, удаление порциями. Прерванный перенос
+    продолжится со следующего шага при следующем запуске.
+    """
+    segment = db.scalar(select(ErrorArchive).where(
+        ErrorArchive.project_id == project_id, ErrorArchive.period_start == month
+    ))
+    archived = 0
+    if segment is None:
+        fields = write_segment(db, project_id, month, directory, level)
+        if fields is None:
+            return 0, 0
+        # Чтение шло в транзакции; реестр пишется в новой
+        db.commit()
+        db.execute(insert(ErrorArchive), [fields])
+        db.commit()
+        segment = db.scalar(select(ErrorArchive).where(
+            ErrorArchive.project_id == project_id, ErrorArchive.period_start == month
+        ))
+        archived = segment.row_count
+
+    deleted = 0
+    while True:
+        chunk = delete_archived_chunk(db, segment, chunk_size)
+        deleted += chunk
+        if chunk < chunk_size:
+            return archived, deleted
+
+
+def delete_expired_segments(db: Session, cutoff: datetime, directory: str = ERROR_ARCHIVE_DIR) -> int:
+    """
+    Удаляет сегменты за месяцы раньше cutoff: файл и строку реестра
+    """
+    segments = db.scalars(select(ErrorArchive).where(ErrorArchive.period_start < cutoff)).all()
+    for segment in segments:
+        try:
+            os.remove(os.path.join(directory, segment.path))
+        except FileNotFoundError:
+            pass
+        db.delete(segment)
+        db.commit()
+    return len(segments)
+
+
+def delete_project_segments(db: Session, project_id: int, directory: str = ERROR_ARCHIVE_DIR) -> List[str]:
+    """
+    Удаляет строки реестра всех сегментов проекта, без коммита.
+    Возвращает пути файлов: их стоит удалить (remove_segment_files) после коммита
+    """
+    paths = db.scalars(select(ErrorArchive.path).where(ErrorArchive.project_id == project_id)).all()
+    db.execute(delete(ErrorArchive).where(ErrorArchive.project_id == project_id))
+    return [os.path.join(directory, path) for path in paths]
+
+
+def remove_segment_files(paths: Sequence[str]):
+    """
+    Удаляет файлы сегментов и опустевшие каталоги проектов
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            # В каталоге остались другие сегменты
+            pass
+
+
+def archive_errors(
+    db: Session,
+    now: datetime,
+    after_months: int = ERROR_ARCHIVE_AFTER_MONTHS,
+    retention_months: int = ERROR_ARCHIVE_RETENTION_MONTHS,
+    directory: str = ERROR_ARCHIVE_DIR,
+    level: int = ERROR_ARCHIVE_ZSTD_LEVEL,
+    chunk_size: int = ERROR_ARCHIVE_DELETE_CHUNK
+) -> Dict[str, int]:
+    """
+    Один проход архивации: переносит полные месяцы старше after_months и
+    удаляет сегменты старше retention_months. now - локальное время, как
+    error_logs.created_at
+    """
+    result = {"segments": 0, "archived_errors": 0, "deleted_errors": 0, "expired_segments": 0}
+    if after_months > 0 and zstandard is None:
+        logger.warning("zstandard is not installed, error archiving is disabled")
+    elif after_months > 0:
+        cutoff = add_months(month_start(now), -after_months)
+        for project_id, month in months_to_archive(db, cutoff):
+            archived, deleted = archive_month(db, project_id, month, directory, level, chunk_size)
+            if archived:
+                result["segments"] += 1
+                logger.info(f"Archived {archived} errors of project {project_id} for {month:%Y-%m}")
+            result["archived_errors"] += archived
+            result["deleted_errors"] += deleted
+    if retention_months > 0:
+        result["expired_segments"] = delete_expired_segments(
+            db, add_months(month_start(now), -retention_months), directory
+        )
+    return result
+
+
+def read_segment(
+    path: str,
+    frames: Sequence[list],
+    before: Optional[Key],
+    since: Optional[datetime],
+    matches: Callable[[Dict[str, Any]], bool],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """
+    Строки сегмента от новых к старым с ключом (created_at, id) меньше
+    before и created_at не раньше since, прошедшие matches; не больше limit
+    """
+    start = 0
+    if before is not None:
+        # Последний кадр, начинающийся не раньше before: более новые кадры целиком до курсора
+        for index, (_, _, created_at, error_id) in enumerate(frames):
+            if (datetime.fromisoformat(created_at), error_id) >= before:
+                start = index
+
+    decompressor = zstandard.ZstdDecompressor()
+    result = []
+    with open(path, "rb") as f:
+        for offset, length, _, _ in frames[start:]:
+            f.seek(offset)
+            for line in decompressor.decompress(f.read(length)).splitlines():
+                row = decode_row(line)
+                if before is not None and (row["created_at"], row["id"]) >= before:
+                    continue
+                if since is not None and row["created_at"] < since:
+                    return result
+                if matches(row):
+                    result.append(row)
+                    if len(result) >= limit:
+                        return result
+    return result
+
+
+async def read_archived_errors(
+    db: AsyncSession,
+    project_id: int,
+    matches: Callable[[Dict[str, Any]], bool],
+    before: Optional[Key] = None,
+    since: Optional[datetime] = None,
+    after: Optional[Key] = None,
+    limit: int = 50,
+    directory: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    До limit архивных ошибок проекта, новые сначала, с ключом меньше before
+    (курсор или until). after - ключ последней горячей строки страницы:
+    сегменты целиком старше него не читаются
+    """
+    if zstandard is None:
+        # Без zstandard сегменты не распаковать; отдаем только горячие строки
+        return []
+    query = select(ErrorArchive.path, ErrorArchive.frames).where(ErrorArchive.project_id == project_id)
+    if before is not None:
+        query = query.where(ErrorArchive.first_created_at <= before[0])
+    if since is not None:
+        query = query.where(ErrorArchive.last_created_at >= since)
+    if after is not None:
+        query = query.where(ErrorArchive.last_created_at >= after[0])
+    segments = (await db.execute(query.order_by(ErrorArchive.period_start.desc()))).all()
+    directory = directory or ERROR_ARCHIVE_DIR
+
+    rows: List[Dict[str, Any]] = []
+    for path, frames in segments:
+        # Распаковка не должна занимать event loop
+        rows += await asyncio.to_thread(
+            read_segment, os.path.join(directory, path), frames, before, since, matches, limit - len(rows)
+        )
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+class ErrorArchiver:
+    """
+    Фоновая задача: раз в interval секунд переносит старые месяцы в архив.
+
+    Проход идет в отдельном потоке через синхронную сессию: сжатие и запись
+    файлов не занимают event loop, а удаление из error_logs идет короткими
+    транзакциями, как в HeartbeatCompactor.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        interval: float = 86400.0,
+        after_months: int = ERROR_ARCHIVE_AFTER_MONTHS,
+        retention_months: int = ERROR_ARCHIVE_RETENTION_MONTHS,
+        directory: str = ERROR_ARCHIVE_DIR,
+        chunk_size: int = ERROR_ARCHIVE_DELETE_CHUNK
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.after_months = after_months
+        self.retention_months = retention_months
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.runs = 0
+        self.segments = 0
+        self.archived_errors = 0
+        self.deleted_errors = 0
+        self.expired_segments = 0
+        self.last_run_seconds = 0.0
+
+    def _archive(self, now: datetime) -> Dict[str, int]:
+        with self.session_factory() as db:
+            return archive_errors(
+                db, now, self.after_months, self.retention_months, self.directory, chunk_size=self.chunk_size
+            )
+
+    async def run_once(self, now: Optional[datetime] = None):
+        started = asyncio.get_running_loop().time()
+        result = await asyncio.to_thread(self._archive, now or datetime.now())
+        self.segments += result["segments"]
+        self.archived_errors += result["archived_errors"]
+        self.deleted_errors += result["deleted_errors"]
+        self.expired_segments += result["expired_segments"]
+        self.runs += 1
+        self.last_run_seconds = asyncio.get_running_loop().time() - started
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Error while archiving errors")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.after_months <= 0 and self.retention_months <= 0:
+            return
+        if zstandard is None and self.after_months > 0:
+            logger.warning("zstandard is not installed, error archiving is disabled")
+            self.after_months = 0
+            if self.retention_months <= 0:
+                return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "segments": self.segments,
+            "archived_errors": self.archived_errors,
+            "deleted_errors": self.deleted_errors,
+            "expired_segments": self.expired_segments,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+        }
+
+
+if __name__ == "__main__":
+    from database.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as session:
+        logger.info(f"Archive pass finished: {archive_errors(session, datetime.now())}")
@@ -0,0 +1,264 @@
+"""
+Кэши процесса API для горячего пути приема данных
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import CacheInvalidation, Project, Subscriber, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Порядок уровней важности; неизвестный уровень считается ошибкой
+SEVERITY_LEVELS = {"debug": 0, "info": 1, "warning": 2, "error": 3, "critical": 4}
+
+
+def severity_rank(severity: Optional[str]) -> int:
+    return SEVERITY_LEVELS.get((severity or "error").lower(), SEVERITY_LEVELS["error"])
+
+
+class TTLCache:
+    """
+    LRU-кэш с временем жизни записей.
+
+    Значение None тоже кэшируется: так запоминаются отрицательные результаты.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Возвращает (найдено, значение)
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class CachedProject(NamedTuple):
+    """
+    Снимок проекта, не привязанный к сессии БД
+    """
+    id: int
+    name: str
+    type: str
+    token: str
+
+
+class ProjectTokenCache(TTLCache):
+    """
+    Кэш token -> активный проект, включая неизвестные и неактивные токены
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0, negative_ttl: float = 30.0):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.negative_hits = 0
+
+    async def lookup(self, db: AsyncSession, token: Optional[str]) -> Optional[CachedProject]:
+        """
+        Возвращает активный проект по токену, обращаясь к БД только при промахе
+        """
+        if not token:
+            return None
+
+        found, project = self.get(token)
+        if found:
+            if project is None:
+                self.negative_hits += 1
+            return project
+
+        result = await db.execute(
+            select(Project.id, Project.name, Project.type, Project.token).where(
+                Project.token == token,
+                Project.is_active == True
+            )
+        )
+        row = result.first()
+
+        if row is None:
+            self.set(token, None, ttl=self.negative_ttl)
+            return None
+
+        project = CachedProject(id=row.id, name=row.name, type=row.type, token=row.token)
+        self.set(token, project)
+        return project
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), "negative_hits": self.negative_hits}
+
+
+class SubscriberCache(TTLCache):
+    """
+    Кэш project_id -> [(telegram_id, минимальный уровень важности)].
+
+    Подписчики берутся по индексу subscriptions, а не сканированием всех подписчиков.
+    """
+
+    async def _load(self, db: AsyncSession, project_id: int) -> List[Tuple[int, int]]:
+        found, subscribers = self.get(project_id)
+        if found:
+            return subscribers
+
+        result = await db.execute(
+            select(Subscriber.telegram_id, Subscription.min_severity).join(
+                Subscription, Subscription.subscriber_id == Subscriber.id
+            ).where(
+                Subscription.project_id == project_id
+            )
+        )
+        rows = result.all()
+
+        subscribers = [(telegram_id, severity_rank(min_severity)) for telegram_id, min_severity in rows]
+        self.set(project_id, subscribers)
+        return subscribers
+
+    async def chat_ids(self, db: AsyncSession, project_id: int, severity: Optional[str] = None) -> List[int]:
+        """
+        Возвращает telegram_id подписчиков проекта; с severity - только тех, кому этот уровень интересен
+        """
+        subscribers = await self._load(db, project_id)
+        if severity is None:
+            return [telegram_id for telegram_id, _ in subscribers]
+
+        rank = severity_rank(severity)
+        return [telegram_id for telegram_id, min_rank in subscribers if rank >= min_rank]
+
+
+InvalidationHandler = Callable[[List[str], List[int]], Awaitable[None]]
+
+
+class SharedInvalidations:
+    """
+    Сброс кэшей во всех процессах API (API_WORKERS > 1).
+
+    Запрос бота на сброс попадает в один процесс; тот записывает его в таблицу
+    cache_invalidations, а каждый процесс раз в interval секунд читает записи
+    с id больше последней прочитанной и передает их в apply. Так отрицательная
+    запись нового токена и устаревший проект живут в остальных процессах не
+    дольше interval, а не до истечения TTL. Записи старше retention секунд
+    удаляются при следующей публикации.
+    """
+
+    def __init__(self, session_factory, apply: InvalidationHandler, interval: float = 1.0, retention: float = 3600.0):
+        self.session_factory = session_factory
+        self.apply = apply
+        self.interval = interval
+        self.retention = retention
+        self._last_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.published = 0
+        self.applied = 0
+        self.failed_polls = 0
+
+    async def publish(self, tokens: Sequence[str], project_ids: Sequence[int]):
+        """
+        Записывает сброс для остальных процессов
+        """
+        rows = [{"token": token, "project_id": None} for token in tokens]
+        rows += [{"token": None, "project_id": project_id} for project_id in project_ids]
+        if not rows:
+            return
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            await db.execute(insert(CacheInvalidation), [{**row, "created_at": now} for row in rows])
+            await db.execute(delete(CacheInvalidation).where(
+                CacheInvalidation.created_at < now - timedelta(seconds=self.retention)
+            ))
+            await db.commit()
+        self.published += len(rows)
+
+    async def poll(self):
+        """
+        Применяет сбросы, записанные после прошлого чтения
+        """
+        async with self.session_factory() as db:
+            if self._last_id is None:
+                # Кэш только что запущенного процесса пуст: старые записи не нужны
+                self._last_id = await db.scalar(select(func.max(CacheInvalidation.id))) or 0
+                return
+            rows = (await db.execute(
+                select(CacheInvalidation.id, CacheInvalidation.token, CacheInvalidation.project_id)
+                .where(CacheInvalidation.id > self._last_id)
+                .order_by(CacheInvalidation.id)
+            )).all()
+        if not rows:
+            return
+        await self.apply(
+            [row.token for row in rows if row.token is not None],
+            list(dict.fromkeys(row.project_id for row in rows if row.project_id is not None))
+        )
+        self._last_id = rows[-1].id
+        self.applied += len(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                self.failed_polls += 1
+                logger.exception("Failed to read cache invalidations")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "published": self.published,
+            "applied": self.applied,
+            "failed_polls": self.failed_polls,
+        }
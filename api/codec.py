@@ -0,0 +1,185 @@
+"""
+Декодирование тел запросов.
+
+SDK сжимают пакеты ошибок (Content-Encoding: gzip или zstd): JSON с
+повторяющимися ключами и трейсбеками сжимается в несколько раз. Middleware
+распаковывает тело до обработчика, поэтому обработчики ничего не знают о
+сжатии. Размер распакованного тела ограничен, чтобы маленький архив не
+развернулся в гигабайты в памяти; сжатое тело больше того же предела
+отклоняется, не дочитываясь до конца.
+
+Endpoint'ы приема разбирают тело через decode_payload: кроме JSON
+поддерживается msgpack (Content-Type: application/msgpack).
+"""
+import io
+import json
+import zlib
+from typing import Any, List, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Предел размера тела после распаковки
+MAX_DECOMPRESSED_BYTES = 10 * 1024 * 1024
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class DecodeError(ValueError):
+    """
+    Тело запроса не удалось разобрать
+    """
+    status_code = 400
+
+
+class UnsupportedMediaType(DecodeError):
+    status_code = 415
+
+
+def gunzip(data: bytes, limit: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Распаковывает gzip, не выделяя больше limit байт
+    """
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = decoder.decompress(data, limit + 1)
+    if len(body) > limit or decoder.unconsumed_tail:
+        raise BodyTooLarge()
+    if not decoder.eof:
+        raise zlib.error("truncated gzip stream")
+    return body
+
+
+def unzstd(data: bytes, limit: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """
+    Распаковывает zstd потоком, не доверяя размеру из заголовка кадра
+    """
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        body = reader.read(limit + 1)
+    if len(body) > limit:
+        raise BodyTooLarge()
+    return body
+
+
+def supported_encodings() -> List[bytes]:
+    encodings = [b"gzip"]
+    if zstandard is not None:
+        encodings.append(b"zstd")
+    return encodings
+
+
+def decompress(data: bytes, encoding: bytes, limit: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    if encoding == b"gzip":
+        return gunzip(data, limit)
+    if encoding == b"zstd" and zstandard is not None:
+        return unzstd(data, limit)
+    raise UnsupportedMediaType(f"Unsupported Content-Encoding: {encoding.decode(errors='replace')}")
+
+
+def decode_payload(body: bytes, content_type: str = "application/json") -> Any:
+    """
+    Разбирает тело запроса по Content-Type: msgpack или JSON (все остальное,
+    как и раньше, разбирается как JSON)
+    """
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise UnsupportedMediaType("msgpack is not supported by this server")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as e:
+            raise DecodeError(f"Invalid msgpack body: {e}")
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise DecodeError(f"Invalid JSON body: {e}")
+
+
+class RequestDecompressionMiddleware:
+    """
+    ASGI middleware: тело с Content-Encoding: gzip или zstd распаковывается
+    и передается дальше как обычный запрос без Content-Encoding
+    """
+
+    def __init__(self, app, max_size: int = MAX_DECOMPRESSED_BYTES, streaming_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.max_size = max_size
+        # Пути, тело которых обработчик читает потоком: их не трогаем
+        self.streaming_paths = streaming_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.streaming_paths:
+            return await self.app(scope, receive, send)
+
+        encoding = None
+        content_length = None
+        headers: List[Tuple[bytes, bytes]] = []
+        for name, value in scope["headers"]:
+            if name == b"content-encoding":
+                encoding = value.strip().lower()
+            elif name == b"content-length":
+                content_length = value
+            else:
+                headers.append((name, value))
+        if encoding is None or encoding == b"identity":
+            return await self.app(scope, receive, send)
+        if encoding not in supported_encodings():
+            return await self._error(send, 415, f"Unsupported Content-Encoding: {encoding.decode(errors='replace')}")
+
+        # Сжатое тело не бывает заметно больше распакованного: больший размер
+        # отклоняем по заголовку, а без заголовка - как только он набрался
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_size:
+            return await self._error(send, 413, "Compressed body is too large")
+        chunks = []
+        received = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            received += len(chunk)
+            if received > self.max_size:
+                return await self._error(send, 413, "Compressed body is too large")
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+
+        try:
+            body = decompress(b"".join(chunks), encoding, self.max_size)
+        except BodyTooLarge:
+            return await self._error(send, 413, "Decompressed body is too large")
+        except Exception:
+            return await self._error(send, 400, f"Invalid {encoding.decode()} body")
+
+        headers.append((b"content-length", str(len(body)).encode()))
+        scope = dict(scope, headers=headers)
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _error(send, status: int, detail: str):
+        payload = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
@@ -0,0 +1,224 @@
+"""
+Счетчики ошибок по проектам, важности и времени.
+
+При записи пакета ошибок счетчики минуты, часа, суток и итог за все время
+увеличиваются одним upsert'ом на проект и важность, поэтому статистике не
+нужен COUNT по error_logs. Окно [since, until) собирается из суточных
+счетчиков в середине и часовых и минутных по краям: запрос читает не больше
+нескольких сотен строк на проект и важность при любом размере error_logs.
+
+Минутные счетчики хранятся ERROR_COUNTER_MINUTE_RETENTION_HOURS часов,
+часовые - ERROR_COUNTER_HOUR_RETENTION_DAYS дней, суточные и итоги - всегда.
+Если начало окна старше срока хранения минутных (часовых) счетчиков,
+оно округляется вниз до часа (суток).
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from database.models import ErrorCounter
+
+ERROR_COUNTER_MINUTE_RETENTION_HOURS = int(os.getenv("ERROR_COUNTER_MINUTE_RETENTION_HOURS", "48"))
+ERROR_COUNTER_HOUR_RETENTION_DAYS = int(os.getenv("ERROR_COUNTER_HOUR_RETENTION_DAYS", "90"))
+
+# period_start итогового счетчика
+TOTAL_START = datetime(1970, 1, 1)
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# Диалекты, где счетчик увеличивается через INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def floor_minute(moment: datetime) -> datetime:
+    return moment.replace(second=0, microsecond=0)
+
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil(moment: datetime, floor, step: timedelta) -> datetime:
+    start = floor(moment)
+    return start if start == moment else start + step
+
+
+def counter_rows(project_id: int, events: Iterable[Dict[str, Any]], created_at: datetime) -> List[Dict[str, Any]]:
+    """
+    Строки приращений счетчиков для пакета событий одного проекта
+    """
+    by_severity: Dict[str, int] = {}
+    for event in events:
+        severity = event.get("severity") or "error"
+        by_severity[severity] = by_severity.get(severity, 0) + (event.get("count") or 1)
+
+    buckets = (
+        ("minute", floor_minute(created_at)),
+        ("hour", floor_hour(created_at)),
+        ("day", floor_day(created_at)),
+        ("total", TOTAL_START),
+    )
+    return [
+        {"project_id": project_id, "period": period, "period_start": start, "severity_level": severity, "count": count}
+        for severity, count in sorted(by_severity.items())
+        for period, start in buckets
+    ]
+
+
+def add_error_counts(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Прибавляет приращения к счетчикам, без коммита
+    """
+    if not rows:
+        return
+    make_insert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if make_insert is not None:
+        stmt = make_insert(ErrorCounter)
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["project_id", "period", "period_start", "severity_level"],
+                set_={"count": ErrorCounter.count + stmt.excluded.count}
+            ),
+            rows
+        )
+        return
+
+    # Остальные БД: UPDATE, а если счетчика еще нет - INSERT. Гонку двух
+    # вставок ловит уникальный индекс, вызывающий повторяет пакет
+    for row in rows:
+        updated = db.execute(
+            update(ErrorCounter)
+            .where(
+                ErrorCounter.project_id == row["project_id"],
+                ErrorCounter.period == row["period"],
+                ErrorCounter.period_start == row["period_start"],
+                ErrorCounter.severity_level == row["severity_level"]
+            )
+            .values(count=ErrorCounter.count + row["count"])
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            db.add(ErrorCounter(**row))
+    db.flush()
+
+
+def window_ranges(
+    since: datetime,
+    until: datetime,
+    now: Optional[datetime] = None
+) -> List[Tuple[str, datetime, datetime]]:
+    """
+    Разбивает окно [since, until) на диапазоны счетчиков (period, start, end):
+    минуты до первого целого часа, часы до первых целых суток, сутки, и так же
+    в обратном порядке у конца окна
+    """
+    now = now or datetime.now()
+    if since < now - timedelta(days=ERROR_COUNTER_HOUR_RETENTION_DAYS):
+        since = floor_day(since)
+    elif since < now - timedelta(hours=ERROR_COUNTER_MINUTE_RETENTION_HOURS):
+        since = floor_hour(since)
+    else:
+        since = floor_minute(since)
+    if since >= until:
+        return []
+
+    # Счетчики, целиком лежащие в окне; последний неполный - тоже
+    until = _ceil(until, floor_minute, MINUTE)
+    ranges = []
+
+    hour_start = min(_ceil(since, floor_hour, HOUR), until)
+    hour_end = max(floor_hour(until), hour_start)
+    if hour_start >= hour_end:
+        return [("minute", since, until)]
+
+    day_start = min(_ceil(hour_start, floor_day, DAY), hour_end)
+    day_end = max(floor_day(hour_end), day_start)
+
+    for period, start, end in (
+        ("minute", since, hour_start),
+        ("hour", hour_start, day_start),
+        ("day", day_start, day_end),
+        ("hour", day_end, hour_end),
+        ("minute", hour_end, until),
+    ):
+        if start < end:
+            ranges.append((period, start, end))
+    return ranges
+
+
+def count_errors(
+    db: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    project_id: Optional[int] = None
+) -> Dict[int, Dict[str, int]]:
+    """
+    Число ошибок {project_id: {severity: count}} за окно [since, until)
+    или за все время, если since не задан
+    """
+    if since is None:
+        condition = ErrorCounter.period == "total"
+    else:
+        ranges = window_ranges(since, until or datetime.now())
+        if not ranges:
+            return {}
+        condition = or_(*[
+            and_(ErrorCounter.period == period, ErrorCounter.period_start >= start, ErrorCounter.period_start < end)
+            for period, start, end in ranges
+        ])
+
+    query = (
+        select(ErrorCounter.project_id, ErrorCounter.severity_level, func.sum(ErrorCounter.count))
+        .where(condition)
+        .group_by(ErrorCounter.project_id, ErrorCounter.severity_level)
+    )
+    if project_id is not None:
+        query = query.where(ErrorCounter.project_id == project_id)
+
+    counts: Dict[int, Dict[str, int]] = {}
+    for row_project_id, severity, count in db.execute(query):
+        counts.setdefault(row_project_id, {})[severity] = int(count)
+    return counts
+
+
+def summarize_counts(counts: Dict[int, Dict[str, int]]) -> Dict[str, Any]:
+    """
+    Итог, разбивка по важности и по проектам для ответа API и бота
+    """
+    by_severity: Dict[str, int] = {}
+    for severities in counts.values():
+        for severity, count in severities.items():
+            by_severity[severity] = by_severity.get(severity, 0) + count
+    return {
+        "total": sum(by_severity.values()),
+        "by_severity": by_severity,
+        "by_project": {
+            project_id: {"total": sum(severities.values()), "by_severity": severities}
+            for project_id, severities in counts.items()
+        },
+    }
+
+
+def delete_error_counters_chunk(db: Session, period: str, cutoff: datetime, chunk_size: int) -> int:
+    """
+    Удаляет до chunk_size счетчиков периода period, начавшихся раньше cutoff
+    """
+    ids = select(ErrorCounter.id).where(
+        ErrorCounter.period == period,
+        ErrorCounter.period_start < cutoff
+    ).limit(chunk_size)
+    deleted = db.execute(
+        delete(ErrorCounter).where(ErrorCounter.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
@@ -0,0 +1,178 @@
+"""
+Отслеживание пропущенных heartbeat без периодического просмотра всех проектов.
+
+Для каждого проекта хранится срок следующего heartbeat (последний сигнал
+плюс таймаут проекта), а сроки лежат в куче. Фоновая задача спит до
+ближайшего срока, поэтому пропуск замечается через секунды после него,
+а не при следующей ежечасной проверке. Heartbeat только сдвигает срок
+в словаре; запись в куче обновляется лениво, когда до нее доходит очередь,
+так что размер кучи не превышает числа проектов.
+
+В нескольких процессах API планировщик работает только в ведущем
+(api.leader) и раз в sync_interval секунд сверяет сроки с БД: heartbeat,
+принятые другими процессами, и новые или измененные проекты.
+"""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Обработчик пропуска: получает id проекта и срок, возвращает новый срок
+# (например, если heartbeat пришел в другой процесс API) или None
+ExpiredHandler = Callable[[int, datetime], Awaitable[Optional[datetime]]]
+
+# Как долго спать, если сроков нет или ближайший далеко
+MAX_SLEEP_SECONDS = 60.0
+
+
+class DeadlineScheduler:
+    """
+    Куча сроков heartbeat с одним таймером на все проекты
+    """
+
+    def __init__(
+        self,
+        on_expired: ExpiredHandler,
+        default_timeout: float = 3600.0,
+        sync: Optional[Callable[[], Awaitable[None]]] = None,
+        sync_interval: float = MAX_SLEEP_SECONDS
+    ):
+        self.on_expired = on_expired
+        self.default_timeout = default_timeout
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self._next_sync = 0.0
+
+        self._heap: List[Tuple[datetime, int]] = []
+        self._deadlines: Dict[int, datetime] = {}
+        self._queued: Dict[int, datetime] = {}  # Самый ранний срок проекта в куче
+        self._timeouts: Dict[int, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.expired = 0
+        self.rescheduled = 0
+
+    def timeout(self, project_id: int) -> float:
+        return self._timeouts.get(project_id, self.default_timeout)
+
+    def set_timeout(self, project_id: int, timeout: Optional[float]):
+        if timeout:
+            self._timeouts[project_id] = float(timeout)
+        else:
+            self._timeouts.pop(project_id, None)
+
+    def schedule(self, project_id: int, deadline: datetime):
+        """
+        Ставит срок проекта (раньше или позже текущего)
+        """
+        self._deadlines[project_id] = deadline
+        queued = self._queued.get(project_id)
+        if queued is not None and queued <= deadline:
+            # Запись в куче сработает раньше и будет перенесена на новый срок
+            return
+        self._queued[project_id] = deadline
+        heapq.heappush(self._heap, (deadline, project_id))
+        if self._heap[0] == (deadline, project_id):
+            self._wakeup.set()
+
+    def touch(self, project_id: int, seen: datetime):
+        """
+        Heartbeat проекта: следующий ожидается не позже seen + таймаут проекта
+        """
+        self.schedule(project_id, seen + timedelta(seconds=self.timeout(project_id)))
+
+    def remove(self, project_id: int):
+        """
+        Перестает следить за проектом (удален или неактивен)
+        """
+        self._deadlines.pop(project_id, None)
+        self._timeouts.pop(project_id, None)
+
+    def deadline(self, project_id: int) -> Optional[datetime]:
+        return self._deadlines.get(project_id)
+
+    def project_ids(self) -> Set[int]:
+        return set(self._deadlines)
+
+    def _pop_expired(self, now: datetime) -> List[Tuple[int, datetime]]:
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            queued, project_id = heapq.heappop(self._heap)
+            if self._queued.get(project_id) == queued:
+                del self._queued[project_id]
+
+            deadline = self._deadlines.get(project_id)
+            if deadline is None:
+                continue
+            if deadline > queued:
+                # Срок сдвинулся heartbeat'ом - переносим запись
+                if project_id not in self._queued:
+                    self._queued[project_id] = deadline
+                    heapq.heappush(self._heap, (deadline, project_id))
+                continue
+
+            del self._deadlines[project_id]
+            expired.append((project_id, deadline))
+        return expired
+
+    async def check(self, now: Optional[datetime] = None):
+        """
+        Вызывает обработчик для всех наступивших сроков
+        """
+        now = now or datetime.utcnow()
+        for project_id, deadline in self._pop_expired(now):
+            self.expired += 1
+            try:
+                next_deadline = await self.on_expired(project_id, deadline)
+            except Exception:
+                logger.exception(f"Error while handling missed heartbeat of project {project_id}")
+                continue
+            if next_deadline is not None and project_id not in self._deadlines:
+                self.rescheduled += 1
+                self.schedule(project_id, next_deadline)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self._next_sync = loop.time() + self.sync_interval
+        while True:
+            self._wakeup.clear()
+            try:
+                if self.sync and loop.time() >= self._next_sync:
+                    self._next_sync = loop.time() + self.sync_interval
+                    await self.sync()
+                await self.check()
+            except Exception:
+                logger.exception("Error in heartbeat deadline scheduler")
+
+            sleep = MAX_SLEEP_SECONDS
+            if self.sync:
+                sleep = min(sleep, max(0.0, self._next_sync - loop.time()))
+            if self._heap:
+                sleep = min(sleep, max(0.0, (self._heap[0][0] - datetime.utcnow()).total_seconds()))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), sleep)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {
+            "projects": len(self._deadlines),
+            "heap": len(self._heap),
+            "next_deadline": self._heap[0][0].isoformat() if self._heap else None,
+            "expired": self.expired,
+            "rescheduled": self.rescheduled,
+        }
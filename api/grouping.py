@@ -0,0 +1,71 @@
+"""
+Отпечатки ошибок: одинаковые ошибки попадают в одну группу
+"""
+import hashlib
+import re
+from typing import List, Optional, Tuple
+
+# Сколько верхних (ближайших к месту ошибки) кадров стека учитывать
+FINGERPRINT_FRAMES = 5
+
+_UUID_RE = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+_HEX_RE = re.compile(r"\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b", re.IGNORECASE)
+_QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES_RE = re.compile(r"\s+")
+
+# Python: File "/app/handlers.py", line 42, in handle
+_PYTHON_FRAME_RE = re.compile(r'File "([^"]+)", line \d+, in (\S+)')
+# JS: at handle (/app/handlers.js:42:13) или at /app/handlers.js:42:13
+_JS_FRAME_RE = re.compile(r"at (?:(\S+) \()?([^()\s]+?):\d+:\d+\)?")
+# PHP: #0 /app/handlers.php(42): handle()
+_PHP_FRAME_RE = re.compile(r"#\d+ ([^(]+)\(\d+\): ([^(]+)\(")
+
+
+def normalize_message(message: Optional[str]) -> str:
+    """
+    Превращает сообщение в шаблон: идентификаторы, числа и строки в кавычках заменяются метками
+    """
+    template = message or ""
+    template = _UUID_RE.sub("<uuid>", template)
+    template = _HEX_RE.sub("<hex>", template)
+    template = _QUOTED_RE.sub("<str>", template)
+    template = _NUMBER_RE.sub("<num>", template)
+    return _SPACES_RE.sub(" ", template).strip()[:500]
+
+
+def _basename(path: str) -> str:
+    return path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+def top_frames(stack_trace: Optional[str], limit: int = FINGERPRINT_FRAMES) -> List[Tuple[str, str]]:
+    """
+    Возвращает (файл, функция) для ближайших к месту ошибки кадров, без номеров строк
+    """
+    if not stack_trace:
+        return []
+
+    frames = _PYTHON_FRAME_RE.findall(stack_trace)
+    if frames:
+        # В traceback Python место ошибки - последний кадр
+        return [(_basename(path), func) for path, func in frames[-limit:]]
+
+    frames = _JS_FRAME_RE.findall(stack_trace)
+    if frames:
+        return [(_basename(path), func or "<anonymous>") for func, path in frames[:limit]]
+
+    frames = _PHP_FRAME_RE.findall(stack_trace)
+    if frames:
+        return [(_basename(path.strip()), func.strip()) for path, func in frames[:limit]]
+
+    lines = [_NUMBER_RE.sub("", line).strip() for line in stack_trace.splitlines()]
+    return [(line, "") for line in lines if line][:limit]
+
+
+def compute_fingerprint(error_type: Optional[str], message: Optional[str], stack_trace: Optional[str]) -> str:
+    """
+    sha1 от типа ошибки, шаблона сообщения и верхних кадров стека
+    """
+    parts = [error_type or "Unknown", normalize_message(message)]
+    parts.extend(f"{path}:{func}" for path, func in top_frames(stack_trace))
+    return hashlib.sha1("\n".join(parts).encode("utf-8", "replace")).hexdigest()
@@ -0,0 +1,251 @@
+"""
+Разбор и пакетная запись ошибок, присылаемых SDK
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from api.counters import add_error_counts, counter_rows
+from api.grouping import compute_fingerprint, normalize_message
+from database.models import ErrorGroup, ErrorLog
+
+# Максимальное количество событий в одном запросе
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+# Сколько полных записей error_logs хранить на одну группу ошибок
+ERROR_SAMPLE_LIMIT = int(os.getenv("ERROR_SAMPLE_LIMIT", "20"))
+
+
+class InvalidPayload(ValueError):
+    """
+    Тело запроса не является ошибкой или пакетом ошибок
+    """
+
+
+def _unwrap_event(item: Any, index: int) -> Tuple[Optional[str], Dict[str, Any]]:
+    """
+    Возвращает токен и саму ошибку из элемента пакета.
+
+    SDK кладут в пакет конверты {"project_token": ..., "error": {...}},
+    но допускаем и "голые" ошибки без конверта.
+    """
+    if not isinstance(item, dict):
+        raise InvalidPayload(f"errors[{index}]: expected object")
+
+    event = item.get("error", item)
+    if not isinstance(event, dict):
+        raise InvalidPayload(f"errors[{index}].error: expected object")
+
+    for field in ("type", "message", "stack_trace", "severity"):
+        value = event.get(field)
+        if value is not None and not isinstance(value, str):
+            raise InvalidPayload(f"errors[{index}].{field}: expected string")
+
+    context = event.get("context")
+    if context is not None and not isinstance(context, dict):
+        raise InvalidPayload(f"errors[{index}].context: expected object")
+
+    # count > 1 присылает SDK, когда схлопывает повторы одной ошибки
+    count = event.get("count")
+    if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count < 1):
+        raise InvalidPayload(f"errors[{index}].count: expected positive integer")
+
+    return item.get("project_token"), event
+
+
+def with_shared_context(event: Dict[str, Any], shared_context: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Добавляет общий контекст пакета к контексту события; ключи события важнее
+    """
+    if not shared_context:
+        return event
+    return {**event, "context": {**shared_context, **(event.get("context") or {})}}
+
+
+def parse_error_event(
+    item: Any,
+    index: int,
+    token: Optional[str],
+    shared_context: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Проверяет одно событие потока: токен события, если он указан,
+    должен совпадать с токеном потока
+    """
+    item_token, event = _unwrap_event(item, index)
+    if item_token is not None and item_token != token:
+        raise InvalidPayload(f"errors[{index}]: event belongs to a different project")
+    return with_shared_context(event, shared_context)
+
+
+def parse_error_payload(data: Dict[str, Any]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Достает токен проекта и список ошибок из тела запроса.
+
+    Поддерживается одиночный формат {"project_token": ..., "error": {...}}
+    и пакетный {"errors": [...]}, который отправляют SDK. Все события
+    пакета проверяются целиком и должны принадлежать одному проекту.
+
+    В пакете токен и общий для всех событий контекст (например, system_info)
+    можно передать один раз: {"project_token": ..., "context": {...},
+    "errors": [...]}; собственный контекст события важнее общего.
+    """
+    if not isinstance(data, dict):
+        raise InvalidPayload("expected JSON object")
+
+    token = data.get("project_token")
+
+    if "errors" not in data:
+        _, event = _unwrap_event({"error": data.get("error") or {}}, 0)
+        return token, [event]
+
+    items = data["errors"]
+    if not isinstance(items, list) or not items:
+        raise InvalidPayload("errors: expected non-empty list")
+    if len(items) > MAX_BATCH_SIZE:
+        raise InvalidPayload(f"errors: batch is larger than {MAX_BATCH_SIZE} events")
+
+    shared_context = data.get("context")
+    if shared_context is not None and not isinstance(shared_context, dict):
+        raise InvalidPayload("context: expected object")
+
+    events = []
+    for index, item in enumerate(items):
+        item_token, event = _unwrap_event(item, index)
+        if item_token is not None:
+            if token is None:
+                token = item_token
+            elif item_token != token:
+                raise InvalidPayload("errors: events belong to different projects")
+        events.append(with_shared_context(event, shared_context))
+
+    return token, events
+
+
+def build_error_rows(
+    project_id: int,
+    events: List[Dict[str, Any]],
+    group_id: Optional[int] = None,
+    created_at: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Готовит строки error_logs для массовой вставки
+    """
+    created_at = created_at or datetime.now()
+    return [
+        {
+            "project_id": project_id,
+            "group_id": group_id,
+            "error_type": event.get("type") or "Unknown",
+            "error_message": event.get("message") or "No message provided",
+            "stack_trace": event.get("stack_trace"),
+            "severity_level": event.get("severity") or "error",
+            "additional_data": event.get("context") or {},
+            "created_at": created_at,
+        }
+        for event in events
+    ]
+
+
+def insert_error_rows(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Вставляет все строки одним executemany, без коммита
+    """
+    if rows:
+        db.execute(insert(ErrorLog), rows)
+
+
+def ingest_error_events(db: Session, project_id: int, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Записывает пакет ошибок с группировкой по отпечатку, без коммита.
+
+    Для каждой группы увеличивается счетчик появлений, а полные записи
+    сохраняются, пока их не больше ERROR_SAMPLE_LIMIT; счетчики статистики
+    (api.counters) увеличиваются в той же транзакции. Возвращает по одному
+    событию на каждую новую (или снова появившуюся решенную) группу -
+    только о них нужно уведомлять подписчиков; в событие добавляются
+    group_id и reopened (группа была отмечена решенной).
+
+    При гонке двух запросов за новую группу возможен IntegrityError;
+    вызывающий код должен откатить транзакцию и повторить пакет.
+    """
+    created_at = datetime.now()
+
+    events_by_fingerprint: Dict[str, List[Dict[str, Any]]] = {}
+    for event in events:
+        fingerprint = compute_fingerprint(event.get("type"), event.get("message"), event.get("stack_trace"))
+        events_by_fingerprint.setdefault(fingerprint, []).append(event)
+
+    groups = {
+        group.fingerprint: group
+        for group in db.query(ErrorGroup).filter(
+            ErrorGroup.project_id == project_id,
+            ErrorGroup.fingerprint.in_(list(events_by_fingerprint))
+        )
+    }
+
+    notify = []
+    samples = []
+    for fingerprint, group_events in events_by_fingerprint.items():
+        occurrences = sum(event.get("count") or 1 for event in group_events)
+        group = groups.get(fingerprint)
+
+        if group is None:
+            first = group_events[0]
+            group_samples = group_events[:ERROR_SAMPLE_LIMIT]
+            group = ErrorGroup(
+                project_id=project_id,
+                fingerprint=fingerprint,
+                error_type=first.get("type") or "Unknown",
+                message_template=normalize_message(first.get("message")),
+                severity_level=first.get("severity") or "error",
+                first_seen=created_at,
+                last_seen=created_at,
+                count=occurrences,
+                sample_count=len(group_samples)
+            )
+            db.add(group)
+            notify.append((group, first, False))
+        else:
+            if group.is_resolved:
+                # Регрессия: решенная ошибка появилась снова
+                group.is_resolved = False
+                notify.append((group, group_events[0], True))
+            group_samples = group_events[:max(0, ERROR_SAMPLE_LIMIT - group.sample_count)]
+            # Атомарные приращения, чтобы параллельные запросы не теряли появления
+            group.count = ErrorGroup.count + occurrences
+            group.sample_count = ErrorGroup.sample_count + len(group_samples)
+            group.last_seen = created_at
+
+        if group_samples:
+            samples.append((group, group_samples))
+
+    # Получаем id новых групп
+    db.flush()
+
+    rows = []
+    for group, group_samples in samples:
+        rows.extend(build_error_rows(project_id, group_samples, group_id=group.id, created_at=created_at))
+    insert_error_rows(db, rows)
+    add_error_counts(db, counter_rows(project_id, events, created_at))
+
+    return [{**event, "group_id": group.id, "reopened": reopened} for group, event, reopened in notify]
+
+
+def resolve_error_group(db: Session, group_id: int) -> Optional[ErrorGroup]:
+    """
+    Отмечает группу и ее сохраненные записи решенными, без коммита.
+    Следующее появление ошибки снова откроет группу и уведомит подписчиков
+    """
+    group = db.get(ErrorGroup, group_id)
+    if group is None:
+        return None
+    group.is_resolved = True
+    db.execute(
+        update(ErrorLog).where(ErrorLog.group_id == group_id).values(is_resolved=True)
+        .execution_options(synchronize_session=False)
+    )
+    return group
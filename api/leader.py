@@ -0,0 +1,175 @@
+"""
+Выбор ведущего процесса API для фоновых задач-одиночек.
+
+При запуске API в несколько процессов (API_WORKERS) прием ошибок и
+heartbeat идет в каждом процессе, а задачи, которые должны выполняться
+ровно один раз (проверка сроков heartbeat, свертка и очистка, архив,
+общие сводки уведомлений), запускает только процесс, арендовавший строку
+таблицы leases. Аренда продлевается каждые ttl/3 секунд; если процесс
+завис или упал, через ttl секунд строку забирает другой.
+
+Работает одинаково на SQLite и PostgreSQL: захват - один условный UPDATE,
+без advisory lock, который пришлось бы держать на отдельном соединении.
+Время аренды - UTC хоста; процессы на разных хостах должны синхронизировать часы.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from database.models import Lease
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд аренда переходит к другому процессу, если ее не продлили
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+
+Callback = Callable[[], Awaitable[None]]
+
+
+class LeaderLease:
+    """
+    Держит аренду name; on_elected вызывается при получении аренды,
+    on_demoted - при потере и при остановке
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        name: str = "api-background",
+        ttl: float = LEADER_LEASE_TTL,
+        on_elected: Optional[Callback] = None,
+        on_demoted: Optional[Callback] = None
+    ):
+        self.session_factory = session_factory
+        self.name = name
+        self.ttl = ttl
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._expires = 0.0  # Время event loop, до которого аренда точно наша
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.elections = 0
+        self.demotions = 0
+        self.failed_renewals = 0
+
+    async def try_acquire(self, now: Optional[datetime] = None) -> bool:
+        """
+        Продлевает свою аренду или забирает истекшую; True - аренда у этого процесса
+        """
+        now = now or datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl)
+        async with self.session_factory() as db:
+            acquired = (await db.execute(
+                update(Lease)
+                .where(Lease.name == self.name, or_(Lease.holder == self.holder, Lease.expires_at < now))
+                .values(holder=self.holder, expires_at=expires_at)
+                .execution_options(synchronize_session=False)
+            )).rowcount == 1
+            if not acquired and await db.get(Lease, self.name) is None:
+                # Первый запуск: строки еще нет, гонку вставок ловит первичный ключ
+                try:
+                    await db.execute(insert(Lease).values(name=self.name, holder=self.holder, expires_at=expires_at))
+                    acquired = True
+                except IntegrityError:
+                    await db.rollback()
+                    return False
+            await db.commit()
+        return acquired
+
+    async def release(self):
+        """
+        Отдает аренду, чтобы другой процесс не ждал ее истечения
+        """
+        async with self.session_factory() as db:
+            await db.execute(
+                update(Lease)
+                .where(Lease.name == self.name, Lease.holder == self.holder)
+                .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _elected(self):
+        self.is_leader = True
+        self.elections += 1
+        logger.info(f"Process {self.holder} holds lease {self.name}, starting background jobs")
+        if self.on_elected:
+            await self.on_elected()
+
+    async def _demoted(self):
+        self.is_leader = False
+        self.demotions += 1
+        logger.info(f"Process {self.holder} lost lease {self.name}, stopping background jobs")
+        if self.on_demoted:
+            await self.on_demoted()
+
+    async def step(self):
+        """
+        Одна попытка захвата или продления
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            acquired = await self.try_acquire()
+        except Exception:
+            self.failed_renewals += 1
+            logger.exception(f"Failed to renew lease {self.name}")
+            # БД недоступна: держим задачи, пока аренда не могла перейти к другому
+            acquired = self.is_leader and loop.time() + self.ttl / 3 < self._expires
+        else:
+            if acquired:
+                self._expires = started + self.ttl
+
+        if acquired and not self.is_leader:
+            await self._elected()
+        elif not acquired and self.is_leader:
+            await self._demoted()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.step()
+            except Exception:
+                logger.exception(f"Error while switching background jobs for lease {self.name}")
+
+    async def start(self):
+        """
+        Первая попытка захвата сразу: один процесс API получает задачи уже при запуске
+        """
+        try:
+            await self.step()
+        except Exception:
+            logger.exception(f"Error while switching background jobs for lease {self.name}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._demoted()
+            try:
+                await self.release()
+            except Exception:
+                logger.exception(f"Failed to release lease {self.name}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "elections": self.elections,
+            "demotions": self.demotions,
+            "failed_renewals": self.failed_renewals,
+        }
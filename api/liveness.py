@@ -0,0 +1,274 @@
+"""
+Состояние heartbeat проектов в памяти API.
+
+Почти каждый heartbeat означает "все еще работает": такой сигнал только
+обновляет время в памяти. Время последнего сигнала и часовые сводки
+записываются в БД пакетно раз в flush_interval секунд, а запись Heartbeat
+и уведомление подписчиков нужны лишь при смене состояния: проект снова
+на связи, сменилась версия или статус.
+
+В нескольких процессах API (API_WORKERS) у каждого свое состояние в
+памяти. Замеченная смена сверяется с БД: если ее уже записал другой
+процесс, подписчики не получат то же уведомление еще раз. После каждой
+записи процесс перечитывает last_heartbeat своих проектов: перерывы в
+часовых сводках считаются от последнего сигнала, принятого любым
+процессом, а не только этим (с опозданием до двух flush_interval).
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.retention import HEARTBEAT_GAP_SECONDS, add_beat, floor_hour, merge_hourly_rollups, merge_summary, new_summary
+from database.models import Heartbeat, Project
+
+logger = logging.getLogger(__name__)
+
+
+class ProjectLiveness:
+    __slots__ = ("last_seen", "status", "version", "dead")
+
+    def __init__(self, last_seen: Optional[datetime], status: Optional[str], version: Optional[str]):
+        self.last_seen = last_seen
+        self.status = status
+        self.version = version
+        self.dead = False
+
+
+class LivenessTracker:
+    """
+    Последний heartbeat, статус и версия каждого проекта.
+
+    beat возвращает список изменений состояния (пустой - ничего не изменилось).
+    Проект считается упавшим, если молчал дольше dead_after секунд
+    или проверка активности отметила его через mark_dead.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        dead_after: float = 3600.0,
+        flush_interval: float = 10.0,
+        gap_seconds: int = HEARTBEAT_GAP_SECONDS,
+        rollups: bool = True,
+        shared: bool = False
+    ):
+        self.session_factory = session_factory
+        self.dead_after = dead_after
+        self.flush_interval = flush_interval
+        self.gap_seconds = gap_seconds
+        # False - часовые сводки строит HeartbeatCompactor из сырых записей
+        self.rollups = rollups
+        # True - heartbeat проектов принимают и другие процессы API
+        self.shared = shared
+        self._task: Optional[asyncio.Task] = None
+
+        self._states: Dict[int, ProjectLiveness] = {}
+        self._dirty: Dict[int, datetime] = {}
+        self._hours: Dict[Tuple[int, datetime], Dict[str, Any]] = {}
+
+        # Метрики
+        self.beats = 0
+        self.transitions = 0
+        self.loads = 0
+        self.flushes = 0
+        self.flushed_projects = 0
+        self.failed_flushes = 0
+        self.synced_projects = 0
+
+    async def _load(self, db: AsyncSession, project_id: int) -> ProjectLiveness:
+        """
+        Состояние проекта из БД при первом heartbeat после запуска API
+        """
+        self.loads += 1
+        last_heartbeat = await db.scalar(select(Project.last_heartbeat).where(Project.id == project_id))
+        last = (await db.execute(
+            select(Heartbeat.status, Heartbeat.version)
+            .where(Heartbeat.project_id == project_id)
+            .order_by(Heartbeat.created_at.desc())
+            .limit(1)
+        )).first()
+        return ProjectLiveness(last_heartbeat, last.status if last else None, last.version if last else None)
+
+    async def beat(self, db: AsyncSession, project_id: int, status: str, version: Optional[str],
+                   now: Optional[datetime] = None, dead_after: Optional[float] = None) -> List[str]:
+        """
+        Учитывает heartbeat и возвращает описания изменений состояния;
+        dead_after - таймаут проекта, если он отличается от общего
+        """
+        now = now or datetime.utcnow()
+        dead_after = dead_after or self.dead_after
+        state = self._states.get(project_id)
+        fresh = False
+        if state is None:
+            loaded = await self._load(db, project_id)
+            # Пока шел запрос к БД, состояние мог создать параллельный heartbeat
+            state = self._states.setdefault(project_id, loaded)
+            fresh = state is loaded
+
+        changes = []
+        if state.dead or state.last_seen is None or (now - state.last_seen).total_seconds() > dead_after:
+            changes.append(("back", "Проект снова на связи" if state.last_seen else "Первый heartbeat проекта"))
+        if version and state.version and version != state.version:
+            changes.append(("version", f"Новая версия: {state.version} → {version}"))
+        if state.status and status != state.status:
+            changes.append(("status", f"Статус: {state.status} → {status}"))
+
+        if self.rollups:
+            hour = floor_hour(now)
+            summary = self._hours.get((project_id, hour))
+            if summary is None:
+                summary = self._hours[(project_id, hour)] = new_summary(project_id, "hour", hour)
+            add_beat(summary, now, version, status, state.last_seen, self.gap_seconds)
+
+        state.last_seen = now
+        state.status = status
+        state.version = version or state.version
+        state.dead = False
+        self._dirty[project_id] = now
+
+        if changes and not fresh:
+            # Состояние уже обновлено, параллельный heartbeat этого процесса смену не увидит
+            changes = await self._unrecorded(db, project_id, changes, status, version, now, dead_after)
+
+        self.beats += 1
+        if changes:
+            self.transitions += 1
+        return [text for _, text in changes]
+
+    async def _unrecorded(self, db: AsyncSession, project_id: int, changes: List[Tuple[str, str]], status: str,
+                          version: Optional[str], now: datetime, dead_after: float) -> List[Tuple[str, str]]:
+        """
+        Смены состояния, которых еще нет в БД: остальные уже записал другой процесс API
+        """
+        recorded = await self._load(db, project_id)
+        unrecorded = []
+        for kind, text in changes:
+            if kind == "back" and recorded.last_seen and (now - recorded.last_seen).total_seconds() <= dead_after:
+                continue
+            if kind == "version" and recorded.version == version:
+                continue
+            if kind == "status" and recorded.status == status:
+                continue
+            unrecorded.append((kind, text))
+        return unrecorded
+
+    def last_seen(self, project_id: int) -> Optional[datetime]:
+        state = self._states.get(project_id)
+        return state.last_seen if state else None
+
+    def mark_dead(self, project_id: int):
+        """
+        Следующий heartbeat проекта будет считаться возвращением на связь
+        """
+        state = self._states.get(project_id)
+        if state is not None:
+            state.dead = True
+
+    def forget(self, project_id: int):
+        """
+        Сбрасывает состояние проекта (например, после удаления проекта)
+        """
+        self._states.pop(project_id, None)
+        self._dirty.pop(project_id, None)
+        for key in [key for key in self._hours if key[0] == project_id]:
+            del self._hours[key]
+
+    async def flush(self):
+        """
+        Записывает last_heartbeat и часовые сводки накопленных проектов одной транзакцией
+        """
+        dirty, self._dirty = self._dirty, {}
+        hours, self._hours = self._hours, {}
+        if not dirty and not hours:
+            return
+
+        try:
+            async with self.session_factory() as db:
+                if dirty:
+                    # Один executemany UPDATE; удаленные тем временем проекты просто не совпадут.
+                    # Время не уменьшается: более поздний heartbeat мог записать другой процесс
+                    projects = Project.__table__
+                    await db.execute(
+                        update(projects)
+                        .where(projects.c.id == bindparam("project_id"))
+                        .values(last_heartbeat=case(
+                            (or_(projects.c.last_heartbeat == None, projects.c.last_heartbeat < bindparam("seen")),
+                             bindparam("seen")),
+                            else_=projects.c.last_heartbeat
+                        )),
+                        [{"project_id": project_id, "seen": seen} for project_id, seen in dirty.items()]
+                    )
+                if hours:
+                    await db.run_sync(merge_hourly_rollups, list(hours.values()))
+                await db.commit()
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception(f"Failed to flush heartbeat state of {len(dirty)} projects")
+            # Возвращаем несохраненное, чтобы записать при следующей попытке
+            for project_id, seen in dirty.items():
+                if self._dirty.get(project_id, seen) <= seen:
+                    self._dirty[project_id] = seen
+            for key, summary in hours.items():
+                if key in self._hours:
+                    merge_summary(summary, self._hours[key])
+                self._hours[key] = summary
+            return
+
+        self.flushes += 1
+        self.flushed_projects += len(dirty)
+
+    async def sync(self):
+        """
+        Подтягивает last_heartbeat, записанные другими процессами API
+        """
+        project_ids = list(self._states)
+        if not project_ids:
+            return
+        try:
+            async with self.session_factory() as db:
+                # Порциями, чтобы не упереться в лимит параметров запроса SQLite
+                for i in range(0, len(project_ids), 500):
+                    rows = (await db.execute(
+                        select(Project.id, Project.last_heartbeat).where(Project.id.in_(project_ids[i:i + 500]))
+                    )).all()
+                    for project_id, last_heartbeat in rows:
+                        state = self._states.get(project_id)
+                        if state and last_heartbeat and (state.last_seen is None or last_heartbeat > state.last_seen):
+                            state.last_seen = last_heartbeat
+                            self.synced_projects += 1
+        except Exception:
+            logger.exception("Failed to sync heartbeat state from the database")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if self.shared:
+                await self.sync()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "projects": len(self._states),
+            "pending": len(self._dirty),
+            "beats": self.beats,
+            "transitions": self.transitions,
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "flushed_projects": self.flushed_projects,
+            "failed_flushes": self.failed_flushes,
+            "synced_projects": self.synced_projects,
+        }
@@ -1,88 +1,297 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Dict, Any
+from fastapi import FastAPI, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
-import json
+import hmac
 import logging
-import asyncio
+import os
 from aiogram import Bot
 
-from database.database import get_db
-from database.models import Project, ErrorLog, Heartbeat, Subscriber
+from database.database import AsyncSessionLocal, SessionLocal, get_async_db
+from database.models import Project, Heartbeat
+from api.ingest import MAX_BATCH_SIZE, InvalidPayload, parse_error_payload, ingest_error_events
+from api.notifications import ErrorDigest, FakeBot, NotificationQueue, SharedErrorDigest
+from api.cache import CachedProject, ProjectTokenCache, SharedInvalidations, SubscriberCache
+from api.write_buffer import IngestBuffer
+from api.retention import HeartbeatCompactor
+from api.archive import ErrorArchiver
+from api.leader import LeaderLease
+from api.liveness import LivenessTracker
+from api.deadlines import DeadlineScheduler
+from api.counters import count_errors, summarize_counts
+from api.search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, InvalidSearchQuery, render_highlight, search_errors
+from api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, list_errors
+from api.codec import MAX_DECOMPRESSED_BYTES, DecodeError, RequestDecompressionMiddleware, decode_payload
+from api.streaming import STREAM_ERROR_DETAILS, StreamResult, parse_stream_header, parse_stream_lines, read_ndjson_stream
 
 # Настройка логирования
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
+# aiosqlite пишет в DEBUG каждую операцию с соединением
+logging.getLogger("aiosqlite").setLevel(logging.INFO)
+
+# Число процессов uvicorn (run_api.py). Каждый процесс принимает запросы,
+# фоновые задачи-одиночки выполняет только ведущий (api.leader)
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
 
 # Конфигурация бота для уведомлений
 NOTIFICATION_BOT_TOKEN = "7766927049:AAHajpHBYK6-rHMp1sSyGW6AAirAZWH4oIE"
-notification_bot = Bot(token=NOTIFICATION_BOT_TOKEN)
+if os.getenv("NOTIFICATION_BOT_FAKE"):
+    # Офлайн-режим: сообщения только пишутся в лог
+    notification_bot = FakeBot()
+else:
+    notification_bot = Bot(token=NOTIFICATION_BOT_TOKEN)
+
+# Уведомления отправляются фоновыми воркерами, а не в обработчике запроса.
+# Лимиты Telegram общие на бота, а очередь своя в каждом процессе: делим их поровну
+notification_queue = NotificationQueue(
+    notification_bot,
+    workers=int(os.getenv("NOTIFICATION_WORKERS", "4")),
+    maxsize=int(os.getenv("NOTIFICATION_QUEUE_SIZE", "10000")),
+    global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")) / API_WORKERS,
+    chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")) / API_WORKERS,
+    chat_burst=max(1.0, 3.0 / API_WORKERS),
+    chat_backlog=int(os.getenv("NOTIFICATION_CHAT_BACKLOG", "100"))
+)
+
+# При шторме ошибок уведомления сверх порога сворачиваются в сводку.
+# В нескольких процессах окно общее (в БД), иначе порог умножился бы на число процессов
+if API_WORKERS > 1:
+    error_digest = SharedErrorDigest(
+        notification_queue,
+        AsyncSessionLocal,
+        threshold=int(os.getenv("NOTIFICATION_DIGEST_THRESHOLD", "5")),
+        interval=float(os.getenv("NOTIFICATION_DIGEST_INTERVAL", "60"))
+    )
+else:
+    error_digest = ErrorDigest(
+        notification_queue,
+        threshold=int(os.getenv("NOTIFICATION_DIGEST_THRESHOLD", "5")),
+        interval=float(os.getenv("NOTIFICATION_DIGEST_INTERVAL", "60"))
+    )
+
+# Кэш token -> проект; бот сбрасывает его при изменении проектов
+project_cache = ProjectTokenCache(
+    maxsize=int(os.getenv("PROJECT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PROJECT_CACHE_TTL", "60")),
+    negative_ttl=float(os.getenv("PROJECT_CACHE_NEGATIVE_TTL", "30"))
+)
+
+# Кэш project_id -> telegram_id подписчиков
+subscriber_cache = SubscriberCache(
+    maxsize=int(os.getenv("SUBSCRIBER_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("SUBSCRIBER_CACHE_TTL", "60"))
+)
+
+# Какие heartbeat записывать в БД: transitions - только смены состояния
+# (часовые сводки ведутся в памяти), all - каждый сигнал
+HEARTBEAT_STORE = os.getenv("HEARTBEAT_STORE", "transitions")
+
+# Сколько секунд проект может молчать до уведомления (если у проекта не задан свой таймаут)
+HEARTBEAT_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT", "3600"))
+
+# Состояние проектов в памяти: last_heartbeat пишется пакетно, уведомления - только при смене состояния
+liveness_tracker = LivenessTracker(
+    AsyncSessionLocal,
+    dead_after=HEARTBEAT_TIMEOUT,
+    flush_interval=float(os.getenv("HEARTBEAT_FLUSH_INTERVAL", "10")),
+    rollups=HEARTBEAT_STORE != "all",
+    shared=API_WORKERS > 1
+)
+
+# Свертка heartbeat в часовые и суточные сводки и удаление старых записей
+heartbeat_compactor = HeartbeatCompactor(
+    AsyncSessionLocal,
+    interval=float(os.getenv("HEARTBEAT_COMPACTION_INTERVAL", "3600")),
+    chunk_size=int(os.getenv("HEARTBEAT_DELETE_CHUNK", "5000")),
+    rollup_raw=HEARTBEAT_STORE == "all"
+)
+
+# Перенос старых месяцев error_logs в холодный архив (включается ERROR_ARCHIVE_AFTER_MONTHS)
+error_archiver = ErrorArchiver(
+    SessionLocal,
+    interval=float(os.getenv("ERROR_ARCHIVE_INTERVAL", "86400"))
+)
+
+# Режим приема ошибок: direct - коммит в каждом запросе,
+# buffered - запись из буфера в памяти одной транзакцией на пакет (ответ 202)
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
 
 app = FastAPI(title="Error Monitor API")
+# Пакеты от SDK приходят сжатыми gzip
+app.add_middleware(
+    RequestDecompressionMiddleware,
+    max_size=int(os.getenv("MAX_DECOMPRESSED_BODY_BYTES", str(MAX_DECOMPRESSED_BYTES))),
+    # Потоковое тело читается по мере поступления, целиком его не распаковать
+    streaming_paths=("/api/v1/log/stream",)
+)
+
+def format_duration(seconds: float) -> str:
+    if seconds % 3600 == 0:
+        return f"{int(seconds // 3600)} ч"
+    if seconds % 60 == 0:
+        return f"{int(seconds // 60)} мин"
+    return f"{int(seconds)} с"
 
-async def check_projects_status():
+async def handle_missed_heartbeat(project_id: int, deadline: datetime) -> Optional[datetime]:
     """
-    Фоновая задача для проверки состояния проектов
+    Срок heartbeat проекта истек: уведомляет подписчиков один раз до возвращения проекта
     """
-    while True:
-        try:
-            db = next(get_db())
-            try:
-                # Проверяем проекты, от которых не было heartbeat более часа
-                one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-                inactive_projects = db.query(Project).filter(
-                    Project.is_active == True,
-                    (Project.last_heartbeat < one_hour_ago) | (Project.last_heartbeat == None)
-                ).all()
-
-                for project in inactive_projects:
-                    logger.warning(f"Project {project.name} hasn't sent heartbeat in the last hour!")
-                    
-                    # Получаем подписчиков проекта
-                    subscribers = db.query(Subscriber).filter(
-                        Subscriber.subscribed_projects.contains([project.id])
-                    ).all()
-                    
-                    # Отправляем уведомления через бота
-                    for subscriber in subscribers:
-                        try:
-                            message = (
-                                f"❌ <b>Внимание! Проект не отвечает</b>\n\n"
-                                f"📝 Проект: <b>{project.name}</b>\n"
-                                f"🏷️ Тип: <b>{project.type}</b>\n"
-                                f"⚠️ Статус: <b>Нет активности более часа</b>\n"
-                                f"⏰ Последняя активность: <b>{project.last_heartbeat.strftime('%d-%m-%Y %H:%M:%S') if project.last_heartbeat else 'Никогда'}</b>"
-                            )
-                            
-                            await notification_bot.send_message(
-                                chat_id=subscriber.telegram_id,
-                                text=message,
-                                parse_mode="HTML"
-                            )
-                            logger.info(f"Sent inactive project notification to subscriber {subscriber.telegram_id}")
-                        except Exception as e:
-                            logger.error(f"Failed to send notification to subscriber {subscriber.telegram_id}: {e}")
-
-            finally:
-                db.close()
-        except Exception as e:
-            logger.exception("Error in check_projects_status")
-        
-        await asyncio.sleep(3600)  # Проверяем каждый час
+    async with AsyncSessionLocal() as db:
+        project = await db.get(Project, project_id)
+        if not project or not project.is_active:
+            return None
+
+        # Heartbeat мог прийти в другой процесс API и попасть в БД
+        timeout = heartbeat_deadlines.timeout(project_id)
+        seen = [t for t in (project.last_heartbeat, liveness_tracker.last_seen(project_id)) if t]
+        last_seen = max(seen) if seen else None
+        if last_seen and last_seen + timedelta(seconds=timeout) > datetime.utcnow():
+            return last_seen + timedelta(seconds=timeout)
+
+        # Об этом пропуске мог уже уведомить прежний ведущий процесс (перезапуск, смена ведущего)
+        silent_since = last_seen or project.created_at or datetime.min
+        claimed = (await db.execute(
+            update(Project)
+            .where(Project.id == project_id,
+                   or_(Project.heartbeat_alerted_at == None, Project.heartbeat_alerted_at < silent_since))
+            .values(heartbeat_alerted_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )).rowcount
+        await db.commit()
+        if not claimed:
+            liveness_tracker.mark_dead(project.id)
+            return None
+
+        logger.warning(f"Project {project.name} missed its heartbeat deadline {deadline}")
+        chat_ids = await subscriber_cache.chat_ids(db, project.id)
+
+    message = (
+        f"❌ <b>Внимание! Проект не отвечает</b>\n\n"
+        f"📝 Проект: <b>{project.name}</b>\n"
+        f"🏷️ Тип: <b>{project.type}</b>\n"
+        f"⚠️ Статус: <b>Нет активности более {format_duration(timeout)}</b>\n"
+        f"⏰ Последняя активность: <b>{last_seen.strftime('%d-%m-%Y %H:%M:%S') if last_seen else 'Никогда'}</b>"
+    )
+
+    # Ставим уведомления в очередь отправки
+    notification_queue.notify(chat_ids, message)
+    # Следующий heartbeat проекта - возвращение на связь
+    liveness_tracker.mark_dead(project.id)
+    return None
+
+# Сроки heartbeat всех проектов в одной куче вместо ежечасного просмотра таблицы
+async def sync_heartbeat_deadlines():
+    """
+    Сверяет сроки с БД: heartbeat, принятые другими процессами API, новые,
+    отключенные и удаленные проекты, измененные таймауты
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Project.id, Project.last_heartbeat, Project.created_at, Project.heartbeat_timeout)
+            .where(Project.is_active == True)
+        )).all()
+
+    active = set()
+    for row in rows:
+        active.add(row.id)
+        previous_timeout = heartbeat_deadlines.timeout(row.id)
+        heartbeat_deadlines.set_timeout(row.id, row.heartbeat_timeout)
+        timeout = heartbeat_deadlines.timeout(row.id)
+        seen = [t for t in (row.last_heartbeat, liveness_tracker.last_seen(row.id)) if t]
+        deadline = (max(seen) if seen else row.created_at or now) + timedelta(seconds=timeout)
+        current = heartbeat_deadlines.deadline(row.id)
+        if current is None:
+            # Срок прошел и об этом уже уведомили: ждем возвращения проекта
+            if deadline > now:
+                heartbeat_deadlines.schedule(row.id, deadline)
+        elif deadline > current or timeout != previous_timeout:
+            heartbeat_deadlines.schedule(row.id, deadline)
+
+    for project_id in heartbeat_deadlines.project_ids() - active:
+        heartbeat_deadlines.remove(project_id)
+
+# Сроки heartbeat всех проектов в одной куче вместо ежечасного просмотра таблицы.
+# В нескольких процессах heartbeat приходят в разные процессы, и ведущий сверяет сроки с БД
+heartbeat_deadlines = DeadlineScheduler(
+    handle_missed_heartbeat,
+    default_timeout=HEARTBEAT_TIMEOUT,
+    sync=sync_heartbeat_deadlines if API_WORKERS > 1 else None,
+    sync_interval=float(os.getenv("HEARTBEAT_DEADLINE_SYNC_INTERVAL", "30"))
+)
+
+async def load_heartbeat_deadlines():
+    """
+    Сроки heartbeat активных проектов при запуске: последний сигнал плюс таймаут
+    """
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Project.id, Project.last_heartbeat, Project.heartbeat_timeout).where(Project.is_active == True)
+        )
+        for row in result:
+            heartbeat_deadlines.set_timeout(row.id, row.heartbeat_timeout)
+            heartbeat_deadlines.touch(row.id, row.last_heartbeat or now)
+
+async def reload_heartbeat_deadline(project_id: int):
+    """
+    Обновляет срок проекта после его изменения в боте (создание, статус, таймаут, удаление)
+    """
+    async with AsyncSessionLocal() as db:
+        project = await db.get(Project, project_id)
+    if not project or not project.is_active:
+        heartbeat_deadlines.remove(project_id)
+        liveness_tracker.forget(project_id)
+        return
+    heartbeat_deadlines.set_timeout(project_id, project.heartbeat_timeout)
+    seen = [t for t in (project.last_heartbeat, liveness_tracker.last_seen(project_id)) if t]
+    heartbeat_deadlines.touch(project_id, max(seen) if seen else datetime.utcnow())
+
+async def apply_cache_invalidation(tokens: List[str], project_ids: List[int]):
+    """
+    Сбрасывает кэши этого процесса после изменения проектов или подписок в боте
+    """
+    for token in tokens:
+        project_cache.invalidate(token)
+    for project_id in project_ids:
+        subscriber_cache.invalidate(project_id)
+        await reload_heartbeat_deadline(project_id)
+
+# Сбросы от бота для остальных процессов API (при API_WORKERS > 1)
+cache_invalidations = SharedInvalidations(
+    AsyncSessionLocal,
+    apply_cache_invalidation,
+    interval=float(os.getenv("CACHE_INVALIDATION_POLL_INTERVAL", "1"))
+)
+
+async def read_payload(request: Request) -> Dict[Any, Any]:
+    """
+    Тело запроса приема: JSON или msgpack (сжатие уже снято middleware)
+    """
+    try:
+        data = decode_payload(await request.body(), request.headers.get("content-type"))
+    except DecodeError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="expected object")
+    return data
 
 @app.post("/api/v1/heartbeat")
-async def heartbeat(data: Dict[Any, Any], db: Session = Depends(get_db)):
+async def heartbeat(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Принимает сигналы heartbeat от проектов
     """
+    data = await read_payload(request)
     try:
         logger.debug(f"Received heartbeat data: {data}")
         
         # Проверяем токен проекта
-        project = db.query(Project).filter(
-            Project.token == data.get("project_token"),
-            Project.is_active == True
-        ).first()
+        project = await project_cache.lookup(db, data.get("project_token"))
         
         logger.debug(f"Found project: {project}")
         
@@ -90,155 +299,568 @@ async def heartbeat(data: Dict[Any, Any], db: Session = Depends(get_db)):
             logger.warning(f"Invalid project token: {data.get('project_token')}")
             raise HTTPException(status_code=401, detail="Invalid project token")
 
-        # Обновляем время последнего heartbeat
         current_time = datetime.utcnow()
-        project.last_heartbeat = current_time
+        status = data.get("status", "alive")
+        changes = await liveness_tracker.beat(
+            db, project.id, status, data.get("version"), current_time,
+            dead_after=heartbeat_deadlines.timeout(project.id)
+        )
+        heartbeat_deadlines.touch(project.id, current_time)
+
+        # Обычный "все еще работает": время уже учтено в памяти, в БД попадет пакетом
+        if not changes and HEARTBEAT_STORE != "all":
+            return {"status": "success", "message": "Heartbeat received"}
 
         # Создаем запись о heartbeat
         heartbeat = Heartbeat(
             project_id=project.id,
-            status=data.get("status", "alive"),
+            status=status,
             version=data.get("version"),
             additional_data=data.get("additional_data", {}),
             created_at=current_time
         )
         
         db.add(heartbeat)
-        db.commit()
+        if changes:
+            # Смена состояния сразу видна проверке активности, не дожидаясь пакетной записи
+            await db.execute(
+                update(Project).where(Project.id == project.id).values(last_heartbeat=current_time)
+            )
+        await db.commit()
+
+        if not changes:
+            return {"status": "success", "message": "Heartbeat received"}
 
         # Получаем подписчиков проекта для уведомления
-        subscribers = db.query(Subscriber).filter(
-            Subscriber.subscribed_projects.contains([project.id])
-        ).all()
-
-        # Отправляем уведомление о работающем проекте
-        for subscriber in subscribers:
-            try:
-                message = (
-                    f"✅ <b>Проект активен</b>\n\n"
-                    f"📝 Проект: <b>{project.name}</b>\n"
-                    f"🏷️ Тип: <b>{project.type}</b>\n"
-                    f"📊 Статус: <b>{data.get('status', 'alive')}</b>\n"
-                    f"🔄 Версия: <b>{data.get('version', 'N/A')}</b>\n"
-                    f"⏰ Время: <b>{current_time.strftime('%d-%m-%Y %H:%M:%S')}</b>"
-                )
-                
-                if data.get("metadata"):
-                    message += "\n\n📋 Дополнительная информация:"
-                    for key, value in data["metadata"].items():
-                        message += f"\n• {key}: <b>{value}</b>"
-                
-                await notification_bot.send_message(
-                    chat_id=subscriber.telegram_id,
-                    text=message,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"Error sending notification to subscriber {subscriber.telegram_id}: {e}")
+        chat_ids = await subscriber_cache.chat_ids(db, project.id)
+
+        # Уведомляем о смене состояния проекта
+        message = (
+            f"✅ <b>Проект активен</b>\n\n"
+            f"📝 Проект: <b>{project.name}</b>\n"
+            f"🏷️ Тип: <b>{project.type}</b>\n"
+            f"📊 Статус: <b>{status}</b>\n"
+            f"🔄 Версия: <b>{data.get('version', 'N/A')}</b>\n"
+            f"⏰ Время: <b>{current_time.strftime('%d-%m-%Y %H:%M:%S')}</b>\n\n"
+            + "\n".join(f"• {change}" for change in changes)
+        )
+        
+        if data.get("metadata"):
+            message += "\n\n📋 Дополнительная информация:"
+            for key, value in data["metadata"].items():
+                message += f"\n• {key}: <b>{value}</b>"
+
+        notification_queue.notify(chat_ids, message)
 
         return {"status": "success", "message": "Heartbeat received"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error in heartbeat endpoint")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+async def start_singleton_jobs():
+    """
+    Задачи, которые должны выполняться в одном процессе API: этот процесс стал ведущим
+    """
+    heartbeat_compactor.start()
+    error_archiver.start()
+    if error_digest.shared:
+        error_digest.start()
+    await load_heartbeat_deadlines()
+    heartbeat_deadlines.start()
+
+async def stop_singleton_jobs():
+    await heartbeat_deadlines.stop()
+    await heartbeat_compactor.stop()
+    await error_archiver.stop()
+    if error_digest.shared:
+        await error_digest.stop()
+
+# Аренда строки leases: ведущий процесс запускает задачи-одиночки
+leader = LeaderLease(AsyncSessionLocal, on_elected=start_singleton_jobs, on_demoted=stop_singleton_jobs)
+
 @app.on_event("startup")
 async def startup_event():
     """
     Запускаем фоновые задачи при старте приложения
     """
-    asyncio.create_task(check_projects_status())
+    await notification_queue.start()
+    if not error_digest.shared:
+        error_digest.start()
+    if INGEST_MODE == "buffered":
+        ingest_buffer.start()
+    liveness_tracker.start()
+    if API_WORKERS > 1:
+        cache_invalidations.start()
+    await leader.start()
 
-async def send_notification(telegram_id: int, message: str):
+@app.on_event("shutdown")
+async def shutdown_event():
     """
-    Отправляет уведомление пользователю через Telegram бота
+    Дописываем буфер ошибок, досылаем сводки и уведомления из очереди перед остановкой
     """
-    try:
-        await notification_bot.send_message(
-            chat_id=telegram_id,
-            text=message,
-            parse_mode="HTML"
-        )
-    except Exception as e:
-        logger.error(f"Failed to send notification to {telegram_id}: {e}")
+    await leader.stop()
+    await cache_invalidations.stop()
+    await liveness_tracker.stop()
+    await ingest_buffer.stop()
+    if not error_digest.shared:
+        await error_digest.stop()
+    await notification_queue.stop()
 
-async def notify_subscribers_about_error(db: Session, project: Project, error_data: Dict):
+def send_notification(telegram_id: int, message: str):
+    """
+    Ставит уведомление пользователю в очередь отправки через Telegram бота
+    """
+    notification_queue.enqueue(telegram_id, message)
+
+async def notify_subscribers_about_error(db: AsyncSession, project: CachedProject, error_data: Dict):
     """
     Уведомляет всех подписчиков проекта о новой ошибке
     """
-    subscribers = db.query(Subscriber).filter(
-        Subscriber.subscribed_projects.contains([project.id])
-    ).all()
+    chat_ids = await subscriber_cache.chat_ids(db, project.id, error_data.get('severity', 'error'))
+    if not chat_ids:
+        return
     
+    title = "🔁 <b>Решенная ошибка появилась снова" if error_data.get("reopened") else "🚨 <b>Новая ошибка"
     error_message = (
-        f"🚨 <b>Новая ошибка в проекте {project.name}</b>\n\n"
+        f"{title} в проекте {project.name}</b>\n\n"
         f"Тип: {error_data.get('type', 'Unknown')}\n"
         f"Сообщение: {error_data.get('message', 'No message')}\n"
         f"Важность: {error_data.get('severity', 'error')}\n"
         f"Время: {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}"
     )
+    if error_data.get("group_id"):
+        error_message += f"\nГруппа: #{error_data['group_id']} (/resolve {error_data['group_id']} - отметить решенной)"
     
-    for subscriber in subscribers:
-        await send_notification(subscriber.telegram_id, error_message)
+    await error_digest.alert(chat_ids, project.id, project.name, error_data.get('type', 'Unknown'), error_message)
+
+async def write_error_batch(db: AsyncSession, batch: List[Tuple[CachedProject, List[Dict]]]):
+    """
+    Записывает события нескольких проектов одним коммитом
+    и уведомляет подписчиков о новых группах ошибок
+    """
+    # События одного проекта из разных запросов группируются вместе
+    projects: Dict[int, CachedProject] = {}
+    events_by_project: Dict[int, List[Dict]] = {}
+    for project, events in batch:
+        projects[project.id] = project
+        events_by_project.setdefault(project.id, []).extend(events)
+
+    async def ingest():
+        new_groups = {}
+        for project_id, events in events_by_project.items():
+            new_groups[project_id] = await db.run_sync(ingest_error_events, project_id, events)
+        await db.commit()
+        return new_groups
+
+    try:
+        new_groups = await ingest()
+    except IntegrityError:
+        # Параллельный запрос успел создать ту же группу - повторяем пакет
+        await db.rollback()
+        new_groups = await ingest()
+
+    # Уведомляем подписчиков только о новых группах ошибок. Пакет уже записан:
+    # сбой уведомления не должен приводить к повтору записи (и дублям ошибок)
+    try:
+        for project_id, groups in new_groups.items():
+            for error_data in groups:
+                await notify_subscribers_about_error(db, projects[project_id], error_data)
+    except Exception:
+        logger.exception("Failed to notify subscribers about new error groups")
+
+async def flush_ingest_buffer(batch: List[Tuple[CachedProject, List[Dict]]]):
+    async with AsyncSessionLocal() as db:
+        await write_error_batch(db, batch)
+
+ingest_buffer = IngestBuffer(
+    flush_ingest_buffer,
+    flush_interval=float(os.getenv("INGEST_FLUSH_INTERVAL_MS", "50")) / 1000,
+    flush_max_events=int(os.getenv("INGEST_FLUSH_MAX_EVENTS", "1000")),
+    max_events=int(os.getenv("INGEST_BUFFER_MAX_EVENTS", "100000")),
+    max_retries=int(os.getenv("INGEST_FLUSH_MAX_RETRIES", "5"))
+)
 
 @app.post("/api/v1/log")
-async def log_error(data: Dict[Any, Any], db: Session = Depends(get_db)):
+async def log_error(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
-    Принимает логи ошибок от проектов
+    Принимает логи ошибок от проектов: одну ошибку или пакет {"errors": [...]}
     """
+    data = await read_payload(request)
     try:
-        # Проверяем токен проекта
-        project = db.query(Project).filter(
-            Project.token == data.get("project_token"),
-            Project.is_active == True
-        ).first()
+        project_token, events = parse_error_payload(data)
+    except InvalidPayload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Проверяем токен проекта один раз на весь пакет
+        project = await project_cache.lookup(db, project_token)
         
         if not project:
             raise HTTPException(status_code=401, detail="Invalid project token")
 
-        error_data = data.get("error", {})
-        
-        # Создаем запись об ошибке
-        error_log = ErrorLog(
-            project_id=project.id,
-            error_type=error_data.get("type", "Unknown"),
-            error_message=error_data.get("message", "No message provided"),
-            stack_trace=error_data.get("stack_trace"),
-            severity_level=error_data.get("severity", "error"),
-            additional_data=error_data.get("context", {}),
-            created_at=datetime.now()
-        )
-        
-        db.add(error_log)
-        db.commit()
+        if INGEST_MODE == "buffered":
+            # Запись и уведомления выполнит фоновый писатель
+            if not ingest_buffer.submit(project, events):
+                raise HTTPException(status_code=503, detail="Ingest buffer is full, retry later")
+            return JSONResponse(
+                status_code=202,
+                content={"status": "accepted", "message": "Error queued for logging", "accepted": len(events)}
+            )
 
-        # Отправляем уведомления подписчикам
-        await notify_subscribers_about_error(db, project, error_data)
+        # Записываем пакет одним коммитом: счетчики групп и ограниченное число полных записей
+        await write_error_batch(db, [(project, events)])
 
-        return {"status": "success", "message": "Error logged successfully"}
+        return {"status": "success", "message": "Error logged successfully", "accepted": len(events)}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        logger.exception("Error in log endpoint")
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Счетчики потокового приема для /metrics
+stream_metrics = {"http_streams": 0, "websocket_streams": 0, "active": 0, "events": 0, "rejected": 0}
+
+async def store_stream_events(db: AsyncSession, project: CachedProject, events: List[Dict]):
+    """
+    Пишет пакет из потока: в режиме buffered через буфер, а если он полон -
+    сразу, притормаживая чтение потока вместо ответа 503
+    """
+    if INGEST_MODE == "buffered" and ingest_buffer.submit(project, events):
+        return
+    await write_error_batch(db, [(project, events)])
+
+@app.post("/api/v1/log/stream")
+async def log_error_stream(request: Request):
+    """
+    Принимает поток ошибок в NDJSON (Transfer-Encoding: chunked): первая строка -
+    заголовок с токеном, дальше по ошибке на строку. После конца потока
+    отвечает подтверждениями записанных пакетов.
+
+    Сессия БД открывается на каждый пакет, а не на весь поток: пул async-движка
+    SQLite - одно соединение, и медленный клиент не должен занимать его между пакетами
+    """
+    if request.headers.get("content-encoding", "identity").lower() != "identity":
+        raise HTTPException(status_code=415, detail="Compressed streams are not supported")
+
+    token = None
+    result = StreamResult()
+
+    async def on_header(stream_token: str, context: Dict[str, Any]):
+        nonlocal token
+        token = stream_token
+        async with AsyncSessionLocal() as db:
+            if not await project_cache.lookup(db, token):
+                raise HTTPException(status_code=401, detail="Invalid project token")
+
+    async def on_batch(events: List[Dict]):
+        # Проект мог быть отключен, пока поток открыт: кэш отвечает без запроса к БД
+        async with AsyncSessionLocal() as db:
+            project = await project_cache.lookup(db, token)
+            if not project:
+                raise HTTPException(status_code=401, detail="Invalid project token")
+            await store_stream_events(db, project, events)
+
+    stream_metrics["http_streams"] += 1
+    stream_metrics["active"] += 1
+    try:
+        await read_ndjson_stream(request.stream(), on_header, on_batch, result)
+    except HTTPException:
+        raise
+    except InvalidPayload as e:
+        return JSONResponse(status_code=400, content={"detail": str(e), **result.to_dict()})
+    except ClientDisconnect:
+        logger.warning(f"Log stream disconnected after {result.accepted} events")
+        return JSONResponse(status_code=400, content={"detail": "Client disconnected", **result.to_dict()})
+    except Exception as e:
+        logger.exception("Error in log stream endpoint")
+        return JSONResponse(status_code=500, content={"detail": str(e), **result.to_dict()})
+    finally:
+        stream_metrics["active"] -= 1
+        stream_metrics["events"] += result.accepted
+        stream_metrics["rejected"] += result.rejected
+
+    return {"status": "success", **result.to_dict()}
+
+async def receive_ws_text(websocket: WebSocket) -> str:
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("text") is not None:
+        return message["text"]
+    return (message.get("bytes") or b"").decode("utf-8", "replace")
+
+@app.websocket("/api/v1/log/ws")
+async def log_error_ws(websocket: WebSocket):
+    """
+    Поток ошибок по WebSocket: первое сообщение - заголовок с токеном, каждое
+    следующее - одна или несколько ошибок в NDJSON. На каждое сообщение после
+    записи приходит {"ack": номер, "accepted": ..., "rejected": ...}
+    или {"nack": номер, "detail": ...}, если записать не удалось.
+
+    Сессия БД открывается на каждое сообщение и закрывается до ожидания
+    следующего: простаивающий сокет не держит соединение из пула
+    """
+    await websocket.accept()
+    stream_metrics["websocket_streams"] += 1
+    stream_metrics["active"] += 1
+    try:
+        try:
+            token, context = parse_stream_header(await receive_ws_text(websocket))
+        except InvalidPayload as e:
+            await websocket.close(code=4400, reason=str(e))
+            return
+        async with AsyncSessionLocal() as db:
+            project = await project_cache.lookup(db, token)
+        if not project:
+            await websocket.close(code=4401, reason="Invalid project token")
+            return
+        await websocket.send_json({"status": "ready", "max_batch": MAX_BATCH_SIZE})
+
+        seq = 0
+        while True:
+            lines = (await receive_ws_text(websocket)).splitlines()
+            seq += 1
+            if len(lines) > MAX_BATCH_SIZE:
+                await websocket.send_json({"nack": seq, "detail": f"message is larger than {MAX_BATCH_SIZE} events"})
+                continue
+
+            events, errors = parse_stream_lines([line for line in lines if line.strip()], token, context)
+            async with AsyncSessionLocal() as db:
+                project = await project_cache.lookup(db, token)
+                if not project:
+                    await websocket.close(code=4401, reason="Invalid project token")
+                    return
+                try:
+                    if events:
+                        await store_stream_events(db, project, events)
+                except Exception as e:
+                    logger.exception("Error in log websocket")
+                    await db.rollback()
+                    await websocket.send_json({"nack": seq, "detail": str(e)})
+                    continue
+
+            stream_metrics["events"] += len(events)
+            stream_metrics["rejected"] += len(errors)
+            await websocket.send_json({
+                "ack": seq,
+                "accepted": len(events),
+                "rejected": len(errors),
+                "errors": errors[:STREAM_ERROR_DETAILS]
+            })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stream_metrics["active"] -= 1
+
 @app.get("/api/v1/projects")
-async def get_projects(db: Session = Depends(get_db)):
+async def get_projects(db: AsyncSession = Depends(get_async_db)):
     """
     Получает список всех проектов
     """
-    projects = db.query(Project).all()
+    result = await db.execute(select(Project.id, Project.name, Project.type))
+    projects = result.all()
     return {"projects": [{"id": p.id, "name": p.name, "type": p.type} for p in projects]}
 
+def naive_local_time(moment: Optional[datetime]) -> Optional[datetime]:
+    """
+    Время из запроса в том виде, в котором хранятся error_logs.created_at,
+    счетчики и архив: наивное локальное. Время с часовым поясом переводится
+    в локальное, иначе сравнение с наивными датами падает с TypeError
+    """
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
+
+# Общий секрет бота и API для служебных запросов (заголовок X-Internal-Secret).
+# Без него служебные запросы принимаются только с локального адреса
+API_INTERNAL_SECRET = os.getenv("API_INTERNAL_SECRET")
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+def is_internal_request(request: Request) -> bool:
+    """
+    Служебный запрос бота: верный X-Internal-Secret, а без секрета - запрос с localhost
+    """
+    if API_INTERNAL_SECRET:
+        secret = request.headers.get("x-internal-secret", "")
+        return hmac.compare_digest(secret.encode(), API_INTERNAL_SECRET.encode())
+    return bool(request.client) and request.client.host in LOOPBACK_HOSTS
+
+def check_internal_request(request: Request):
+    """
+    Пропускает только служебные запросы бота, иначе 403
+    """
+    if is_internal_request(request):
+        return
+    if API_INTERNAL_SECRET:
+        raise HTTPException(status_code=403, detail="Invalid internal secret")
+    raise HTTPException(status_code=403, detail="Internal endpoint is available only from localhost")
+
+async def check_project_access(request: Request, db: AsyncSession, project_id: int):
+    """
+    Ошибки проекта читает служебный запрос бота или клиент с токеном
+    этого проекта в заголовке X-Project-Token
+    """
+    if is_internal_request(request):
+        return
+    project = await project_cache.lookup(db, request.headers.get("x-project-token"))
+    if project is None:
+        raise HTTPException(status_code=401, detail="Invalid project token")
+    if project.id != project_id:
+        raise HTTPException(status_code=403, detail="Project token belongs to another project")
+
+@app.get("/api/v1/projects/{project_id}/errors")
+async def get_project_errors(
+    project_id: int,
+    request: Request,
+    severity: Optional[str] = None,
+    is_resolved: Optional[bool] = None,
+    error_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_details: bool = False,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ошибки проекта постранично, новые сначала. Следующая страница -
+    тот же запрос с cursor=next_cursor; stack_trace и additional_data
+    возвращаются только при include_details=true
+    """
+    await check_project_access(request, db, project_id)
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    since, until = naive_local_time(since), naive_local_time(until)
+    if await db.get(Project, project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    try:
+        errors, next_cursor = await list_errors(
+            db, project_id, severity=severity, is_resolved=is_resolved, error_type=error_type,
+            since=since, until=until, cursor=cursor, limit=limit, include_details=include_details
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"errors": errors, "next_cursor": next_cursor}
+
+@app.get("/api/v1/search")
+async def search(
+    q: str,
+    request: Request,
+    project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = DEFAULT_SEARCH_LIMIT,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Полнотекстовый поиск по типу, сообщению и трейсбеку ошибок, самые
+    релевантные первыми; совпадения отмечены тегами <mark>. Поиск по всем
+    проектам (без project_id) доступен только служебным запросам бота
+    """
+    if project_id is None:
+        check_internal_request(request)
+    else:
+        await check_project_access(request, db, project_id)
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SEARCH_LIMIT}")
+    since, until = naive_local_time(since), naive_local_time(until)
+    try:
+        results = await db.run_sync(
+            search_errors, q, [project_id] if project_id is not None else None, since, until, limit
+        )
+    except InvalidSearchQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for result in results:
+        # Чем больше score, тем релевантнее
+        result["score"] = -result.pop("rank")
+        result["message"] = render_highlight(result["message"])
+        result["stack_trace"] = render_highlight(result["stack_trace"])
+    return {"results": results}
+
 @app.get("/api/v1/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
     """
-    Получает статистику по ошибкам
+    Получает статистику по ошибкам из счетчиков (api.counters), без COUNT по error_logs
     """
-    total_errors = db.query(ErrorLog).count()
-    active_projects = db.query(Project).filter(Project.is_active == True).count()
+    total = summarize_counts(await db.run_sync(count_errors))
+    last_day = summarize_counts(await db.run_sync(count_errors, datetime.now() - timedelta(days=1)))
+    active_projects = await db.scalar(
+        select(func.count()).select_from(Project).where(Project.is_active == True)
+    )
     
     return {
-        "total_errors": total_errors,
+        "total_errors": total["total"],
+        "errors_by_severity": total["by_severity"],
+        "errors_24h": last_day["total"],
+        "errors_24h_by_severity": last_day["by_severity"],
         "active_projects": active_projects
-    } 
\ No newline at end of file
+    } 
+
+@app.get("/api/v1/stats/errors")
+async def get_error_stats(
+    hours: Optional[float] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    project_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Число ошибок по проектам и важности за окно: последние hours часов,
+    [since, until) или за все время, если окно не задано
+    """
+    since, until = naive_local_time(since), naive_local_time(until)
+    if hours is not None:
+        if hours <= 0:
+            raise HTTPException(status_code=400, detail="hours must be positive")
+        since = datetime.now() - timedelta(hours=hours)
+    if until is not None and since is None:
+        raise HTTPException(status_code=400, detail="until requires since or hours")
+
+    counts = await db.run_sync(count_errors, since, until, project_id)
+    return {
+        "since": since,
+        "until": until or (datetime.now() if since else None),
+        **summarize_counts(counts)
+    }
+
+@app.get("/api/v1/metrics")
+async def get_metrics():
+    """
+    Внутренние метрики сервиса: буфер записи, очередь уведомлений и кэши
+    """
+    return {
+        "ingest_mode": INGEST_MODE,
+        "ingest_buffer": ingest_buffer.stats(),
+        "streams": stream_metrics,
+        "notifications": notification_queue.stats(),
+        "liveness": liveness_tracker.stats(),
+        "heartbeat_deadlines": heartbeat_deadlines.stats(),
+        "heartbeat_compactor": heartbeat_compactor.stats(),
+        "error_archiver": error_archiver.stats(),
+        "leader": leader.stats(),
+        "digest": error_digest.stats(),
+        "project_cache": project_cache.stats(),
+        "subscriber_cache": subscriber_cache.stats(),
+        "cache_invalidations": cache_invalidations.stats()
+    }
+
+@app.post("/api/v1/cache/invalidate", dependencies=[Depends(check_internal_request)])
+async def invalidate_cache(data: Dict[Any, Any]):
+    """
+    Сбрасывает закэшированные проекты по токенам и подписчиков по id проектов
+    (вызывается ботом после изменения проекта или подписки). Остальные
+    процессы API получают сброс через таблицу cache_invalidations
+    """
+    tokens = [str(token) for token in data.get("tokens") or []]
+    project_ids = [int(project_id) for project_id in data.get("project_ids") or []]
+    await apply_cache_invalidation(tokens, project_ids)
+    if API_WORKERS > 1:
+        await cache_invalidations.publish(tokens, project_ids)
+    return {"status": "success", "invalidated": len(tokens) + len(project_ids)}
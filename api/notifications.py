@@ -0,0 +1,387 @@
+"""
+Очередь уведомлений Telegram и пул отправителей.
+
+Обработчики API только кладут сообщения в ограниченную asyncio-очередь
+и сразу отвечают SDK; доставкой занимаются фоновые воркеры.
+"""
+import asyncio
+import html
+import logging
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from api.ratelimit import KeyedTokenBuckets, TokenBucket
+from database.models import DigestEntry, Project
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять отправку после ответа Telegram "Too Many Requests"
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+# Сколько типов ошибок перечислять в одной сводке (лимит длины сообщения Telegram)
+DIGEST_MAX_LINES = 20
+
+# error_type строки digest_entries со счетчиком уведомлений за интервал
+DIGEST_WINDOW = "*"
+
+_UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+class FakeBot:
+    """
+    Заменитель aiogram.Bot для запуска без сети: запоминает сообщения
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.sent: List[Dict[str, Any]] = []
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        message = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode, **kwargs}
+        self.sent.append(message)
+        logger.debug(f"FakeBot message to {chat_id}: {text}")
+        return message
+
+
+class NotificationQueue:
+    """
+    Ограниченная очередь сообщений с пулом воркеров-отправителей.
+
+    При переполнении новые сообщения отбрасываются (enqueue возвращает False),
+    чтобы медленный Telegram не тормозил прием ошибок. Воркеры соблюдают
+    общий лимит Telegram (global_rate сообщений в секунду) и лимит на чат.
+
+    Воркер не ждет лимита чата: сообщение в чат, исчерпавший лимит, уходит
+    в очередь этого чата, которую отправляет отдельная задача. Всплеск
+    сообщений в один чат не занимает воркеров, и остальные чаты не ждут.
+    Очередь чата ограничена chat_backlog сообщениями, а отложенные
+    сообщения занимают место в общей емкости maxsize.
+    """
+
+    def __init__(
+        self,
+        bot,
+        workers: int = 4,
+        maxsize: int = 10000,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        chat_backlog: int = 100
+    ):
+        self.bot = bot
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+
+        self.global_limit = TokenBucket(global_rate, global_rate)
+        self.chat_limits = KeyedTokenBuckets(chat_rate, chat_burst)
+        # Отложенные сообщения чатов, исчерпавших лимит, и задачи, которые их отправляют
+        self._deferred: Dict[int, Deque[Tuple[int, str, str]]] = {}
+        self._drainers: Dict[int, asyncio.Task] = {}
+        self.chat_backlog = chat_backlog
+        self._deferred_size = 0
+
+        # Метрики
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.deferred = 0
+        self.max_depth = 0
+
+    def enqueue(self, chat_id: int, text: str, parse_mode: str = "HTML") -> bool:
+        """
+        Ставит сообщение в очередь, не дожидаясь отправки
+        """
+        try:
+            # Отложенные сообщения уже вынуты из queue, но еще не отправлены
+            if self.queue.maxsize and self.depth() >= self.queue.maxsize:
+                raise asyncio.QueueFull
+            self.queue.put_nowait((chat_id, text, parse_mode))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Notification queue is full, dropping message to {chat_id}")
+            return False
+
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.depth())
+        return True
+
+    def depth(self) -> int:
+        """
+        Сколько сообщений ждет отправки: в общей очереди и в очередях чатов
+        """
+        return self.queue.qsize() + self._deferred_size
+
+    def notify(self, chat_ids: Iterable[int], text: str, parse_mode: str = "HTML") -> int:
+        """
+        Рассылает одно сообщение нескольким получателям, возвращает число поставленных в очередь
+        """
+        return sum(self.enqueue(chat_id, text, parse_mode) for chat_id in chat_ids)
+
+    async def start(self):
+        for i in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+
+    async def stop(self, timeout: float = 5.0):
+        """
+        Дожидается отправки оставшихся сообщений (не дольше timeout) и останавливает воркеров
+        """
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Notification queue not drained, {self.queue.qsize()} messages lost")
+
+        tasks = self._tasks + list(self._drainers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._drainers = {}
+        self._deferred = {}
+        self._deferred_size = 0
+
+    async def _send(self, chat_id: int, text: str, parse_mode: str, chat_acquired: bool = False):
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            if not chat_acquired:
+                await self.chat_limits.acquire(chat_id)
+            chat_acquired = False
+            await self.global_limit.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+                return
+            except Exception as e:
+                # aiogram и python-telegram-bot сообщают паузу в атрибуте retry_after
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is None or attempt == MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                self.retried += 1
+                logger.warning(f"Telegram asked to retry after {retry_after}s for chat {chat_id}")
+                await asyncio.sleep(float(retry_after))
+
+    async def _deliver(self, chat_id: int, text: str, parse_mode: str, chat_acquired: bool = False):
+        try:
+            await self._send(chat_id, text, parse_mode, chat_acquired)
+            self.sent += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Failed to send notification to {chat_id}: {e}")
+        finally:
+            self.queue.task_done()
+
+    async def _drain(self, chat_id: int):
+        """
+        Отправляет отложенные сообщения одного чата по мере пополнения его лимита
+        """
+        backlog = self._deferred[chat_id]
+        try:
+            while backlog:
+                # Сообщение остается в очереди чата до отправки и занимает место в ней
+                await self._deliver(*backlog[0])
+                backlog.popleft()
+                self._deferred_size -= 1
+        finally:
+            # Без await между проверкой и удалением: воркер не добавит сообщение в брошенную очередь
+            del self._deferred[chat_id]
+            del self._drainers[chat_id]
+
+    async def _worker(self, number: int):
+        while True:
+            message = await self.queue.get()
+            chat_id = message[0]
+            # Пока у чата есть отложенные сообщения, новые встают за ними, чтобы не нарушить порядок
+            if chat_id in self._deferred or not self.chat_limits.get(chat_id).try_acquire():
+                backlog = self._deferred.get(chat_id)
+                if backlog is None:
+                    backlog = self._deferred[chat_id] = deque()
+                    self._drainers[chat_id] = asyncio.create_task(self._drain(chat_id))
+                elif len(backlog) >= self.chat_backlog:
+                    self.dropped += 1
+                    logger.warning(f"Notification backlog of chat {chat_id} is full, dropping message")
+                    self.queue.task_done()
+                    continue
+                self.deferred += 1
+                backlog.append(message)
+                self._deferred_size += 1
+                continue
+            await self._deliver(*message, chat_acquired=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "capacity": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "deferred_chats": len(self._deferred),
+            "deferred_depth": self._deferred_size,
+        }
+
+
+class ErrorDigest:
+    """
+    Схлопывает поток уведомлений об ошибках в периодические сводки.
+
+    Первые threshold уведомлений для пары (чат, проект) за интервал
+    отправляются как есть, остальные копятся и раз в interval секунд
+    уходят одним сообщением "37 × ZeroDivisionError в проекте X за 60 с".
+    """
+
+    # True - окно общее для всех процессов API, сводки отправляет ведущий процесс
+    shared = False
+
+    def __init__(self, queue: NotificationQueue, threshold: int = 5, interval: float = 60.0):
+        self.queue = queue
+        self.threshold = threshold
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+        self._window: Counter = Counter()
+        self._pending: Dict[Tuple[int, int], Counter] = {}
+        self._project_names: Dict[int, str] = {}
+
+        # Метрики
+        self.passed = 0
+        self.suppressed = 0
+        self.digests = 0
+
+    async def alert(self, chat_ids: Iterable[int], project_id: int, project_name: str, error_type: str, text: str):
+        """
+        Отправляет уведомление об ошибке или откладывает его в сводку
+        """
+        self._project_names[project_id] = project_name
+        for chat_id in chat_ids:
+            key = (chat_id, project_id)
+            self._window[key] += 1
+            if self._window[key] <= self.threshold:
+                self.queue.enqueue(chat_id, text)
+                self.passed += 1
+            else:
+                self._pending.setdefault(key, Counter())[error_type] += 1
+                self.suppressed += 1
+
+    async def flush(self):
+        """
+        Ставит накопленные сводки в очередь и начинает новый интервал
+        """
+        pending, self._pending = self._pending, {}
+        self._window.clear()
+        self._send_digests(pending, self._project_names)
+
+    def _send_digests(self, pending: Dict[Tuple[int, int], Counter], project_names: Dict[int, str]):
+        for (chat_id, project_id), counts in pending.items():
+            project_name = html.escape(project_names.get(project_id, str(project_id)))
+            lines = [
+                f"• {count} × {html.escape(error_type)}"
+                for error_type, count in counts.most_common(DIGEST_MAX_LINES)
+            ]
+            if len(counts) > DIGEST_MAX_LINES:
+                lines.append(f"• ... и еще {len(counts) - DIGEST_MAX_LINES} типов")
+            message = (
+                f"📦 <b>Сводка ошибок в проекте {project_name}</b>\n\n"
+                f"За последние {int(self.interval)} с: {sum(counts.values())} новых ошибок\n"
+                + "\n".join(lines)
+            )
+            if self.queue.enqueue(chat_id, message):
+                self.digests += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error while flushing notification digest")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "threshold": self.threshold,
+            "interval": self.interval,
+            "alerts": self.passed,
+            "suppressed": self.suppressed,
+            "digests": self.digests,
+            "pending_chats": len(self._pending),
+        }
+
+
+class SharedErrorDigest(ErrorDigest):
+    """
+    ErrorDigest для нескольких процессов API.
+
+    Окно и отложенные ошибки хранятся в таблице digest_entries, поэтому
+    порог threshold общий для всех процессов, а не threshold на каждый.
+    Сводки раз в interval отправляет только ведущий процесс (api.leader):
+    он забирает и удаляет все строки одним DELETE ... RETURNING, и
+    уведомление, записанное в это время другим процессом, попадет в
+    следующую сводку, а не потеряется.
+    """
+    shared = True
+
+    def __init__(self, queue: NotificationQueue, session_factory, threshold: int = 5, interval: float = 60.0):
+        super().__init__(queue, threshold, interval)
+        self.session_factory = session_factory
+
+    @staticmethod
+    def _increment(dialect: str, chat_id: int, project_id: int, error_type: str):
+        make_insert = _UPSERT_INSERTS.get(dialect)
+        if make_insert is None:
+            raise NotImplementedError(f"Shared notification digest is not supported for {dialect}")
+        stmt = make_insert(DigestEntry).values(chat_id=chat_id, project_id=project_id, error_type=error_type, count=1)
+        return stmt.on_conflict_do_update(
+            index_elements=["chat_id", "project_id", "error_type"],
+            set_={"count": DigestEntry.count + 1}
+        ).returning(DigestEntry.count)
+
+    async def alert(self, chat_ids: Iterable[int], project_id: int, project_name: str, error_type: str, text: str):
+        async with self.session_factory() as db:
+            dialect = db.get_bind().dialect.name
+            for chat_id in chat_ids:
+                sent = await db.scalar(self._increment(dialect, chat_id, project_id, DIGEST_WINDOW))
+                if sent <= self.threshold:
+                    self.queue.enqueue(chat_id, text)
+                    self.passed += 1
+                else:
+                    await db.execute(self._increment(dialect, chat_id, project_id, error_type))
+                    self.suppressed += 1
+            await db.commit()
+
+    async def flush(self):
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                delete(DigestEntry).returning(
+                    DigestEntry.chat_id, DigestEntry.project_id, DigestEntry.error_type, DigestEntry.count
+                )
+            )).all()
+            pending: Dict[Tuple[int, int], Counter] = {}
+            for chat_id, project_id, error_type, count in rows:
+                if error_type != DIGEST_WINDOW:
+                    pending.setdefault((chat_id, project_id), Counter())[error_type] += count
+            project_names = {}
+            if pending:
+                project_ids = {project_id for _, project_id in pending}
+                project_names = dict((await db.execute(
+                    select(Project.id, Project.name).where(Project.id.in_(project_ids))
+                )).all())
+            await db.commit()
+        self._send_digests(pending, project_names)
@@ -0,0 +1,133 @@
+"""
+Постраничное чтение ошибок проекта.
+
+Страницы выбираются по курсору (keyset): следующая страница начинается
+после последней строки предыдущей по (created_at, id), поэтому запрос идет
+по индексу и не пропускает OFFSET строк - глубокие страницы проекта с
+миллионами ошибок читаются так же быстро, как первая. Курсор непрозрачен
+для клиента: base64 от времени и id последней строки.
+
+По умолчанию выбираются только короткие поля; stack_trace и additional_data
+(самые тяжелые) - по запросу.
+
+Ошибки, перенесенные в холодный архив (api.archive), дочитываются из его
+сегментов тем же порядком и курсором, когда горячие строки закончились.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.archive import read_archived_errors
+from database.models import ErrorLog
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+LIST_COLUMNS = (
+    ErrorLog.id,
+    ErrorLog.group_id,
+    ErrorLog.error_type,
+    ErrorLog.error_message,
+    ErrorLog.severity_level,
+    ErrorLog.is_resolved,
+    ErrorLog.created_at,
+)
+DETAIL_COLUMNS = (ErrorLog.stack_trace, ErrorLog.additional_data)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, error_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), error_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, error_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(error_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor("invalid cursor")
+
+
+async def list_errors(
+    db: AsyncSession,
+    project_id: int,
+    severity: Optional[str] = None,
+    is_resolved: Optional[bool] = None,
+    error_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_details: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Страница ошибок проекта, новые сначала, и курсор следующей страницы
+    (None - страниц больше нет)
+    """
+    columns = LIST_COLUMNS + DETAIL_COLUMNS if include_details else LIST_COLUMNS
+    query = select(*columns).where(ErrorLog.project_id == project_id)
+
+    if severity is not None:
+        query = query.where(ErrorLog.severity_level == severity)
+    if is_resolved is not None:
+        query = query.where(ErrorLog.is_resolved == is_resolved)
+    if error_type is not None:
+        query = query.where(ErrorLog.error_type == error_type)
+    if since is not None:
+        query = query.where(ErrorLog.created_at >= since)
+    if until is not None:
+        query = query.where(ErrorLog.created_at < until)
+
+    after_created_at = after_id = None
+    if cursor is not None:
+        after_created_at, after_id = decode_cursor(cursor)
+        # created_at <= X отдельным условием - диапазон по индексу,
+        # второе условие досматривает строки с тем же created_at
+        query = query.where(
+            ErrorLog.created_at <= after_created_at,
+            or_(ErrorLog.created_at < after_created_at,
+                and_(ErrorLog.created_at == after_created_at, ErrorLog.id < after_id))
+        )
+
+    # Одна лишняя строка показывает, есть ли следующая страница
+    query = query.order_by(ErrorLog.created_at.desc(), ErrorLog.id.desc()).limit(limit + 1)
+    rows = [dict(row) for row in (await db.execute(query)).mappings().all()]
+
+    # Архив: строки старше курсора и until. Если горячая страница полна,
+    # читаются только сегменты, пересекающиеся с ней по времени
+    bounds = [(after_created_at, after_id)] if cursor is not None else []
+    if until is not None:
+        bounds.append((until, 0))
+
+    def matches(row: Dict[str, Any]) -> bool:
+        return ((severity is None or row["severity_level"] == severity)
+                and (is_resolved is None or row["is_resolved"] == is_resolved)
+                and (error_type is None or row["error_type"] == error_type))
+
+    archived = await read_archived_errors(
+        db, project_id, matches,
+        before=min(bounds) if bounds else None,
+        since=since,
+        after=(rows[-1]["created_at"], rows[-1]["id"]) if len(rows) > limit else None,
+        limit=limit + 1
+    )
+    if archived:
+        # Строка может быть и в архиве, и в error_logs, пока перенос месяца не закончен
+        merged = {row["id"]: {key: row[key] for key in (column.key for column in columns)} for row in archived}
+        merged.update((row["id"], row) for row in rows)
+        rows = sorted(merged.values(), key=lambda row: (row["created_at"], row["id"]), reverse=True)[:limit + 1]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return rows, next_cursor
@@ -0,0 +1,78 @@
+"""
+Ограничение частоты отправки сообщений в Telegram
+"""
+import asyncio
+import time
+from typing import Dict, Hashable
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity в запасе
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """
+        Сколько секунд ждать, пока накопится нужное количество токенов
+        """
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class KeyedTokenBuckets:
+    """
+    Отдельный TokenBucket на каждый ключ (например, на каждый чат)
+    """
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 100000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def get(self, key: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self.prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket
+
+    def prune(self):
+        """
+        Удаляет полные корзины: они ничем не отличаются от новых
+        """
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full()]:
+            del self._buckets[key]
+
+    async def acquire(self, key: Hashable, tokens: float = 1.0):
+        await self.get(key).acquire(tokens)
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,442 @@
+"""
+Свертка и очистка heartbeat.
+
+Сырые heartbeat сворачиваются в часовые сводки по проекту (число сигналов,
+версии, статусы, перерывы), часовые - в суточные. Сырые записи старше срока
+хранения проекта и часовые сводки старше HEARTBEAT_HOURLY_RETENTION_DAYS
+удаляются небольшими порциями, чтобы не держать долгую блокировку записи.
+Тем же проходом удаляются устаревшие минутные и часовые счетчики ошибок.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from api.counters import (
+    ERROR_COUNTER_HOUR_RETENTION_DAYS, ERROR_COUNTER_MINUTE_RETENTION_HOURS, delete_error_counters_chunk
+)
+from database.models import Heartbeat, HeartbeatRollup, Project
+
+logger = logging.getLogger(__name__)
+
+# Срок хранения сырых heartbeat для проектов без своей настройки, дней
+HEARTBEAT_RETENTION_DAYS = int(os.getenv("HEARTBEAT_RETENTION_DAYS", "7"))
+
+# Срок хранения часовых сводок; суточные хранятся всегда
+HEARTBEAT_HOURLY_RETENTION_DAYS = int(os.getenv("HEARTBEAT_HOURLY_RETENTION_DAYS", "90"))
+
+# Перерыв между heartbeat длиннее этого считается пропуском
+HEARTBEAT_GAP_SECONDS = int(os.getenv("HEARTBEAT_GAP_SECONDS", "300"))
+
+# Сколько часов сворачивать за один проход
+ROLLUP_MAX_HOURS = 24
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def new_summary(project_id: int, period: str, period_start: datetime) -> Dict[str, Any]:
+    return {
+        "project_id": project_id,
+        "period": period,
+        "period_start": period_start,
+        "count": 0,
+        "versions": [],
+        "statuses": Counter(),
+        "first_seen": None,
+        "last_seen": None,
+        "gaps": 0,
+        "max_gap_seconds": 0,
+    }
+
+
+def add_beat(summary: Dict[str, Any], created_at: datetime, version: Optional[str], status: str,
+             previous: Optional[datetime], gap_seconds: int = HEARTBEAT_GAP_SECONDS):
+    """
+    Учитывает один heartbeat в сводке; previous - время предыдущего сигнала проекта
+    """
+    summary["count"] += 1
+    if version and version not in summary["versions"]:
+        summary["versions"].append(version)
+    summary["statuses"][status] += 1
+    if summary["first_seen"] is None:
+        summary["first_seen"] = created_at
+    summary["last_seen"] = created_at
+
+    # Перерыв относится к часу, в котором сигнал пришел снова
+    if previous is not None:
+        gap = int((created_at - previous).total_seconds())
+        if gap > gap_seconds:
+            summary["gaps"] += 1
+            summary["max_gap_seconds"] = max(summary["max_gap_seconds"], gap)
+
+
+def merge_summary(summary: Dict[str, Any], other: Any):
+    """
+    Добавляет к сводке другую сводку за более поздний или тот же период
+    (словарь или HeartbeatRollup)
+    """
+    get = other.get if isinstance(other, dict) else lambda name: getattr(other, name)
+    summary["count"] += get("count")
+    for version in get("versions") or []:
+        if version not in summary["versions"]:
+            summary["versions"].append(version)
+    summary["statuses"].update(get("statuses") or {})
+    if summary["first_seen"] is None or (get("first_seen") and get("first_seen") < summary["first_seen"]):
+        summary["first_seen"] = get("first_seen")
+    if summary["last_seen"] is None or (get("last_seen") and get("last_seen") > summary["last_seen"]):
+        summary["last_seen"] = get("last_seen")
+    summary["gaps"] += get("gaps")
+    summary["max_gap_seconds"] = max(summary["max_gap_seconds"], get("max_gap_seconds"))
+
+
+def _finish(summaries: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{**summary, "statuses": dict(summary["statuses"])} for summary in summaries]
+
+
+def _last_rollup_start(db: Session, period: str) -> Optional[datetime]:
+    return db.scalar(
+        select(func.max(HeartbeatRollup.period_start)).where(HeartbeatRollup.period == period)
+    )
+
+
+def rolled_up_until(db: Session) -> Optional[datetime]:
+    """
+    Граница, до которой сырые heartbeat уже свернуты в часовые сводки
+    """
+    last_hour = _last_rollup_start(db, "hour")
+    return last_hour + HOUR if last_hour else None
+
+
+def _first_unrolled(db: Session) -> Optional[datetime]:
+    """
+    Время самого раннего heartbeat, еще не попавшего в часовую сводку
+    """
+    query = select(func.min(Heartbeat.created_at)).where(Heartbeat.project_id != None)
+    done = rolled_up_until(db)
+    if done:
+        query = query.where(Heartbeat.created_at >= done)
+    return db.scalar(query)
+
+
+def rollup_hours(db: Session, now: datetime, gap_seconds: int = HEARTBEAT_GAP_SECONDS,
+                 max_hours: int = ROLLUP_MAX_HOURS, insert_batch: int = 1000) -> int:
+    """
+    Сворачивает завершившиеся часы (не больше max_hours) в часовые сводки.
+    Возвращает число созданных сводок.
+    """
+    first = _first_unrolled(db)
+    if first is None:
+        return 0
+    start = floor_hour(first)
+    end = min(start + timedelta(hours=max_hours), floor_hour(now))
+    if start >= end:
+        return 0
+
+    # Последний сигнал проектов перед окном: перерыв может начаться в прошлом проходе.
+    # Смотрим сутки назад, чтобы не перебирать все часовые сводки
+    last_seen = dict(db.execute(
+        select(HeartbeatRollup.project_id, func.max(HeartbeatRollup.last_seen))
+        .where(HeartbeatRollup.period == "hour", HeartbeatRollup.period_start >= start - DAY)
+        .group_by(HeartbeatRollup.project_id)
+    ).all())
+
+    # Записи идут по проектам, поэтому в памяти сводки только одного проекта
+    rows = db.execute(
+        select(Heartbeat.project_id, Heartbeat.created_at, Heartbeat.version, Heartbeat.status)
+        .where(Heartbeat.project_id != None, Heartbeat.created_at >= start, Heartbeat.created_at < end)
+        .order_by(Heartbeat.project_id, Heartbeat.created_at)
+        .execution_options(yield_per=5000)
+    )
+
+    pending: List[Dict[str, Any]] = []
+    created = 0
+    summaries: Dict[datetime, Dict[str, Any]] = {}
+    project_id = previous = None
+
+    def flush_pending():
+        nonlocal created
+        if pending:
+            db.execute(insert(HeartbeatRollup), pending)
+            created += len(pending)
+            pending.clear()
+
+    for row in rows:
+        if row.project_id != project_id:
+            pending.extend(_finish(summaries.values()))
+            summaries = {}
+            project_id, previous = row.project_id, last_seen.get(row.project_id)
+            if len(pending) >= insert_batch:
+                flush_pending()
+
+        hour = floor_hour(row.created_at)
+        summary = summaries.get(hour)
+        if summary is None:
+            summary = summaries[hour] = new_summary(project_id, "hour", hour)
+        add_beat(summary, row.created_at, row.version, row.status, previous, gap_seconds)
+        previous = row.created_at
+
+    pending.extend(_finish(summaries.values()))
+    flush_pending()
+    db.commit()
+    return created
+
+
+def rollup_days(db: Session, now: datetime, insert_batch: int = 1000) -> int:
+    """
+    Сворачивает часовые сводки полностью обработанных суток в суточные.
+    Возвращает число созданных сводок.
+    """
+    # Сутки закрыты, когда закончились и все их сырые heartbeat свернуты
+    boundary = floor_day(now)
+    first_unrolled = _first_unrolled(db)
+    if first_unrolled is not None:
+        boundary = min(boundary, floor_day(first_unrolled))
+
+    query = (
+        select(HeartbeatRollup)
+        .where(HeartbeatRollup.period == "hour", HeartbeatRollup.period_start < boundary)
+        .order_by(HeartbeatRollup.project_id, HeartbeatRollup.period_start)
+        .execution_options(yield_per=5000)
+    )
+    last_day = _last_rollup_start(db, "day")
+    if last_day:
+        query = query.where(HeartbeatRollup.period_start >= last_day + DAY)
+
+    pending: List[Dict[str, Any]] = []
+    created = 0
+    summary: Optional[Dict[str, Any]] = None
+
+    for hour in db.execute(query).scalars():
+        day = floor_day(hour.period_start)
+        if summary is None or summary["project_id"] != hour.project_id or summary["period_start"] != day:
+            if summary is not None:
+                pending.extend(_finish([summary]))
+            summary = new_summary(hour.project_id, "day", day)
+            if len(pending) >= insert_batch:
+                db.execute(insert(HeartbeatRollup), pending)
+                created += len(pending)
+                pending.clear()
+
+        merge_summary(summary, hour)
+
+    if summary is not None:
+        pending.extend(_finish([summary]))
+    if pending:
+        db.execute(insert(HeartbeatRollup), pending)
+        created += len(pending)
+    db.commit()
+    return created
+
+
+def merge_hourly_rollups(db: Session, summaries: List[Dict[str, Any]]):
+    """
+    Добавляет часовые сводки из памяти (LivenessTracker) к уже записанным.
+    Не коммитит: вызывающий записывает их вместе с last_heartbeat.
+    """
+    if not summaries:
+        return
+    existing = {}
+    # Порциями, чтобы не упереться в лимит параметров запроса SQLite
+    for i in range(0, len(summaries), 500):
+        chunk = summaries[i:i + 500]
+        for rollup in db.execute(
+            select(HeartbeatRollup).where(
+                HeartbeatRollup.period == "hour",
+                HeartbeatRollup.project_id.in_({summary["project_id"] for summary in chunk}),
+                HeartbeatRollup.period_start.in_({summary["period_start"] for summary in chunk})
+            )
+        ).scalars():
+            existing[(rollup.project_id, rollup.period_start)] = rollup
+
+    new_rows = []
+    for summary in summaries:
+        rollup = existing.get((summary["project_id"], summary["period_start"]))
+        if rollup is None:
+            new_rows.append(summary)
+            continue
+        merged = new_summary(rollup.project_id, "hour", rollup.period_start)
+        merge_summary(merged, rollup)
+        merge_summary(merged, summary)
+        for name, value in _finish([merged])[0].items():
+            setattr(rollup, name, value)
+    if new_rows:
+        db.execute(insert(HeartbeatRollup), _finish(new_rows))
+    db.flush()
+
+
+def retention_cutoffs(db: Session, now: datetime, default_days: int = HEARTBEAT_RETENTION_DAYS) -> Dict[Optional[int], datetime]:
+    """
+    Граница удаления сырых heartbeat для каждого срока хранения
+    (None - проекты со сроком по умолчанию)
+    """
+    cutoffs: Dict[Optional[int], datetime] = {None: now - timedelta(days=default_days)}
+    for (days,) in db.execute(
+        select(Project.heartbeat_retention_days).where(Project.heartbeat_retention_days != None).distinct()
+    ):
+        cutoffs[days] = now - timedelta(days=days)
+    return cutoffs
+
+
+def delete_heartbeats_chunk(db: Session, retention_days: Optional[int], cutoff: datetime, chunk_size: int) -> int:
+    """
+    Удаляет до chunk_size сырых heartbeat старше cutoff у проектов с данным сроком хранения
+    """
+    # Удаляем только то, что уже попало в часовые сводки
+    done = rolled_up_until(db)
+    if done is None:
+        return 0
+    cutoff = min(cutoff, done)
+
+    projects = select(Project.id).where(Project.heartbeat_retention_days == retention_days)
+    ids = select(Heartbeat.id).where(
+        Heartbeat.project_id.in_(projects),
+        Heartbeat.created_at < cutoff
+    ).limit(chunk_size)
+    deleted = db.execute(
+        delete(Heartbeat).where(Heartbeat.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def delete_hourly_rollups_chunk(db: Session, cutoff: datetime, chunk_size: int) -> int:
+    """
+    Удаляет до chunk_size часовых сводок старше cutoff, уже вошедших в суточные
+    """
+    last_day = _last_rollup_start(db, "day")
+    if last_day is None:
+        return 0
+    cutoff = min(cutoff, last_day + DAY)
+
+    ids = select(HeartbeatRollup.id).where(
+        HeartbeatRollup.period == "hour",
+        HeartbeatRollup.period_start < cutoff
+    ).limit(chunk_size)
+    deleted = db.execute(
+        delete(HeartbeatRollup).where(HeartbeatRollup.id.in_(ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+class HeartbeatCompactor:
+    """
+    Фоновая задача: раз в interval секунд сворачивает heartbeat и удаляет старые записи.
+
+    Каждая порция удаления - отдельная короткая транзакция, между порциями
+    event loop свободен, и прием heartbeat и ошибок не ждет всю очистку.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        interval: float = 3600.0,
+        retention_days: int = HEARTBEAT_RETENTION_DAYS,
+        hourly_retention_days: int = HEARTBEAT_HOURLY_RETENTION_DAYS,
+        gap_seconds: int = HEARTBEAT_GAP_SECONDS,
+        chunk_size: int = 5000,
+        rollup_raw: bool = True
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.retention_days = retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.gap_seconds = gap_seconds
+        self.chunk_size = chunk_size
+        # False - часовые сводки пишет LivenessTracker, сырые записи только удаляются
+        self.rollup_raw = rollup_raw
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.runs = 0
+        self.hourly_rollups = 0
+        self.daily_rollups = 0
+        self.deleted_heartbeats = 0
+        self.deleted_rollups = 0
+        self.deleted_counters = 0
+        self.last_run_seconds = 0.0
+
+    async def _delete_in_chunks(self, delete_chunk, *args) -> int:
+        total = 0
+        while True:
+            async with self.session_factory() as db:
+                deleted = await db.run_sync(delete_chunk, *args, self.chunk_size)
+            total += deleted
+            if deleted < self.chunk_size:
+                return total
+            await asyncio.sleep(0)
+
+    async def run_once(self, now: Optional[datetime] = None):
+        started = asyncio.get_running_loop().time()
+        now = now or datetime.utcnow()
+
+        # Часы сворачиваются порциями по ROLLUP_MAX_HOURS, пока не догонят текущий час
+        while self.rollup_raw:
+            async with self.session_factory() as db:
+                created = await db.run_sync(rollup_hours, now, self.gap_seconds)
+            self.hourly_rollups += created
+            if not created:
+                break
+        async with self.session_factory() as db:
+            self.daily_rollups += await db.run_sync(rollup_days, now)
+            cutoffs = await db.run_sync(retention_cutoffs, now, self.retention_days)
+
+        for retention_days, cutoff in cutoffs.items():
+            self.deleted_heartbeats += await self._delete_in_chunks(delete_heartbeats_chunk, retention_days, cutoff)
+        self.deleted_rollups += await self._delete_in_chunks(
+            delete_hourly_rollups_chunk, now - timedelta(days=self.hourly_retention_days)
+        )
+
+        # Счетчики ошибок ведутся по локальному времени, как error_logs.created_at
+        local_now = datetime.now()
+        self.deleted_counters += await self._delete_in_chunks(
+            delete_error_counters_chunk, "minute", local_now - timedelta(hours=ERROR_COUNTER_MINUTE_RETENTION_HOURS)
+        )
+        self.deleted_counters += await self._delete_in_chunks(
+            delete_error_counters_chunk, "hour", local_now - timedelta(days=ERROR_COUNTER_HOUR_RETENTION_DAYS)
+        )
+
+        self.runs += 1
+        self.last_run_seconds = asyncio.get_running_loop().time() - started
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Error while compacting heartbeats")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "hourly_rollups": self.hourly_rollups,
+            "daily_rollups": self.daily_rollups,
+            "deleted_heartbeats": self.deleted_heartbeats,
+            "deleted_rollups": self.deleted_rollups,
+            "deleted_counters": self.deleted_counters,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+        }
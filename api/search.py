@@ -0,0 +1,168 @@
+"""
+Полнотекстовый поиск ошибок по типу, сообщению и трейсбеку (индекс database.search).
+
+Запрос пользователя не передается в синтаксис FTS5 или tsquery как есть:
+каждое слово ищется как фраза (кавычки внутри экранируются), слова
+объединяются через И, слово с * на конце ищется по префиксу. Результаты
+упорядочены по релевантности (bm25 в SQLite, ts_rank_cd в PostgreSQL);
+совпадения в сообщении и фрагменте трейсбека отмечаются маркерами.
+
+Релевантность считается для каждого совпадения, поэтому время запроса
+растет с числом совпадений. Окно по времени проверяется по created_at
+каждого совпадения: id не сужают поиск, потому что created_at - локальное
+время и при переводе часов идет не по порядку id.
+"""
+import html
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Boolean, DateTime, bindparam, text
+from sqlalchemy.orm import Session
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Маркеры совпадений в ответе БД; заменяются на теги после экранирования текста
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+# Вес колонок bm25: тип и сообщение важнее трейсбека
+SQLITE_WEIGHTS = (4.0, 2.0, 1.0)
+
+_WORD = re.compile(r'\S+')
+
+
+class InvalidSearchQuery(ValueError):
+    pass
+
+
+def _terms(query: str) -> List[Tuple[str, bool]]:
+    """
+    Слова запроса и признак поиска по префиксу (слово с * на конце)
+    """
+    terms = []
+    for word in _WORD.findall(query):
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*")
+        # Слово без букв и цифр токенизатор выбросит целиком
+        if any(char.isalnum() for char in word):
+            terms.append((word, prefix))
+    if not terms:
+        raise InvalidSearchQuery("empty search query")
+    return terms
+
+
+def to_fts_query(query: str) -> str:
+    """
+    Строка поиска пользователя -> безопасный запрос FTS5
+    """
+    phrases = []
+    for word, prefix in _terms(query):
+        phrase = '"' + word.replace('"', '""') + '"'
+        phrases.append(phrase + "*" if prefix else phrase)
+    return " ".join(phrases)
+
+
+def to_tsquery(query: str) -> str:
+    """
+    Строка поиска пользователя -> безопасный запрос to_tsquery PostgreSQL
+    """
+    lexemes = []
+    for word, prefix in _terms(query):
+        lexeme = "'" + word.replace("\\", "\\\\").replace("'", "''") + "'"
+        lexemes.append(lexeme + ":*" if prefix else lexeme)
+    return " & ".join(lexemes)
+
+
+def render_highlight(fragment: Optional[str], start: str = "<mark>", end: str = "</mark>") -> Optional[str]:
+    """
+    Экранирует текст для HTML и заменяет маркеры совпадений тегами
+    """
+    if fragment is None:
+        return None
+    return html.escape(fragment).replace(MATCH_START, start).replace(MATCH_END, end)
+
+
+def _filters(project_ids: Optional[Sequence[int]], since: Optional[datetime], until: Optional[datetime]) -> str:
+    conditions = []
+    if project_ids is not None:
+        conditions.append("e.project_id IN :project_ids")
+    if since is not None:
+        conditions.append("e.created_at >= :since")
+    if until is not None:
+        conditions.append("e.created_at < :until")
+    return "".join(f" AND {condition}" for condition in conditions)
+
+
+def _sqlite_query(filters: str):
+    weights = ", ".join(str(weight) for weight in SQLITE_WEIGHTS)
+    return text(f"""
+        SELECT e.id, e.project_id, e.group_id, e.error_type, e.severity_level, e.is_resolved, e.created_at,
+               highlight(error_logs_fts, 1, :start, :end) AS message,
+               snippet(error_logs_fts, 2, :start, :end, '…', 16) AS stack_trace,
+               bm25(error_logs_fts, {weights}) AS rank
+        FROM error_logs_fts
+        JOIN error_logs AS e ON e.id = error_logs_fts.rowid
+        WHERE error_logs_fts MATCH :query{filters}
+        ORDER BY rank
+        LIMIT :limit
+    """)
+
+
+def _postgres_query(filters: str):
+    return text(f"""
+        SELECT e.id, e.project_id, e.group_id, e.error_type, e.severity_level, e.is_resolved, e.created_at,
+               ts_headline('simple', e.error_message, q, :message_options) AS message,
+               ts_headline('simple', coalesce(e.stack_trace, ''), q, :stack_options) AS stack_trace,
+               -ts_rank_cd(e.search_vector, q) AS rank
+        FROM error_logs AS e, to_tsquery('simple', :query) AS q
+        WHERE e.search_vector @@ q{filters}
+        ORDER BY rank
+        LIMIT :limit
+    """)
+
+
+def search_errors(
+    db: Session,
+    query: str,
+    project_ids: Optional[Sequence[int]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = DEFAULT_SEARCH_LIMIT
+) -> List[Dict[str, Any]]:
+    """
+    Ошибки, подходящие под запрос, самые релевантные первыми. message и
+    stack_trace - сообщение и фрагмент трейсбека с маркерами
+    MATCH_START/MATCH_END вокруг совпадений (см. render_highlight)
+    """
+    if project_ids is not None and not project_ids:
+        return []
+    dialect = db.get_bind().dialect.name
+    filters = _filters(project_ids, since, until)
+    params: Dict[str, Any] = {"limit": limit}
+    if since is not None:
+        params["since"] = since
+    if until is not None:
+        params["until"] = until
+
+    if dialect == "sqlite":
+        statement = _sqlite_query(filters)
+        params.update(query=to_fts_query(query), start=MATCH_START, end=MATCH_END)
+    elif dialect == "postgresql":
+        statement = _postgres_query(filters)
+        markers = f"StartSel={MATCH_START}, StopSel={MATCH_END}"
+        params.update(
+            query=to_tsquery(query),
+            message_options=f"{markers}, HighlightAll=true",
+            stack_options=f"{markers}, MaxFragments=1, MaxWords=30, MinWords=10",
+        )
+    else:
+        raise NotImplementedError(f"Full-text search is not supported for {dialect}")
+
+    if project_ids is not None:
+        statement = statement.bindparams(bindparam("project_ids", expanding=True))
+        params["project_ids"] = list(project_ids)
+    statement = statement.columns(created_at=DateTime, is_resolved=Boolean)
+
+    return [dict(row) for row in db.execute(statement, params).mappings()]
@@ -0,0 +1,234 @@
+"""
+Потоковый прием ошибок: NDJSON в теле одного долгого запроса или в сообщениях WebSocket.
+
+Первая строка потока - заголовок {"project_token": ..., "context": {...}},
+дальше по одной ошибке на строку в том же виде, что элементы пакета
+{"errors": [...]}. Тело разбирается по мере поступления: в памяти держатся
+несколько непрочитанных кусков, текущая строка и неполный пакет. События
+записываются пакетами по STREAM_BATCH_SIZE или раз в STREAM_FLUSH_INTERVAL
+секунд, на каждый записанный пакет формируется подтверждение.
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api.ingest import InvalidPayload, parse_error_event
+
+# Предел длины одной строки потока; более длинные строки пропускаются
+MAX_STREAM_LINE_BYTES = int(os.getenv("MAX_STREAM_LINE_BYTES", str(1024 * 1024)))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "1"))
+# Сколько прочитанных, но не разобранных кусков тела держать в памяти
+STREAM_READ_AHEAD = 4
+# Сколько описаний отклоненных строк возвращать клиенту
+STREAM_ERROR_DETAILS = 10
+# Сколько подтверждений последних пакетов возвращать клиенту
+STREAM_BATCH_DETAILS = 10
+
+
+class NdjsonDecoder:
+    """
+    Режет поток байтов на строки, не накапливая строку длиннее max_line_bytes
+    """
+
+    def __init__(self, max_line_bytes: int = MAX_STREAM_LINE_BYTES):
+        self.max_line_bytes = max_line_bytes
+        self._buffer = bytearray()
+        self._skipping = False
+        self.too_long = 0
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        lines = []
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if end < 0:
+                break
+            piece = chunk[start:end]
+            start = end + 1
+            if self._skipping:
+                # Конец слишком длинной строки
+                self._skipping = False
+            elif len(self._buffer) + len(piece) > self.max_line_bytes:
+                self.too_long += 1
+                self._buffer.clear()
+            else:
+                self._buffer += piece
+                line = bytes(self._buffer).strip()
+                self._buffer.clear()
+                if line:
+                    lines.append(line)
+
+        rest = chunk[start:]
+        if not self._skipping:
+            if len(self._buffer) + len(rest) > self.max_line_bytes:
+                self.too_long += 1
+                self._buffer.clear()
+                self._skipping = True
+            else:
+                self._buffer += rest
+        return lines
+
+    def close(self) -> List[bytes]:
+        line = bytes(self._buffer).strip()
+        self._buffer.clear()
+        return [line] if line and not self._skipping else []
+
+
+def parse_stream_header(line: bytes) -> Tuple[str, Dict[str, Any]]:
+    """
+    Токен проекта и общий контекст из первой строки потока
+    """
+    try:
+        header = json.loads(line)
+    except ValueError:
+        raise InvalidPayload("stream header: invalid JSON")
+    if not isinstance(header, dict) or not isinstance(header.get("project_token"), str):
+        raise InvalidPayload('stream header: expected {"project_token": ...}')
+    context = header.get("context")
+    if context is not None and not isinstance(context, dict):
+        raise InvalidPayload("context: expected object")
+    return header["project_token"], context or {}
+
+
+def parse_stream_lines(
+    lines: List[bytes],
+    token: str,
+    context: Dict[str, Any],
+    first_index: int = 0
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Разбирает строки-события; неверные строки пропускаются с описанием причины
+    """
+    events, errors = [], []
+    for index, line in enumerate(lines, first_index):
+        try:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise InvalidPayload(f"errors[{index}]: invalid JSON")
+            events.append(parse_error_event(item, index, token, context))
+        except InvalidPayload as e:
+            errors.append(str(e))
+    return events, errors
+
+
+class StreamResult:
+    """
+    Итог потока: счетчики, подтверждения последних записанных пакетов
+    и первые отклоненные строки. Память не растет с длиной потока
+    """
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.batch_count = 0
+        self.batches = deque(maxlen=STREAM_BATCH_DETAILS)
+        self.errors: List[str] = []
+
+    def ack(self, accepted: int):
+        self.accepted += accepted
+        self.batch_count += 1
+        self.batches.append({"batch": self.batch_count, "accepted": accepted})
+
+    def reject(self, errors: List[str]):
+        self.rejected += len(errors)
+        self.errors.extend(errors[:max(0, STREAM_ERROR_DETAILS - len(self.errors))])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "batch_count": self.batch_count,
+            "batches": list(self.batches),
+            "errors": self.errors,
+        }
+
+
+async def read_ndjson_stream(
+    stream: AsyncIterator[bytes],
+    on_header: Callable[[str, Dict[str, Any]], Awaitable[None]],
+    on_batch: Callable[[List[Dict[str, Any]]], Awaitable[None]],
+    result: StreamResult,
+    batch_size: int = STREAM_BATCH_SIZE,
+    flush_interval: float = STREAM_FLUSH_INTERVAL,
+    max_line_bytes: int = MAX_STREAM_LINE_BYTES
+):
+    """
+    Читает NDJSON-поток: on_header проверяет заголовок (и может бросить
+    исключение), on_batch записывает очередной пакет событий. Подтверждения
+    пакетов копятся в result, поэтому при ошибке записи видно, что уже записано
+    """
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=STREAM_READ_AHEAD)
+
+    async def pump():
+        # Чтение тела отдельно от разбора, чтобы неполный пакет записывался по таймеру
+        try:
+            async for chunk in stream:
+                await chunks.put(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await chunks.put(e)
+            return
+        await chunks.put(None)
+
+    decoder = NdjsonDecoder(max_line_bytes)
+    header: Optional[Tuple[str, Dict[str, Any]]] = None
+    pending: List[Dict[str, Any]] = []
+    index = 0
+    loop = asyncio.get_running_loop()
+    deadline: Optional[float] = None
+
+    async def flush(full_only: bool = False):
+        # Пишем пакеты не больше batch_size; full_only - только заполненные
+        nonlocal pending, deadline
+        while pending and (len(pending) >= batch_size or not full_only):
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            await on_batch(batch)
+            result.ack(len(batch))
+        if not pending:
+            deadline = None
+
+    reader = asyncio.create_task(pump())
+    try:
+        done = False
+        while not done:
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            try:
+                chunk = await asyncio.wait_for(chunks.get(), timeout)
+            except asyncio.TimeoutError:
+                await flush()
+                continue
+
+            if chunk is None:
+                lines, done = decoder.close(), True
+            elif isinstance(chunk, Exception):
+                raise chunk
+            else:
+                lines = decoder.feed(chunk)
+
+            if lines and header is None:
+                header = parse_stream_header(lines[0])
+                await on_header(*header)
+                lines = lines[1:]
+
+            if lines:
+                events, errors = parse_stream_lines(lines, header[0], header[1], index)
+                index += len(lines)
+                result.reject(errors)
+                pending.extend(events)
+                await flush(full_only=True)
+            if pending and deadline is None:
+                deadline = loop.time() + flush_interval
+
+        if header is None:
+            raise InvalidPayload("empty stream: expected header line")
+        await flush()
+    finally:
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        if decoder.too_long:
+            result.reject([f"line longer than {max_line_bytes} bytes skipped"] * decoder.too_long)
@@ -0,0 +1,206 @@
+"""
+Буфер отложенной записи ошибок (write-behind) с групповым коммитом.
+
+Обработчик запроса только складывает проверенные события в память и сразу
+отвечает 202; единственная фоновая задача раз в flush_interval секунд или
+по накоплении flush_max_events событий пишет все накопленное одной транзакцией.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Пакет для записи: список пар (проект, события) в порядке поступления
+FlushHandler = Callable[[List[Tuple[Any, List[Dict[str, Any]]]]], Awaitable[None]]
+
+
+class IngestBuffer:
+    """
+    Ограниченный буфер событий с фоновым писателем.
+
+    Объем ограничен max_events событиями: при переполнении submit возвращает
+    False, и API отвечает 503, чтобы SDK повторил отправку позже.
+    Неудачно записанный пакет возвращается в буфер и пишется снова с
+    нарастающей паузой. При остановке буфер записывается до конца.
+    """
+
+    def __init__(
+        self,
+        handler: FlushHandler,
+        flush_interval: float = 0.05,
+        flush_max_events: int = 1000,
+        max_events: int = 100000,
+        max_retries: int = 5,
+        retry_max_delay: float = 5.0
+    ):
+        self.handler = handler
+        self.flush_interval = flush_interval
+        self.flush_max_events = flush_max_events
+        self.max_events = max_events
+        self.max_retries = max_retries
+        self.retry_max_delay = retry_max_delay
+        self._failures = 0  # Неудачных записей подряд
+        self._inflight = 0  # Событий в пакете, который пишется сейчас
+
+        self._entries: Deque[Tuple[Any, List[Dict[str, Any]]]] = deque()
+        self._size = 0
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+        # Метрики
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.retried = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+
+    def submit(self, project: Any, events: List[Dict[str, Any]]) -> bool:
+        """
+        Кладет события проекта в буфер, не дожидаясь записи
+        """
+        if self._stopping or self._size + len(events) > self.max_events:
+            self.rejected += len(events)
+            return False
+
+        self._entries.append((project, events))
+        self._size += len(events)
+        self.accepted += len(events)
+        self.max_depth = max(self.max_depth, self._size)
+        if self._size >= self.flush_max_events:
+            self._wakeup.set()
+        return True
+
+    def _take(self) -> List[Tuple[Any, List[Dict[str, Any]]]]:
+        """
+        Забирает из буфера пакет примерно из flush_max_events событий
+        """
+        batch, taken = [], 0
+        while self._entries and taken < self.flush_max_events:
+            project, events = self._entries.popleft()
+            batch.append((project, events))
+            taken += len(events)
+        self._size -= taken
+        return batch
+
+    def _requeue(self, batch: List[Tuple[Any, List[Dict[str, Any]]]]):
+        """
+        Возвращает пакет в начало буфера: порядок записи сохраняется
+        """
+        self._entries.extendleft(reversed(batch))
+        self._size += sum(len(events) for _, events in batch)
+
+    async def _write_separately(self, batch: List[Tuple[Any, List[Dict[str, Any]]]]):
+        """
+        Последняя попытка: пишет пакет по одному запросу, чтобы одно
+        "ядовитое" событие не лишило записи остальные; отбрасывает только неудачные
+        """
+        for entry in batch:
+            count = len(entry[1])
+            try:
+                await self.handler([entry])
+                self.written += count
+            except Exception:
+                self.failed += count
+                logger.exception(f"Dropping {count} buffered error events after {self.max_retries} retries")
+
+    async def flush(self) -> bool:
+        """
+        Записывает один пакет из буфера. Если запись не удалась, пакет
+        возвращается в начало буфера (события уже подтверждены ответом 202);
+        после max_retries неудач подряд пакет пишется по одному запросу.
+        False - запись не удалась, перед следующей стоит подождать retry_delay()
+        """
+        batch = self._take()
+        if not batch:
+            return True
+
+        count = sum(len(events) for _, events in batch)
+        started = time.perf_counter()
+        self._inflight = count
+        try:
+            await self.handler(batch)
+            self.written += count
+            self._failures = 0
+            return True
+        except Exception:
+            self._failures += 1
+            if self._failures <= self.max_retries:
+                self.retried += count
+                logger.exception(f"Failed to write {count} buffered error events, retry {self._failures} of {self.max_retries}")
+                self._requeue(batch)
+                return False
+            logger.exception(f"Failed to write {count} buffered error events, writing them one request at a time")
+            self._failures = 0
+        finally:
+            self._inflight = 0
+            self.flushes += 1
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+        await self._write_separately(batch)
+        return True
+
+    def retry_delay(self) -> float:
+        """
+        Экспоненциальная пауза после неудачной записи
+        """
+        return min(self.retry_max_delay, self.flush_interval * 2 ** self._failures)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Под постоянной нагрузкой пишем пакет за пакетом, пока буфер не опустится ниже порога
+            while True:
+                if not await self.flush():
+                    await asyncio.sleep(self.retry_delay())
+                    break
+                if self._stopping or self._size < self.flush_max_events:
+                    break
+
+        # Остановка: дописываем все, что осталось (неудачные пакеты отбрасываются после max_retries)
+        while self._entries:
+            if not await self.flush():
+                await asyncio.sleep(self.retry_delay())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Перестает принимать события и ждет записи буфера (не дольше timeout)
+        """
+        if not self._task:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        done, _ = await asyncio.wait([self._task], timeout=timeout)
+        if not done:
+            logger.warning(f"Ingest buffer not drained, {self._size + self._inflight} error events lost")
+            # Писатель не должен работать с движком БД, который закрывается после остановки
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self._size,
+            "max_depth": self.max_depth,
+            "capacity": self.max_events,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "failed": self.failed,
+            "retried": self.retried,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
@@ -0,0 +1,135 @@
+"""
+Холодный архив ошибок: скорость переноса, размер и чтение страниц.
+
+Заполняет error_logs rows ошибками за months месяцев, переносит все месяцы,
+кроме последних трех, в архив (api.archive) и сравнивает размер базы
+(после VACUUM) с размером файлов архива, а также время страниц list_errors
+до и после переноса: из горячих строк, первую архивную и из середины
+архивного месяца:
+    python -m benchmarks.bench_archive --rows 1000000 --months 12
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+import api.archive
+from api.archive import add_months, archive_errors, month_start
+from api.pagination import encode_cursor, list_errors
+from database.models import Base, ErrorLog, Project
+
+STACK = "".join(f'  File "app/module_{i}.py", line {i * 7}, in handler_{i}\n    do_work()\n' for i in range(10))
+TYPES = ["ValueError", "KeyError", "TimeoutError", "ConnectionResetError", "ZeroDivisionError"]
+
+
+def fill(engine, rows, months, projects, now):
+    rng = random.Random(1)
+    started = add_months(month_start(now), -months + 1)
+    step = (now - started) / rows
+    with engine.begin() as conn:
+        conn.execute(insert(Project), [
+            {"id": i + 1, "name": f"p{i}", "type": "bot", "token": f"token-{i}"} for i in range(projects)
+        ])
+        for start in range(0, rows, 10000):
+            conn.execute(insert(ErrorLog), [{
+                "project_id": rng.randint(1, projects),
+                "error_type": rng.choice(TYPES),
+                "error_message": f"bad value {rng.randint(1, 100000)} for order {i}",
+                "stack_trace": STACK,
+                "additional_data": {"user_id": rng.randint(1, 5000), "path": "/api/orders"},
+                "severity_level": rng.choice(["error", "error", "warning", "critical"]),
+                "created_at": started + step * i,
+            } for i in range(start, min(rows, start + 10000))])
+
+
+def database_size(engine, path):
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    return os.path.getsize(path)
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names)
+
+
+async def pages(url, cursors, repeat):
+    engine = create_async_engine(url)
+    timings = {}
+    async with AsyncSession(engine) as db:
+        await list_errors(db, 1)
+        for name, cursor in cursors.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                errors, _ = await list_errors(db, 1, cursor=cursor, limit=50)
+            timings[name] = ((time.perf_counter() - started) / repeat, len(errors))
+    await engine.dispose()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--projects", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    now = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        directory = os.path.join(tmp, "archive")
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        fill(engine, args.rows, args.months, args.projects, now)
+        size_before = database_size(engine, path)
+
+        # Курсоры: середина горячих строк, граница архива и середина архивного месяца
+        cutoff = add_months(month_start(now), -3)
+        cold_month = add_months(cutoff, -2)
+        with Session(engine) as db:
+            def cursor_at(moment):
+                row = db.execute(
+                    select(ErrorLog.created_at, ErrorLog.id)
+                    .where(ErrorLog.project_id == 1, ErrorLog.created_at < moment)
+                    .order_by(ErrorLog.created_at.desc(), ErrorLog.id.desc()).limit(1)
+                ).one()
+                return encode_cursor(row.created_at, row.id)
+            cursors = {
+                "hot rows": cursor_at(cutoff + (now - cutoff) / 2),
+                "first archived page": cursor_at(cutoff),
+                "middle of archived month": cursor_at(cold_month + timedelta(days=15)),
+            }
+        url = f"sqlite+aiosqlite:///{path}"
+        before = asyncio.run(pages(url, cursors, args.repeat))
+
+        started = time.perf_counter()
+        with Session(engine) as db:
+            result = archive_errors(db, now, after_months=3, directory=directory)
+            hot_rows = db.scalar(select(func.count()).select_from(ErrorLog))
+        elapsed = time.perf_counter() - started
+        print(f"archived {result['archived_errors']} errors into {result['segments']} segments "
+              f"in {elapsed:.1f} s ({result['archived_errors'] / elapsed:.0f} rows/s), {hot_rows} left hot")
+
+        size_after = database_size(engine, path)
+        archive_size = directory_size(directory)
+        print(f"database: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB, "
+              f"archive files: {archive_size / 2**20:.1f} MiB "
+              f"({(size_before - size_after) / max(archive_size, 1):.1f}x smaller than the rows they replaced)")
+
+        # list_errors читает архив из каталога по умолчанию
+        api.archive.ERROR_ARCHIVE_DIR = directory
+        after = asyncio.run(pages(url, cursors, args.repeat))
+        for name in cursors:
+            print(f"{name:<26} before {before[name][0] * 1000:7.2f} ms  after {after[name][0] * 1000:7.2f} ms  "
+                  f"{after[name][1]} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Рассылка /broadcast: отправка по одному против bot.delivery.Broadcast.
+
+Заполняет временную базу subscribers подписчиками и рассылает им сообщение
+через заглушку бота с задержкой latency на запрос (сеть до Telegram);
+каждый blocked-й подписчик "заблокировал бота". Сравнивает прежний цикл
+(все подписчики одним запросом, send_message по одному) с параллельной
+отправкой под лимитом rate сообщений в секунду:
+    python -m benchmarks.bench_broadcast --subscribers 2000 --latency 0.15
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session, sessionmaker
+from telegram.error import Forbidden
+
+from bot.delivery import Broadcast
+from database.models import Base, Subscriber
+
+
+class LatencyBot:
+    def __init__(self, latency, blocked):
+        self.latency = latency
+        self.blocked = blocked
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        if self.blocked and chat_id % self.blocked == 0:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.sent += 1
+
+
+async def sequential(bot, engine):
+    """
+    Прежний обработчик /broadcast: сессия открыта на всю рассылку, отправка по одному
+    """
+    with Session(engine) as db:
+        for subscriber in db.query(Subscriber).all():
+            try:
+                await bot.send_message(chat_id=subscriber.telegram_id, text="📢 Объявление:\n\nbench")
+            except Exception:
+                pass
+
+
+def fill(engine, subscribers):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Subscriber), [{"telegram_id": 100000 + i} for i in range(subscribers)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.15, help="задержка одного send_message, секунд")
+    parser.add_argument("--blocked", type=int, default=50, help="каждый N-й подписчик заблокировал бота; 0 - никто")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, nargs="+", default=[25.0, 1000.0],
+                        help="лимит сообщений в секунду; несколько значений - прогон на каждое")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        session_factory = sessionmaker(bind=engine)
+
+        fill(engine, args.subscribers)
+        bot = LatencyBot(args.latency, args.blocked)
+        started = time.perf_counter()
+        asyncio.run(sequential(bot, engine))
+        elapsed = time.perf_counter() - started
+        print(f"{'sequential':<28} {elapsed:7.1f} s  {args.subscribers / elapsed:6.1f} msg/s  sent {bot.sent}")
+
+        for rate in args.rate:
+            fill(engine, args.subscribers)
+            bot = LatencyBot(args.latency, args.blocked)
+            delivery = Broadcast(bot, "bench", session_factory, concurrency=args.concurrency, rate=rate)
+            started = time.perf_counter()
+            result = asyncio.run(delivery.run())
+            elapsed = time.perf_counter() - started
+            print(f"{f'Broadcast, rate {rate:g}/s':<28} {elapsed:7.1f} s  {args.subscribers / elapsed:6.1f} msg/s  "
+                  f"sent {result['sent']}, pruned {result['pruned']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Задержка API под нагрузкой множества параллельных SDK-клиентов.
+
+Без --url поднимает uvicorn с временной SQLite-базой и заглушкой бота:
+    python -m benchmarks.bench_concurrency --clients 500 --requests 4
+    python -m benchmarks.bench_concurrency --clients 500 --requests 4 --ingest-mode buffered
+    python -m benchmarks.bench_concurrency --clients 500 --requests 4 --endpoint heartbeat
+Рост пропускной способности с числом процессов uvicorn (по прогону на каждое число).
+Сервер и генератор нагрузки должны работать на разных ядрах, иначе они делят CPU
+и прироста не видно:
+    python -m benchmarks.bench_concurrency --clients 200 --requests 5 --ingest-mode buffered --workers 1 2 4 \
+        --server-cpus 0-3 --client-cpus 4-5
+Против уже запущенного API (токен активного проекта обязателен):
+    python -m benchmarks.bench_concurrency --url http://localhost:8000/api/v1 --token ...
+"""
+import argparse
+import asyncio
+import collections
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import aiohttp
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from database.models import Base, Project
+
+TOKEN = "bench-token"
+
+
+def parse_cpus(value: str) -> set:
+    """
+    Список ядер в формате taskset: "0-3,6" -> {0, 1, 2, 3, 6}
+    """
+    cpus = set()
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(tmp: str, workers: int = 1, ingest_mode: str = "direct", cpus: set = None):
+    """
+    Запускает API в отдельном процессе с чистой базой, возвращает (процесс, url).
+    cpus - ядра, к которым привязан сервер вместе с процессами uvicorn
+    """
+    database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(Project(name="bench", type="bot", token=TOKEN, is_active=True))
+        db.commit()
+    engine.dispose()
+
+    port = free_port()
+    env = {**os.environ, "DATABASE_URL": database_url, "NOTIFICATION_BOT_FAKE": "1", "INGEST_MODE": ingest_mode,
+           "API_WORKERS": str(workers)}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+        preexec_fn=(lambda: os.sched_setaffinity(0, cpus)) if cpus else None
+    )
+    url = f"http://127.0.0.1:{port}/api/v1"
+    deadline = time.monotonic() + 180
+    while True:
+        try:
+            urllib.request.urlopen(f"{url}/metrics", timeout=1).close()
+            return process, url
+        except OSError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.terminate()
+                raise RuntimeError("API server did not start")
+            time.sleep(0.2)
+
+
+async def client(session, url, token, requests, latencies, errors, endpoint="log"):
+    for i in range(requests):
+        if endpoint == "heartbeat":
+            payload = {"project_token": token, "status": "alive", "version": "1.0"}
+        else:
+            payload = {"errors": [{
+                "project_token": token,
+                "error": {"type": "ValueError", "message": f"bench {i}", "severity": "error"}
+            }]}
+        started = time.perf_counter()
+        try:
+            async with session.post(f"{url}/{endpoint}", json=payload) as response:
+                await response.read()
+                if response.status >= 300:
+                    errors.append(response.status)
+        except Exception as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - started)
+
+
+async def probe(session, url, latencies, stop):
+    """
+    Опрашивает /metrics (не трогает БД): его задержка показывает, блокируется ли event loop
+    """
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with session.get(f"{url}/metrics") as response:
+            await response.read()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+
+async def run_load(url, token, clients, requests, endpoint="log"):
+    latencies, errors, probe_latencies = [], [], []
+    stop = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=clients + 1)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        prober = asyncio.create_task(probe(session, url, probe_latencies, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client(session, url, token, requests, latencies, errors, endpoint) for _ in range(clients)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+    return latencies, errors, elapsed, probe_latencies
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+    return f"p50: {p50:.1f} ms  p99: {p99:.1f} ms  max: {latencies[-1] * 1000:.1f} ms"
+
+
+def report(latencies, errors, elapsed, probe_latencies, endpoint="log"):
+    print(f"requests: {len(latencies)}  errors: {len(errors)}  time: {elapsed:.2f} s  rps: {len(latencies) / elapsed:.0f}")
+    print(f"{'/' + endpoint:<12}{percentiles(latencies)}")
+    if probe_latencies:
+        print(f"/metrics    {percentiles(probe_latencies)}")
+    if errors:
+        print(f"errors by kind: {dict(collections.Counter(errors))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url")
+    parser.add_argument("--token", default=TOKEN)
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=4, help="запросов на клиента")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1],
+                        help="процессов uvicorn для локального сервера; несколько значений - прогон на каждое")
+    parser.add_argument("--ingest-mode", choices=["direct", "buffered"], default="direct",
+                        help="INGEST_MODE локального сервера")
+    parser.add_argument("--endpoint", choices=["log", "heartbeat"], default="log")
+    parser.add_argument("--server-cpus", type=parse_cpus, help="ядра локального сервера, например 0-3 (только Linux)")
+    parser.add_argument("--client-cpus", type=parse_cpus, help="ядра генератора нагрузки, например 4-5 (только Linux)")
+    args = parser.parse_args()
+
+    if args.client_cpus:
+        os.sched_setaffinity(0, args.client_cpus)
+
+    if args.url:
+        report(*asyncio.run(run_load(args.url, args.token, args.clients, args.requests, args.endpoint)), args.endpoint)
+        return
+
+    server_cpus = len(args.server_cpus) if args.server_cpus else available_cpus()
+    separate = args.server_cpus and args.client_cpus and not args.server_cpus & args.client_cpus
+    if len(args.workers) > 1 and (not separate or max(args.workers) > server_cpus):
+        # Без отдельных ядер сервер и клиент делят CPU, и результат показывает конкуренцию за него, а не масштабирование
+        print(f"warning: {available_cpus()} CPU available to the load generator, server pinned to "
+              f"{args.server_cpus or 'all'}; scaling numbers are only meaningful with --server-cpus covering "
+              f"{max(args.workers)} cores and --client-cpus on other cores", file=sys.stderr)
+
+    throughput = {}
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            process, url = start_server(tmp, workers, args.ingest_mode, args.server_cpus)
+            try:
+                if len(args.workers) > 1:
+                    print(f"--- workers: {workers}")
+                result = asyncio.run(run_load(url, args.token, args.clients, args.requests, args.endpoint))
+                report(*result, args.endpoint)
+                throughput[workers] = len(result[0]) / result[2]
+            finally:
+                process.terminate()
+                process.wait()
+
+    if len(throughput) > 1:
+        base = throughput[args.workers[0]]
+        for workers, rps in throughput.items():
+            print(f"workers {workers:>2}: {rps:7.0f} rps  x{rps / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
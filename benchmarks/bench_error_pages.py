@@ -0,0 +1,99 @@
+"""
+Постраничное чтение ошибок проекта: курсор (keyset) против OFFSET.
+
+Заполняет проект rows ошибками с трейсбеками и читает страницы на разной
+глубине через list_errors с курсором и через тот же запрос с OFFSET, а
+также первую страницу с include_details и без:
+    python -m benchmarks.bench_error_pages --rows 1000000 --limit 50
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from api.pagination import LIST_COLUMNS, encode_cursor, list_errors
+from database.models import Base, ErrorLog, Project
+
+STACK = "".join(f'  File "app/module_{i}.py", line {i * 7}, in handler_{i}\n    do_work()\n' for i in range(10))
+
+
+def fill(url, rows):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    started = datetime(2026, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Project), [{"id": 1, "name": "bench", "type": "bot", "token": "bench-token"}])
+        for start in range(0, rows, 10000):
+            conn.execute(insert(ErrorLog), [{
+                "project_id": 1,
+                "error_type": "ValueError",
+                "error_message": f"bad value {i}",
+                "stack_trace": STACK,
+                "additional_data": {"user_id": i, "path": "/api/orders"},
+                "severity_level": "error",
+                # Пакеты по 100 событий с одним временем записи, как при приеме
+                "created_at": started + timedelta(seconds=i // 100),
+            } for i in range(start, min(rows, start + 10000))])
+    engine.dispose()
+
+
+async def timed(name, repeat, query):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        count = await query()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{name:<42} {elapsed * 1000:8.2f} ms  {count} rows")
+
+
+async def run(url, rows, limit, repeat):
+    engine = create_async_engine(url)
+    async with AsyncSession(engine) as db:
+        async def keyset_page(**options):
+            errors, _ = await list_errors(db, 1, limit=limit, **options)
+            return len(errors)
+
+        # Прогрев: соединение и кэш страниц SQLite
+        await keyset_page()
+        await timed("first page", repeat, keyset_page)
+        await timed("first page, include_details", repeat, lambda: keyset_page(include_details=True))
+
+        for depth in (rows // 10, rows // 2, rows - limit * 2):
+            # Курсор на строку глубины depth, как если бы клиент дошел до нее по страницам
+            row = (await db.execute(
+                select(ErrorLog.created_at, ErrorLog.id).where(ErrorLog.project_id == 1)
+                .order_by(ErrorLog.created_at.desc(), ErrorLog.id.desc()).offset(depth - 1).limit(1)
+            )).one()
+            cursor = encode_cursor(row.created_at, row.id)
+
+            async def offset_page():
+                result = await db.execute(
+                    select(*LIST_COLUMNS).where(ErrorLog.project_id == 1)
+                    .order_by(ErrorLog.created_at.desc(), ErrorLog.id.desc()).offset(depth).limit(limit)
+                )
+                return len(result.all())
+
+            await timed(f"row {depth}: cursor", repeat, lambda: keyset_page(cursor=cursor))
+            await timed(f"row {depth}: OFFSET", repeat, offset_page)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        fill(f"sqlite:///{path}", args.rows)
+        asyncio.run(run(f"sqlite+aiosqlite:///{path}", args.rows, args.limit, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
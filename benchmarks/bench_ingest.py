@@ -0,0 +1,113 @@
+"""
+Сравнение скорости записи ошибок: по одной на запрос против пакетов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ingest --events 5000 --batch-size 100
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from api.ingest import build_error_rows, ingest_error_events, insert_error_rows, parse_error_payload
+from database.models import Base, ErrorLog, Project
+
+TOKEN = "bench-token"
+
+
+def make_event(i: int) -> dict:
+    return {
+        "project_token": TOKEN,
+        "error": {
+            "type": "ZeroDivisionError",
+            "message": f"division by zero #{i}",
+            "stack_trace": '  File "app.py", line 10, in handler\n    1/0\n',
+            "severity": "error",
+            "context": {"system_info": {"python_version": "3.11", "platform": "Linux"}},
+        },
+    }
+
+
+def lookup_project(db):
+    return db.query(Project).filter(Project.token == TOKEN, Project.is_active == True).first()
+
+
+def run_single(Session, events):
+    """Старый путь: поиск токена, вставка и коммит на каждое событие"""
+    db = Session()
+    try:
+        for item in events:
+            token, parsed = parse_error_payload(item)
+            project = lookup_project(db)
+            for row in build_error_rows(project.id, parsed):
+                db.add(ErrorLog(**row))
+            db.commit()
+    finally:
+        db.close()
+
+
+def run_batched(Session, events, batch_size):
+    """Новый путь: один поиск токена, executemany и коммит на пакет"""
+    db = Session()
+    try:
+        for start in range(0, len(events), batch_size):
+            token, parsed = parse_error_payload({"errors": events[start:start + batch_size]})
+            project = lookup_project(db)
+            insert_error_rows(db, build_error_rows(project.id, parsed))
+            db.commit()
+    finally:
+        db.close()
+
+
+def run_grouped(Session, events, batch_size):
+    """Пакеты с группировкой: счетчики групп и ограниченное число полных записей"""
+    db = Session()
+    try:
+        for start in range(0, len(events), batch_size):
+            token, parsed = parse_error_payload({"errors": events[start:start + batch_size]})
+            project = lookup_project(db)
+            ingest_error_events(db, project.id, parsed)
+            db.commit()
+    finally:
+        db.close()
+
+
+def measure(name, fn, *args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        db.add(Project(name="bench", type="bot", token=TOKEN, is_active=True))
+        db.commit()
+        db.close()
+
+        events = args[0]
+        started = time.perf_counter()
+        fn(Session, *args)
+        elapsed = time.perf_counter() - started
+        engine.dispose()
+
+    rate = len(events) / elapsed
+    print(f"{name:<10} {len(events):>8} events  {elapsed:8.3f} s  {rate:10.0f} events/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    events = [make_event(i) for i in range(args.events)]
+    single = measure("single", run_single, events)
+    batched = measure("batched", run_batched, events, args.batch_size)
+    measure("grouped", run_grouped, events, args.batch_size)
+    print(f"speedup: x{batched / single:.1f}")
+
+
+if __name__ == "__main__":
+    main()
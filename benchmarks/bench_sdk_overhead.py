@@ -0,0 +1,78 @@
+"""
+Стоимость ErrorMonitor.log_error для приложения во время шторма ошибок.
+
+Горячий цикл выбрасывает одну и ту же ошибку; сравниваются вызовы без
+схлопывания повторов (dedup_window=0), со схлопыванием и с выборкой по типу.
+Сеть не участвует: транспорт-заглушка сразу отвечает 200.
+    python -m benchmarks.bench_sdk_overhead --events 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sdk", "python"))
+from error_monitor import ErrorMonitor  # noqa: E402
+
+
+class NullTransport:
+    def __init__(self):
+        self.events = 0
+
+    def send(self, path, payload):
+        if path == "log":
+            self.events += sum(event["error"].get("count", 1) for event in payload["errors"])
+        return 200, ""
+
+    def close(self):
+        pass
+
+
+def handler(depth, user_id):
+    if depth == 0:
+        return {"user": user_id}["missing"]
+    return handler(depth - 1, user_id)
+
+
+def baseline(events, distinct):
+    started = time.perf_counter()
+    for i in range(events):
+        try:
+            handler(10 + i % distinct, i)
+        except KeyError:
+            pass
+    elapsed = time.perf_counter() - started
+    print(f"{'raise only, no SDK':<26} {elapsed / events * 1e6:7.1f} us/call")
+
+
+def run(name, events, distinct, **options):
+    transport = NullTransport()
+    monitor = ErrorMonitor("bench-token", batch_size=100, flush_interval=1,
+                           max_queue_size=events, transport=transport, **options)
+    started = time.perf_counter()
+    for i in range(events):
+        try:
+            handler(10 + i % distinct, i)
+        except KeyError as e:
+            monitor.log_error(e, context={"request": i})
+    elapsed = time.perf_counter() - started
+    monitor.close()
+    stats = monitor.stats()
+    print(f"{name:<26} {elapsed / events * 1e6:7.1f} us/call  sent {stats['sent']:>6} events  "
+          f"counted {transport.events:>6}  deduplicated {stats['deduplicated']:>6}  sampled out {stats['sampled_out']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+
+    baseline(args.events, 1)
+    run("no dedup", args.events, 1, dedup_window=0)
+    run("dedup", args.events, 1)
+    run("dedup, 50 stack depths", args.events, 50)
+    run("no dedup, sample 10%", args.events, 1, dedup_window=0, sample_rates={"KeyError": 0.1})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Пропускная способность транспорта Python SDK (событий в секунду).
+
+Поднимает локальный HTTP-сервер-заглушку (keep-alive, отвечает 200 сразу)
+и отправляет одни и те же пакеты ошибок разными способами: как раньше
+(requests.post и новая aiohttp-сессия на каждый вызов) и через
+RequestsTransport / AiohttpTransport с пулом соединений и gzip:
+    python -m benchmarks.bench_sdk_transport --batches 500 --batch-size 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import aiohttp
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sdk", "python"))
+from error_monitor import AiohttpTransport, RequestsTransport, encode_body  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Как uvicorn: TCP_NODELAY, иначе заголовки и тело ответа ждут delayed ACK
+    disable_nagle_algorithm = True
+    received = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StubHandler.received += len(body)
+        response = b'{"status":"ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_batch(batch_size):
+    def fail(depth):
+        if depth == 0:
+            raise ValueError("invalid literal for int() with base 10: 'abc'")
+        fail(depth - 1)
+
+    try:
+        fail(8)
+    except ValueError:
+        stack = traceback.format_exc()
+    return {"errors": [{
+        "project_token": "bench-token",
+        "error_type": "ValueError",
+        "error_message": f"invalid literal for int() with base 10: 'abc' ({i})",
+        "stack_trace": stack,
+        "severity_level": "error",
+        "timestamp": "2024-01-01T00:00:00",
+        "context": {"user_id": i, "path": "/api/orders", "method": "POST"},
+    } for i in range(batch_size)]}
+
+
+def report(name, batches, batch_size, elapsed, sent_bytes):
+    events = batches * batch_size
+    print(f"{name:<28} {events:>7} events  {elapsed:7.2f} s  {events / elapsed:9.0f} events/s  "
+          f"{sent_bytes / batches / 1024:7.1f} KiB/batch")
+
+
+def run_sync(name, url, payload, batches, batch_size, send):
+    StubHandler.received = 0
+    started = time.perf_counter()
+    for _ in range(batches):
+        status, _ = send(url, payload)
+        assert status == 200, status
+    report(name, batches, batch_size, time.perf_counter() - started, StubHandler.received)
+
+
+def run_async(name, payload, batches, batch_size, send, close=None):
+    StubHandler.received = 0
+
+    async def main():
+        started = time.perf_counter()
+        for _ in range(batches):
+            status, _ = await send(payload)
+            assert status == 200, status
+        elapsed = time.perf_counter() - started
+        if close:
+            # Общая сессия закрывается в том же event loop, где создана
+            await close()
+        return elapsed
+
+    elapsed = asyncio.run(main())
+    report(name, batches, batch_size, elapsed, StubHandler.received)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batches", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=10)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    payload = make_batch(args.batch_size)
+    raw, _ = encode_body(payload, compress=False)
+    packed, _ = encode_body(payload)
+    print(f"batch of {args.batch_size}: {len(raw)} bytes JSON, {len(packed)} bytes gzip")
+
+    def post_per_call(url, payload):
+        response = requests.post(f"{url}/log", json=payload, timeout=5)
+        return response.status_code, response.text
+
+    run_sync("requests.post per batch", url, payload, args.batches, args.batch_size, post_per_call)
+    for compress in (False, True):
+        transport = RequestsTransport(url, compress=compress)
+        run_sync(f"RequestsTransport gzip={compress}", url, payload, args.batches, args.batch_size,
+                 lambda url, payload: transport.send("log", payload))
+        transport.close()
+
+    async def session_per_call(payload):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"{url}/log", json=payload) as response:
+                return response.status, await response.text()
+
+    run_async("aiohttp session per call", payload, args.batches, args.batch_size, session_per_call)
+    for compress in (False, True):
+        transport = AiohttpTransport(url, compress=compress)
+        run_async(f"AiohttpTransport gzip={compress}", payload, args.batches, args.batch_size,
+                  lambda payload: transport.send("log", payload), close=transport.close)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
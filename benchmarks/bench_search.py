@@ -0,0 +1,112 @@
+"""
+Задержка полнотекстового поиска ошибок (FTS5) на синтетическом корпусе.
+
+Заполняет error_logs rows ошибками с разными типами, сообщениями и
+трейсбеками (индекс обновляется триггерами, как при приеме) и измеряет
+p50/p95 search_errors для редких и частых слов, нескольких слов, префикса,
+с фильтром по проекту и окну времени:
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from api.search import search_errors
+from database.models import Base, ErrorLog, Project
+
+ERRORS = [
+    ("ConnectionResetError", "[Errno 104] Connection reset by peer"),
+    ("TimeoutError", "timed out waiting for {service} after {n} s"),
+    ("KeyError", "'{field}'"),
+    ("ValueError", "invalid literal for int() with base 10: '{field}'"),
+    ("ZeroDivisionError", "division by zero"),
+    ("PermissionError", "[Errno 13] Permission denied: '/var/data/{field}.json'"),
+    ("AttributeError", "'NoneType' object has no attribute '{field}'"),
+    ("HTTPError", "502 Bad Gateway from {service}"),
+]
+SERVICES = ["payments", "billing", "inventory", "search", "auth", "notifications", "geo", "reports"]
+FIELDS = ["user_id", "order_id", "amount", "currency", "email", "token", "sku", "address", "status", "quantity"]
+HANDLERS = [f"{verb}_{noun}" for verb in ("process", "update", "create", "sync", "validate", "render")
+            for noun in ("order", "invoice", "user", "cart", "report", "payment", "shipment")]
+
+
+def make_row(rng, i, projects, started):
+    error_type, template = rng.choice(ERRORS)
+    handler = rng.choice(HANDLERS)
+    service = rng.choice(SERVICES)
+    stack = "Traceback (most recent call last):\n" + "".join(
+        f'  File "app/{rng.choice(SERVICES)}/{name}.py", line {rng.randint(10, 900)}, in {name}\n    {name}(request)\n'
+        for name in rng.sample(HANDLERS, 6) + [handler]
+    ) + f"{error_type}: ..."
+    return {
+        "project_id": rng.randint(1, projects),
+        "error_type": error_type,
+        "error_message": template.format(service=service, n=rng.randint(1, 60), field=rng.choice(FIELDS))
+                         + f" (request {i:08x})",
+        "stack_trace": stack,
+        "severity_level": "error",
+        "additional_data": {},
+        "created_at": started + timedelta(seconds=i * 2),
+    }
+
+
+def fill(engine, rows, projects):
+    rng = random.Random(1)
+    started = datetime.now() - timedelta(seconds=rows * 2)
+    with Session(engine) as db:
+        db.add_all(Project(id=i + 1, name=f"p{i}", type="bot", token=f"token-{i}") for i in range(projects))
+        db.commit()
+    begin = time.perf_counter()
+    with engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            conn.execute(insert(ErrorLog), [make_row(rng, i, projects, started) for i in range(start, min(rows, start + 10000))])
+    elapsed = time.perf_counter() - begin
+    print(f"filled {rows} rows with FTS triggers in {elapsed:.1f} s ({rows / elapsed:.0f} rows/s)")
+
+
+def measure(db, name, repeat, **options):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = search_errors(db, **options)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<46} p50 {statistics.median(timings) * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms  {len(results)} results")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        fill(engine, args.rows, args.projects)
+
+        last_week = datetime.now() - timedelta(days=7)
+        with Session(engine) as db:
+            measure(db, "rare word: one request id", args.repeat, query=f"{args.rows // 2:08x}")
+            measure(db, "type in 1/8 of rows: PermissionError", args.repeat, query="PermissionError")
+            measure(db, "word in every row: Traceback", args.repeat, query="Traceback")
+            measure(db, "two words: ConnectionResetError process_order", args.repeat,
+                    query="ConnectionResetError process_order")
+            measure(db, "prefix: Timeout*", args.repeat, query="Timeout*")
+            measure(db, "two words, one project", args.repeat,
+                    query="ConnectionResetError process_order", project_ids=[1])
+            measure(db, "two words, one project, last week", args.repeat,
+                    query="ConnectionResetError process_order", project_ids=[1], since=last_week)
+
+
+if __name__ == "__main__":
+    main()
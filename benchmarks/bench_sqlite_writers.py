@@ -0,0 +1,88 @@
+"""
+Пропускная способность нескольких процессов-писателей в один файл SQLite.
+
+Сравнивает настройки SQLite по умолчанию и PRAGMA из database.database
+(WAL, synchronous=NORMAL, busy_timeout, mmap_size, cache_size):
+    python -m benchmarks.bench_sqlite_writers --processes 4 --writes 500
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database.database import create_sync_engine
+from database.models import Base, ErrorLog, Project
+
+
+def writer(url, tuned, writes, results):
+    """
+    Как прием ошибок: чтение проекта, вставка записи и коммит на каждую запись
+    """
+    engine = create_sync_engine(url, tuned=tuned)
+    done = locked = 0
+    with Session(engine) as db:
+        for i in range(writes):
+            try:
+                project_id = db.execute(text("SELECT id FROM projects LIMIT 1")).scalar()
+                db.add(ErrorLog(
+                    project_id=project_id,
+                    error_type="ValueError",
+                    error_message=f"write {i}",
+                    severity_level="error"
+                ))
+                db.commit()
+                done += 1
+            except OperationalError:
+                db.rollback()
+                locked += 1
+    engine.dispose()
+    results.put((done, locked))
+
+
+def run(processes, writes, tuned):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        engine = create_sync_engine(url, tuned=tuned)
+        Base.metadata.create_all(engine)
+        with Session(engine) as db:
+            db.add(Project(name="bench", type="bot", token="bench-token", is_active=True))
+            db.commit()
+        engine.dispose()
+
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=writer, args=(url, tuned, writes, results))
+            for _ in range(processes)
+        ]
+        started = time.perf_counter()
+        for process in workers:
+            process.start()
+        totals = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+    done = sum(d for d, _ in totals)
+    locked = sum(l for _, l in totals)
+    name = "tuned" if tuned else "default"
+    print(f"{name:<8} {processes} processes  {done:>6} commits  {locked:>5} locked  "
+          f"{elapsed:7.2f} s  {done / elapsed:8.0f} commits/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--writes", type=int, default=500, help="коммитов на процесс")
+    args = parser.parse_args()
+
+    run(args.processes, args.writes, tuned=False)
+    run(args.processes, args.writes, tuned=True)
+
+
+if __name__ == "__main__":
+    main()
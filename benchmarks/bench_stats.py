@@ -0,0 +1,96 @@
+"""
+Время статистики ошибок: COUNT по error_logs против счетчиков error_counters.
+
+Заполняет error_logs и счетчики одними и теми же событиями за последние
+30 дней и сравнивает старый запрос (COUNT(*) по таблице и по окну 24 часа)
+с чтением счетчиков:
+    python -m benchmarks.bench_stats --projects 20 --events 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from api.counters import add_error_counts, count_errors, counter_rows
+from database.models import Base, ErrorLog, Project
+
+SEVERITIES = ("info", "warning", "error", "critical")
+
+
+def fill(Session, projects, events):
+    now = datetime.now()
+    random.seed(1)
+    db = Session()
+    db.add_all(Project(name=f"p{i}", type="bot", token=f"token-{i}") for i in range(projects))
+    db.flush()
+    for start in range(0, events, 5000):
+        rows = [{
+            "project_id": random.randint(1, projects),
+            "error_type": "ValueError",
+            "error_message": "bad value",
+            "severity_level": random.choice(SEVERITIES),
+            "additional_data": {},
+            "created_at": now - timedelta(seconds=random.randint(0, 30 * 86400)),
+        } for _ in range(min(5000, events - start))]
+        db.execute(insert(ErrorLog), rows)
+        # Приращения одного счетчика складываются до записи
+        increments = {}
+        for row in rows:
+            for counter in counter_rows(row["project_id"], [{"severity": row["severity_level"]}], row["created_at"]):
+                key = (counter["project_id"], counter["period"], counter["period_start"], counter["severity_level"])
+                increments[key] = increments.get(key, 0) + counter["count"]
+        add_error_counts(db, [
+            {"project_id": p, "period": period, "period_start": start, "severity_level": severity, "count": count}
+            for (p, period, start, severity), count in increments.items()
+        ])
+        db.commit()
+    db.close()
+
+
+def timed(name, repeat, query):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = query()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{name:<40} {elapsed * 1000:8.2f} ms  -> {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        fill(Session, args.projects, args.events)
+
+        db = Session()
+        since = datetime.now() - timedelta(days=1)
+        timed("COUNT(*) error_logs", args.repeat,
+              lambda: db.scalar(select(func.count()).select_from(ErrorLog)))
+        timed("COUNT by project, severity, 24h", args.repeat,
+              lambda: len(db.execute(
+                  select(ErrorLog.project_id, ErrorLog.severity_level, func.count())
+                  .where(ErrorLog.created_at >= since)
+                  .group_by(ErrorLog.project_id, ErrorLog.severity_level)
+              ).all()))
+        timed("counters: total", args.repeat,
+              lambda: sum(sum(s.values()) for s in count_errors(db).values()))
+        timed("counters: by project, severity, 24h", args.repeat,
+              lambda: sum(len(s) for s in count_errors(db, since).values()))
+        timed("counters: by project, severity, 30 days", args.repeat,
+              lambda: sum(len(s) for s in count_errors(db, datetime.now() - timedelta(days=30)).values()))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
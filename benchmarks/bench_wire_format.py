@@ -0,0 +1,106 @@
+"""
+Размер пакетов ошибок на проводе и время их разбора сервером.
+
+Кодирует одни и те же события так, как их отправляет Python SDK: старый
+формат (токен и system_info в каждом событии) и конверт пакета (токен и
+общий контекст один раз), в JSON и msgpack, без сжатия, gzip и zstd.
+Разбор - тот же путь, что в API: распаковка, decode_payload, parse_error_payload:
+    python -m benchmarks.bench_wire_format --events 10000 --batch-size 100
+"""
+import argparse
+import os
+import platform
+import sys
+import time
+import traceback
+
+from api.codec import decode_payload, decompress
+from api.ingest import parse_error_payload
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sdk", "python"))
+from error_monitor import encode_body  # noqa: E402
+
+SYSTEM_INFO = {
+    "python_version": sys.version,
+    "platform": platform.platform(),
+    "processor": platform.processor(),
+    "machine": platform.machine(),
+}
+
+
+def make_events(count):
+    def fail(depth, order_id):
+        if depth == 0:
+            raise ValueError(f"order {order_id} has invalid status 'archived'")
+        fail(depth - 1, order_id)
+
+    events = []
+    for i in range(count):
+        try:
+            fail(6 + i % 4, 1000 + i)
+        except ValueError as e:
+            events.append({
+                "type": e.__class__.__name__,
+                "message": str(e),
+                "stack_trace": "".join(traceback.format_tb(e.__traceback__)),
+                "severity": "error",
+                "timestamp": "2024-01-01T12:00:00.000000",
+                "context": {"user_id": i, "handler": "orders.update"},
+            })
+    return events
+
+
+def per_event_batch(events):
+    return {"errors": [
+        {"project_token": "bench-token", "error": {**event, "context": {**event["context"], "system_info": SYSTEM_INFO}}}
+        for event in events
+    ]}
+
+
+def envelope_batch(events):
+    return {
+        "project_token": "bench-token",
+        "context": {"system_info": SYSTEM_INFO},
+        "errors": [{"error": event} for event in events],
+    }
+
+
+def run(name, batches, wire_format, compress):
+    bodies = [encode_body(batch, compress, wire_format=wire_format) for batch in batches]
+    size = sum(len(body) for body, _ in bodies)
+
+    started = time.perf_counter()
+    events = 0
+    for body, headers in bodies:
+        encoding = headers.get("Content-Encoding")
+        if encoding:
+            body = decompress(body, encoding.encode())
+        _, parsed = parse_error_payload(decode_payload(body, headers["Content-Type"]))
+        events += len(parsed)
+    elapsed = time.perf_counter() - started
+
+    print(f"{name:<30} {size / 1024:9.1f} KiB  {size / events:7.1f} B/event  "
+          f"decode {elapsed * 1000 * 10000 / events:7.1f} ms/10k events")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    chunks = [events[i:i + args.batch_size] for i in range(0, len(events), args.batch_size)]
+    layouts = {
+        "per-event": [per_event_batch(chunk) for chunk in chunks],
+        "envelope": [envelope_batch(chunk) for chunk in chunks],
+    }
+
+    for layout, batches in layouts.items():
+        for wire_format in ("json", "msgpack"):
+            for compress in (False, "gzip", "zstd"):
+                run(f"{layout} {wire_format} {compress or 'identity'}", batches, wire_format, compress)
+
+
+if __name__ == "__main__":
+    main()
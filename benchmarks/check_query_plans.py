@@ -0,0 +1,241 @@
+"""
+Проверка планов запросов SQLite: частые запросы к error_logs, heartbeats
+и счетчикам должны идти по индексам, а не полным просмотром таблицы.
+
+Проверяются не копии SQL, а запросы, которые на самом деле отправляют
+функции API (list_errors, search_errors, архив, свертка и очистка
+heartbeat): каждая вызывается на заполненной базе, ее SQL перехватывается
+и проверяется через EXPLAIN QUERY PLAN с теми же параметрами.
+
+Завершается с кодом 1, если хотя бы одна функция не использует ожидаемый
+индекс или просматривает большую таблицу целиком:
+    python -m benchmarks.check_query_plans
+Та же проверка входит в тесты (tests/test_query_plans.py).
+"""
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Callable, List, Tuple
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from api.archive import delete_archived_chunk, months_to_archive
+from api.counters import count_errors
+from api.ingest import ingest_error_events, resolve_error_group
+from api.liveness import LivenessTracker
+from api.pagination import encode_cursor, list_errors
+from api.retention import delete_heartbeats_chunk, rollup_hours
+from api.search import search_errors
+from database.models import Base, ErrorArchive, ErrorGroup, ErrorLog, Heartbeat, HeartbeatRollup, Project
+
+SINCE = datetime(2026, 1, 1)
+
+# Полный просмотр этих таблиц на больших базах недопустим
+LARGE_TABLES = {"error_logs", "heartbeats", "error_counters"}
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def _segment() -> ErrorArchive:
+    return ErrorArchive(project_id=1, period_start=SINCE, min_id=100, max_id=7000)
+
+
+# (описание, функция от сессии, индекс, который должен быть в плане).
+# Функции от AsyncSession возвращают корутину. Проверки идут по порядку на одной
+# базе: незакоммиченное откатывается, а удаление порций коммитит сама функция
+CHECKS: List[Tuple[str, Callable[[Any], Any], str]] = [
+    (
+        "первая страница ошибок проекта",
+        lambda db: list_errors(db, 1),
+        "ix_error_logs_project_created",
+    ),
+    (
+        "страница ошибок проекта после курсора",
+        lambda db: list_errors(db, 1, cursor=encode_cursor(SINCE + timedelta(days=5), 7000)),
+        "ix_error_logs_project_created",
+    ),
+    (
+        "нерешенные ошибки проекта",
+        lambda db: list_errors(db, 1, is_resolved=False),
+        "ix_error_logs_project_resolved_created",
+    ),
+    (
+        "страница ошибок проекта по важности",
+        lambda db: list_errors(db, 1, severity="critical"),
+        "ix_error_logs_project_severity_created",
+    ),
+    (
+        "страница ошибок проекта по типу",
+        lambda db: list_errors(db, 1, error_type="KeyError"),
+        "ix_error_logs_project_type_created",
+    ),
+    (
+        "ошибки проекта за период",
+        lambda db: list_errors(db, 1, since=SINCE, until=SINCE + timedelta(days=3)),
+        "ix_error_logs_project_created",
+    ),
+    (
+        "поиск ошибок проекта",
+        lambda db: search_errors(db, "KeyError", project_ids=[1], since=SINCE),
+        "error_logs_fts",
+    ),
+    (
+        "месяцы проектов для переноса в архив",
+        lambda db: months_to_archive(db, SINCE + timedelta(days=5)),
+        "ix_error_logs_project_created",
+    ),
+    (
+        "удаление строк, перенесенных в архив",
+        lambda db: delete_archived_chunk(db, _segment(), 5000),
+        "ix_error_logs_project_created",
+    ),
+    (
+        "решение группы ошибок",
+        lambda db: resolve_error_group(db, 1),
+        "ix_error_logs_group_id",
+    ),
+    (
+        "группы ошибок пакета",
+        lambda db: ingest_error_events(db, 1, [{"type": "KeyError", "message": "error 1", "severity": "error"}]),
+        # Уникальное ограничение в SQLite - автоиндекс sqlite_autoindex_error_groups_N
+        "error_groups USING INDEX sqlite_autoindex_error_groups",
+    ),
+    (
+        "число ошибок за сутки",
+        lambda db: count_errors(db, SINCE + timedelta(days=2), SINCE + timedelta(days=3)),
+        "error_counters",
+    ),
+    (
+        "последний heartbeat проекта",
+        lambda db: LivenessTracker(None)._load(db, 1),
+        "ix_heartbeats_project_created",
+    ),
+    (
+        "свертка heartbeat в часовые сводки",
+        lambda db: rollup_hours(db, SINCE + timedelta(hours=3)),
+        "ix_heartbeats_created_at",
+    ),
+    (
+        "heartbeat старше срока хранения",
+        lambda db: delete_heartbeats_chunk(db, None, SINCE + timedelta(minutes=100), 5000),
+        "ix_heartbeats_project_created",
+    ),
+]
+
+
+def fill(engine, projects=20, rows=20000):
+    """
+    Заполняет базу, чтобы ANALYZE дал планировщику реалистичную статистику
+    """
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add_all(Project(name=f"p{i}", type="bot", token=f"token-{i}") for i in range(projects))
+        db.flush()
+        db.execute(ErrorGroup.__table__.insert(), [{
+            "project_id": i % projects + 1,
+            "fingerprint": f"{i:040x}",
+            "error_type": "KeyError",
+            "message_template": f"error {i}",
+        } for i in range(500)])
+        db.execute(ErrorLog.__table__.insert(), [{
+            "project_id": i % projects + 1,
+            "group_id": i % 500 + 1,
+            "error_type": ("ValueError", "KeyError", "TypeError")[i % 3],
+            "error_message": f"error {i}",
+            "created_at": SINCE + timedelta(minutes=i),
+            "severity_level": ("info", "warning", "error", "critical")[i % 4],
+            "is_resolved": i % 3 == 0,
+        } for i in range(rows)])
+        db.execute(Heartbeat.__table__.insert(), [{
+            "project_id": i % projects + 1,
+            "status": "alive",
+            "created_at": SINCE + timedelta(minutes=i),
+        } for i in range(rows)])
+        # Часть heartbeat уже свернута: очистка удаляет только свернутое
+        db.add(HeartbeatRollup(project_id=1, period="hour", period_start=SINCE + timedelta(hours=1)))
+        db.commit()
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE"))
+
+
+def _plans(conn, statements) -> List[str]:
+    plans = []
+    for statement, parameters in statements:
+        if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            continue
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        plans.append("\n".join(row[-1] for row in rows))
+    return plans
+
+
+def _run(function, sync_engine, async_engine):
+    """
+    Вызывает функцию с синхронной сессией, а если она асинхронная - с AsyncSession
+    """
+    with Session(sync_engine) as db:
+        result = function(db)
+        db.rollback()
+    if asyncio.iscoroutine(result):
+        result.close()
+
+        async def run_async():
+            async with AsyncSession(async_engine) as db:
+                await function(db)
+                await db.rollback()
+        asyncio.run(run_async())
+
+
+def check_plans() -> List[Tuple[str, bool, List[str]]]:
+    """
+    (описание, запросы идут по индексу, планы запросов) для каждой проверки
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        sync_engine = create_engine(f"sqlite:///{path}")
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        fill(sync_engine)
+
+        statements: List[Tuple[str, Any]] = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if not executemany:
+                statements.append((statement, parameters))
+
+        for engine in (sync_engine, async_engine.sync_engine):
+            event.listen(engine, "before_cursor_execute", capture)
+
+        for description, function, index in CHECKS:
+            statements.clear()
+            _run(function, sync_engine, async_engine)
+            with sync_engine.connect() as conn:
+                plans = _plans(conn, list(statements))
+            full_scans = [
+                line for plan in plans for line in plan.splitlines()
+                if (match := _FULL_SCAN.match(line.strip())) and match.group(1) in LARGE_TABLES
+            ]
+            ok = bool(plans) and not full_scans and any(index in plan for plan in plans)
+            results.append((description, ok, plans))
+
+        asyncio.run(async_engine.dispose())
+        sync_engine.dispose()
+    return results
+
+
+def main():
+    failed = 0
+    for description, ok, plans in check_plans():
+        failed += not ok
+        summary = " | ".join(dict.fromkeys(plan.replace("\n", "; ") for plan in plans))
+        print(f"{'OK  ' if ok else 'FAIL'} {description}: {summary}")
+    if failed:
+        print(f"{failed} checks do not use the expected index")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Рассылка сообщения всем подписчикам бота (/broadcast).
+
+Получатели читаются из БД порциями по id (keyset), и каждая порция - в своей
+короткой сессии, поэтому соединение не держится открытым всю рассылку.
+Несколько задач отправляют сообщения одновременно под общим лимитом
+Telegram. Ответ RetryAfter приостанавливает все задачи на указанное время:
+Telegram ограничивает бота целиком, а не отдельный чат. Подписчики,
+заблокировавшие бота или удалившие аккаунт, удаляются из БД (кроме
+администраторов). Ход рассылки раз в progress_interval секунд передается
+в on_progress, например для правки одного статусного сообщения.
+"""
+import asyncio
+import logging
+import os
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+from telegram.error import BadRequest, Forbidden
+
+from api.ratelimit import TokenBucket
+from database.database import SessionLocal
+from database.models import Subscriber, Subscription
+
+logger = logging.getLogger(__name__)
+
+# Сколько сообщений отправляется одновременно
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+# Сообщений в секунду; общий лимит Telegram - 30, запас оставлен для ответов на команды
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Сколько подписчиков читать из БД за один запрос
+BROADCAST_CHUNK = int(os.getenv("BROADCAST_CHUNK", "500"))
+# Как часто обновлять статусное сообщение, секунд
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))
+
+# Сколько раз повторять отправку одному подписчику после RetryAfter
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+# Текст объявления; собирается один раз на рассылку, а не для каждого подписчика
+BROADCAST_TEMPLATE = "📢 Объявление:\n\n{text}"
+
+ProgressCallback = Callable[[str], Awaitable[Any]]
+
+
+def iter_subscriber_chunks(session_factory=SessionLocal, chunk: int = BROADCAST_CHUNK) -> Iterator[List[Tuple[int, int]]]:
+    """
+    Порции (id, telegram_id) подписчиков по возрастанию id, каждая в отдельной сессии
+    """
+    last_id = 0
+    while True:
+        with session_factory() as db:
+            rows = db.execute(
+                select(Subscriber.id, Subscriber.telegram_id)
+                .where(Subscriber.id > last_id)
+                .order_by(Subscriber.id)
+                .limit(chunk)
+            ).all()
+        if not rows:
+            return
+        yield [(row.id, row.telegram_id) for row in rows]
+        last_id = rows[-1].id
+
+
+def is_unreachable(error: Exception) -> bool:
+    """
+    True, если писать подписчику бесполезно: бот заблокирован, аккаунт удален или чата нет
+    """
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """
+    Пауза из ответа "Too Many Requests", секунд; None - ошибка другого рода
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return None if retry_after is None else float(retry_after)
+
+
+def prune_subscribers(session_factory, subscriber_ids: List[int]) -> Tuple[int, Set[int]]:
+    """
+    Удаляет подписчиков и их подписки (кроме администраторов).
+    Возвращает число удаленных и id проектов, у которых изменились подписчики
+    """
+    with session_factory() as db:
+        ids = db.scalars(
+            select(Subscriber.id).where(Subscriber.id.in_(subscriber_ids), Subscriber.is_admin.isnot(True))
+        ).all()
+        if not ids:
+            return 0, set()
+        project_ids = set(db.scalars(
+            select(Subscription.project_id).where(Subscription.subscriber_id.in_(ids)).distinct()
+        ))
+        db.execute(delete(Subscription).where(Subscription.subscriber_id.in_(ids)))
+        db.execute(delete(Subscriber).where(Subscriber.id.in_(ids)))
+        db.commit()
+    return len(ids), project_ids
+
+
+class Broadcast:
+    """
+    Одна рассылка text всем подписчикам; run() возвращает итоговую статистику
+    """
+
+    def __init__(
+        self,
+        bot,
+        text: str,
+        session_factory=SessionLocal,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        chunk: int = BROADCAST_CHUNK,
+        on_progress: Optional[ProgressCallback] = None,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL
+    ):
+        self.bot = bot
+        self.text = BROADCAST_TEMPLATE.format(text=text)
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.chunk = chunk
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.limit = TokenBucket(rate, rate)
+        self._paused_until = 0.0  # Время event loop, до которого Telegram просил не отправлять
+        self._unreachable: List[int] = []
+        self.pruned_project_ids: Set[int] = set()
+
+        # Метрики
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.pruned = 0
+        self.retried = 0
+        self.finished = False
+
+    async def _wait_pause(self):
+        loop = asyncio.get_running_loop()
+        while (delay := self._paused_until - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, chat_id: int):
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            await self._wait_pause()
+            await self.limit.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=self.text)
+                return
+            except Exception as e:
+                delay = retry_delay(e)
+                if delay is None or attempt == MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                self.retried += 1
+                self._paused_until = max(self._paused_until, loop.time() + delay)
+                logger.warning(f"Telegram asked to retry after {delay}s, pausing broadcast")
+
+    async def _sender(self, queue: asyncio.Queue):
+        while True:
+            subscriber_id, chat_id = await queue.get()
+            try:
+                await self._send(chat_id)
+                self.sent += 1
+            except Exception as e:
+                if is_unreachable(e):
+                    self.blocked += 1
+                    self._unreachable.append(subscriber_id)
+                else:
+                    self.failed += 1
+                    logger.error(f"Error sending broadcast to {chat_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def _prune(self):
+        if not self._unreachable:
+            return
+        ids, self._unreachable = self._unreachable, []
+        try:
+            pruned, project_ids = prune_subscribers(self.session_factory, ids)
+        except Exception:
+            logger.exception(f"Failed to prune {len(ids)} unreachable subscribers")
+            return
+        self.pruned += pruned
+        self.pruned_project_ids |= project_ids
+        if pruned:
+            logger.info(f"Pruned {pruned} subscribers who blocked the bot")
+
+    def progress_text(self) -> str:
+        title = "✅ Рассылка завершена" if self.finished else "📢 Идет рассылка"
+        return (
+            f"{title}: {self.sent + self.failed + self.blocked} из {self.total}\n"
+            f"✅ Доставлено: {self.sent}\n"
+            f"🚫 Заблокировали бота: {self.blocked} (удалено подписчиков: {self.pruned})\n"
+            f"❌ Ошибок: {self.failed}"
+        )
+
+    async def _report(self):
+        if not self.on_progress:
+            return
+        try:
+            await self.on_progress(self.progress_text())
+        except Exception as e:
+            # Например, "message is not modified" или лимит на правку сообщений
+            logger.warning(f"Failed to report broadcast progress: {e}")
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            await self._report()
+
+    async def run(self) -> Dict[str, int]:
+        with self.session_factory() as db:
+            self.total = db.scalar(select(func.count(Subscriber.id)))
+        await self._report()
+
+        # Очередь ограничена: в памяти не больше пары порций получателей
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(self.chunk, self.concurrency))
+        senders = [asyncio.create_task(self._sender(queue)) for _ in range(self.concurrency)]
+        reporter = asyncio.create_task(self._reporter())
+        try:
+            for subscribers in iter_subscriber_chunks(self.session_factory, self.chunk):
+                for subscriber in subscribers:
+                    await queue.put(subscriber)
+                if len(self._unreachable) >= self.chunk:
+                    self._prune()
+            await queue.join()
+        finally:
+            for task in senders + [reporter]:
+                task.cancel()
+            await asyncio.gather(*senders, reporter, return_exceptions=True)
+            self._prune()
+
+        self.finished = True
+        await self._report()
+        return self.stats()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "pruned": self.pruned,
+            "retried": self.retried,
+        }
@@ -3,17 +3,27 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
 import os
 import uuid
-from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+import html
 from datetime import datetime, timedelta
-import asyncio
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from dotenv import load_dotenv
+import aiohttp
 
-from database.database import get_db
-from database.models import Project, Subscriber, ErrorLog, Heartbeat
+from api.archive import delete_project_segments, remove_segment_files
+from api.counters import count_errors, summarize_counts
+from api.ingest import resolve_error_group
+from api.search import InvalidSearchQuery, render_highlight, search_errors
+from bot.delivery import Broadcast
+from database.database import SessionLocal, get_db
+from database.models import Project, Subscriber, Subscription, ErrorCounter, ErrorGroup, ErrorLog
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+API_URL = os.getenv("API_URL", "http://localhost:8000/api/v1").rstrip('/')
+# Общий с API секрет для служебных запросов; без него API принимает их только с localhost
+API_INTERNAL_SECRET = os.getenv("API_INTERNAL_SECRET")
+
+# Сколько результатов /search показывать в одном сообщении
+SEARCH_RESULTS = 5
 
 # Состояния диалога добавления проекта
 PROJECT_NAME, PROJECT_TYPE = range(2)
@@ -26,47 +36,24 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-async def check_projects_status(context: ContextTypes.DEFAULT_TYPE):
+async def invalidate_api_cache(tokens=(), project_ids=()):
     """
-    Периодическая проверка состояния проектов
+    Сбрасывает кэши проектов и подписчиков API после изменений (процесс,
+    принявший запрос, передает сброс остальным через БД).
+    Если API недоступен, устаревшая запись сама истечет по TTL кэша.
     """
     try:
-        db = next(get_db())
-        try:
-            # Проверяем проекты, от которых не было heartbeat более часа
-            one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-            inactive_projects = db.query(Project).filter(
-                Project.is_active == True,
-                (Project.last_heartbeat < one_hour_ago) | (Project.last_heartbeat == None)
-            ).all()
-
-            for project in inactive_projects:
-                # Получаем подписчиков проекта
-                subscribers = db.query(Subscriber).filter(
-                    Subscriber.subscribed_projects.contains([project.id])
-                ).all()
-                
-                # Отправляем уведомления
-                for subscriber in subscribers:
-                    try:
-                        await context.bot.send_message(
-                            chat_id=subscriber.telegram_id,
-                            text=(
-                                f"⚠️ <b>Внимание! Проект неактивен</b>\n\n"
-                                f"📝 Проект: <b>{project.name}</b>\n"
-                                f"🏷️ Тип: <b>{project.type}</b>\n"
-                                f"⏰ Последний heartbeat: <b>{project.last_heartbeat.strftime('%Y-%m-%d %H:%M:%S') if project.last_heartbeat else 'Никогда'}</b>\n\n"
-                                "Проект не отправлял сигналы активности более часа."
-                            ),
-                            parse_mode='HTML'
-                        )
-                    except Exception as e:
-                        logger.error(f"Error sending notification to {subscriber.telegram_id}: {e}")
-
-        finally:
-            db.close()
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{API_URL}/cache/invalidate",
+                json={"tokens": [t for t in tokens if t], "project_ids": list(project_ids)},
+                headers={"X-Internal-Secret": API_INTERNAL_SECRET} if API_INTERNAL_SECRET else None,
+                timeout=aiohttp.ClientTimeout(total=3)
+            ) as response:
+                if response.status != 200:
+                    logger.warning(f"API cache invalidation returned {response.status}")
     except Exception as e:
-        logger.exception("Error in check_projects_status")
+        logger.warning(f"Failed to invalidate API cache: {e}")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -105,6 +92,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /subscribe - Подписаться на уведомления проекта
 /unsubscribe - Отписаться от уведомлений
 /mysubs - Показать мои подписки
+/search - Поиск ошибок по тексту
+/resolve - Отметить группу ошибок решенной
 """
 
     if is_admin:
@@ -114,6 +103,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /listprojects - Список всех проектов
 /editproject - Редактировать проект
 /deleteproject - Удалить проект
+/setretention - Срок хранения heartbeat проекта
+/settimeout - Таймаут heartbeat проекта
 /addadmin - Добавить админа
 /stats - Статистика по ошибкам
 /broadcast - Отправить сообщение всем подписчикам
@@ -175,6 +166,7 @@ async def project_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     db.add(new_project)
     db.commit()
+    await invalidate_api_cache([project_token], [new_project.id])
     
     response_text = f"""
 ✅ Проект успешно добавлен!
@@ -202,15 +194,22 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("У вас нет прав для выполнения этой команды.")
         return
 
-    total_errors = db.query(ErrorLog).count()
+    # Счетчики ошибок ведет API при записи: без COUNT по всей таблице error_logs
+    total = summarize_counts(count_errors(db))
+    last_day = summarize_counts(count_errors(db, datetime.now() - timedelta(days=1)))
     active_projects = db.query(Project).filter(Project.is_active == True).count()
     total_subscribers = db.query(Subscriber).count()
 
+    by_severity = "\n".join(
+        f"  {severity}: {count}" for severity, count in sorted(last_day["by_severity"].items())
+    ) or "  нет"
     stats_text = f"""
 📊 Статистика:
 
 Всего проектов: {active_projects}
-Всего ошибок: {total_errors}
+Всего ошибок: {total["total"]}
+Ошибок за 24 часа: {last_day["total"]}
+{by_severity}
 Подписчиков: {total_subscribers}
 """
     await update.message.reply_text(stats_text)
@@ -247,13 +246,13 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     db = next(get_db())
     try:
         # Получаем подписки пользователя
-        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
-        if not subscriber or not subscriber.subscribed_projects:
+        # Получаем проекты, на которые подписан пользователь
+        projects = db.query(Project).join(Subscription).join(Subscriber).filter(
+            Subscriber.telegram_id == update.effective_user.id
+        ).all()
+        if not projects:
             await update.message.reply_text("У вас нет активных подписок.")
             return
-
-        # Получаем проекты, на которые подписан пользователь
-        projects = db.query(Project).filter(Project.id.in_(subscriber.subscribed_projects)).all()
         
         # Создаем клавиатуру с проектами
         keyboard = []
@@ -275,12 +274,12 @@ async def mysubs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать мои подписки"""
     db = next(get_db())
     try:
-        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
-        if not subscriber or not subscriber.subscribed_projects:
+        projects = db.query(Project).join(Subscription).join(Subscriber).filter(
+            Subscriber.telegram_id == update.effective_user.id
+        ).all()
+        if not projects:
             await update.message.reply_text("У вас нет активных подписок.")
             return
-
-        projects = db.query(Project).filter(Project.id.in_(subscriber.subscribed_projects)).all()
         
         message = "Ваши подписки:\n\n"
         for project in projects:
@@ -290,6 +289,59 @@ async def mysubs(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
+async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Полнотекстовый поиск ошибок в проектах подписчика (админ ищет во всех)"""
+    db = next(get_db())
+    try:
+        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
+        if not subscriber:
+            await update.message.reply_text("Сначала выполните /start.")
+            return
+
+        usage = (
+            "Использование: /search [<дней>d] <текст>\n"
+            "Например: /search 7d ConnectionResetError process_order\n"
+            "Слово с * на конце ищется по началу: /search Timeout*"
+        )
+        args = list(context.args)
+        days = 7
+        if args and args[0][:-1].isdigit() and args[0].endswith("d"):
+            days = int(args.pop(0)[:-1])
+        if not args or days < 1:
+            await update.message.reply_text(usage)
+            return
+
+        project_ids = None
+        if not subscriber.is_admin:
+            project_ids = [s.project_id for s in db.query(Subscription).filter_by(subscriber_id=subscriber.id)]
+        try:
+            results = search_errors(db, " ".join(args), project_ids, datetime.now() - timedelta(days=days), limit=SEARCH_RESULTS)
+        except InvalidSearchQuery:
+            await update.message.reply_text(usage)
+            return
+        if not results:
+            await update.message.reply_text(f"Ничего не найдено за {days} дн.")
+            return
+
+        names = dict(db.query(Project.id, Project.name).filter(Project.id.in_({r["project_id"] for r in results})))
+        message = f"🔎 Найдено за {days} дн. (самые подходящие первыми):\n"
+        for result in results:
+            entry = (
+                f"\n<b>{html.escape(names.get(result['project_id'], '?'))}</b> · "
+                f"{html.escape(result['error_type'])} · {result['created_at']:%d-%m-%Y %H:%M}"
+                + (f" · группа #{result['group_id']}" if result["group_id"] else "") + "\n"
+                f"{render_highlight(result['message'], '<b>', '</b>')}\n"
+            )
+            if result["stack_trace"]:
+                entry += f"<code>{render_highlight(result['stack_trace'], '', '')}</code>\n"
+            # Обрезать HTML нельзя: не влезающие результаты просто не показываем
+            if len(message) + len(entry) > 4096:
+                break
+            message += entry
+        await update.message.reply_text(message, parse_mode="HTML")
+    finally:
+        db.close()
+
 async def listprojects(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Список всех проектов"""
     # Проверяем права администратора
@@ -309,11 +361,13 @@ async def listprojects(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for project in projects:
             status = "✅ Активен" if project.is_active else "❌ Неактивен"
             last_heartbeat = project.last_heartbeat.strftime("%Y-%m-%d %H:%M:%S") if project.last_heartbeat else "Никогда"
-            message += f"📝 {project.name}\n"
+            message += f"📝 {project.name} (id {project.id})\n"
             message += f"🏷️ Тип: {project.type}\n"
             message += f"🔑 Токен: {project.token}\n"
             message += f"📊 Статус: {status}\n"
-            message += f"⏰ Последний heartbeat: {last_heartbeat}\n\n"
+            message += f"⏰ Последний heartbeat: {last_heartbeat}\n"
+            message += f"⏱️ Таймаут heartbeat: {str(project.heartbeat_timeout) + ' с' if project.heartbeat_timeout else 'по умолчанию'}\n"
+            message += f"🗄️ Хранение heartbeat: {str(project.heartbeat_retention_days) + ' дн.' if project.heartbeat_retention_days else 'по умолчанию'}\n\n"
 
         await update.message.reply_text(message)
     finally:
@@ -394,8 +448,8 @@ async def addadmin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
-async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отправить сообщение всем подписчикам"""
+async def setretention(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Срок хранения сырых heartbeat проекта"""
     db = next(get_db())
     try:
         subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
@@ -403,37 +457,149 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("У вас нет прав для выполнения этой команды.")
             return
 
-        # Проверяем, есть ли текст сообщения
-        if not context.args:
+        usage = (
+            "Использование: /setretention <id проекта> <дней>\n"
+            "/setretention <id проекта> default - срок по умолчанию"
+        )
+        if len(context.args) != 2 or not context.args[0].isdigit():
+            await update.message.reply_text(usage)
+            return
+
+        project = db.query(Project).get(int(context.args[0]))
+        if not project:
+            await update.message.reply_text("Проект не найден.")
+            return
+
+        if context.args[1] == "default":
+            project.heartbeat_retention_days = None
+        elif context.args[1].isdigit() and int(context.args[1]) > 0:
+            project.heartbeat_retention_days = int(context.args[1])
+        else:
+            await update.message.reply_text(usage)
+            return
+        db.commit()
+
+        retention = f"{project.heartbeat_retention_days} дн." if project.heartbeat_retention_days else "по умолчанию"
+        await update.message.reply_text(
+            f"✅ Срок хранения heartbeat проекта {project.name}: {retention}\n"
+            "Часовые и суточные сводки сохраняются и после удаления сырых записей."
+        )
+    finally:
+        db.close()
+
+async def settimeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Сколько проект может молчать до уведомления"""
+    db = next(get_db())
+    try:
+        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
+        if not subscriber or not subscriber.is_admin:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+
+        usage = (
+            "Использование: /settimeout <id проекта> <секунд>\n"
+            "/settimeout <id проекта> default - таймаут по умолчанию"
+        )
+        if len(context.args) != 2 or not context.args[0].isdigit():
+            await update.message.reply_text(usage)
+            return
+
+        project = db.query(Project).get(int(context.args[0]))
+        if not project:
+            await update.message.reply_text("Проект не найден.")
+            return
+
+        if context.args[1] == "default":
+            project.heartbeat_timeout = None
+        elif context.args[1].isdigit() and int(context.args[1]) >= 10:
+            project.heartbeat_timeout = int(context.args[1])
+        else:
+            await update.message.reply_text(usage + "\nТаймаут - не меньше 10 секунд.")
+            return
+        db.commit()
+        # API пересчитает срок следующего heartbeat проекта
+        await invalidate_api_cache(project_ids=[project.id])
+
+        timeout = f"{project.heartbeat_timeout} с" if project.heartbeat_timeout else "по умолчанию"
+        await update.message.reply_text(f"✅ Таймаут heartbeat проекта {project.name}: {timeout}")
+    finally:
+        db.close()
+
+async def resolve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отметить группу ошибок решенной: подписчики узнают, если ошибка появится снова"""
+    db = next(get_db())
+    try:
+        if len(context.args) != 1 or not context.args[0].lstrip("#").isdigit():
             await update.message.reply_text(
-                "Использование: /broadcast <текст сообщения>"
+                "Использование: /resolve <id группы>\n"
+                "id группы есть в уведомлении об ошибке и в результатах /search"
             )
             return
 
-        message_text = " ".join(context.args)
-        subscribers = db.query(Subscriber).all()
-        success_count = 0
-        fail_count = 0
-
-        for sub in subscribers:
-            try:
-                await context.bot.send_message(
-                    chat_id=sub.telegram_id,
-                    text=f"📢 Объявление:\n\n{message_text}"
-                )
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error sending broadcast to {sub.telegram_id}: {e}")
-                fail_count += 1
+        group = db.query(ErrorGroup).get(int(context.args[0].lstrip("#")))
+        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
+        subscribed = group is not None and subscriber is not None and db.query(Subscription).filter_by(
+            project_id=group.project_id, subscriber_id=subscriber.id
+        ).first() is not None
+        # Группы чужих проектов не показываем даже по id
+        if not group or not (subscribed or (subscriber and subscriber.is_admin)):
+            await update.message.reply_text("Группа ошибок не найдена.")
+            return
+        if group.is_resolved:
+            await update.message.reply_text(f"Группа #{group.id} уже отмечена решенной.")
+            return
 
+        resolve_error_group(db, group.id)
+        db.commit()
         await update.message.reply_text(
-            f"Сообщение отправлено:\n"
-            f"✅ Успешно: {success_count}\n"
-            f"❌ Ошибок: {fail_count}"
+            f"✅ Группа #{group.id} ({group.error_type}) отмечена решенной.\n"
+            f"Если ошибка появится снова, подписчики проекта получат уведомление."
         )
     finally:
         db.close()
 
+async def run_broadcast(context: ContextTypes.DEFAULT_TYPE, message_text: str, status):
+    """Рассылка в фоне; ход рассылки виден в статусном сообщении"""
+    try:
+        delivery = Broadcast(context.bot, message_text, SessionLocal, on_progress=status.edit_text)
+        result = await delivery.run()
+        logger.info(f"Broadcast finished: {result}")
+        if delivery.pruned_project_ids:
+            await invalidate_api_cache(project_ids=delivery.pruned_project_ids)
+    except Exception:
+        logger.exception("Broadcast failed")
+        await status.edit_text("❌ Рассылка прервана из-за ошибки, подробности в логе бота")
+    finally:
+        context.bot_data.pop("broadcast", None)
+
+async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отправить сообщение всем подписчикам"""
+    db = next(get_db())
+    try:
+        subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
+        if not subscriber or not subscriber.is_admin:
+            await update.message.reply_text("У вас нет прав для выполнения этой команды.")
+            return
+    finally:
+        db.close()
+
+    # Проверяем, есть ли текст сообщения
+    if not context.args:
+        await update.message.reply_text(
+            "Использование: /broadcast <текст сообщения>"
+        )
+        return
+
+    if context.bot_data.get("broadcast"):
+        await update.message.reply_text("Предыдущая рассылка еще не закончилась.")
+        return
+
+    # Рассылка идет в фоне: бот тем временем отвечает на другие команды
+    status = await update.message.reply_text("📢 Рассылка начинается...")
+    context.bot_data["broadcast"] = context.application.create_task(
+        run_broadcast(context, " ".join(context.args), status)
+    )
+
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка нажатий на кнопки"""
     query = update.callback_query
@@ -452,13 +618,13 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     full_name=update.effective_user.full_name
                 )
                 db.add(subscriber)
+                db.flush()
             
-            if not subscriber.subscribed_projects:
-                subscriber.subscribed_projects = []
-            
-            if project_id not in subscriber.subscribed_projects:
-                subscriber.subscribed_projects.append(project_id)
+            subscription = db.query(Subscription).get((project_id, subscriber.id))
+            if not subscription:
+                db.add(Subscription(project_id=project_id, subscriber_id=subscriber.id))
                 db.commit()
+                await invalidate_api_cache(project_ids=[project_id])
                 project = db.query(Project).get(project_id)
                 await query.edit_message_text(f"✅ Вы успешно подписались на проект {project.name}")
             else:
@@ -466,11 +632,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         elif data.startswith("unsubscribe_"):
             project_id = int(data.split("_")[1])
-            subscriber = db.query(Subscriber).filter_by(telegram_id=update.effective_user.id).first()
+            subscription = db.query(Subscription).join(Subscriber).filter(
+                Subscription.project_id == project_id,
+                Subscriber.telegram_id == update.effective_user.id
+            ).first()
             
-            if subscriber and subscriber.subscribed_projects and project_id in subscriber.subscribed_projects:
-                subscriber.subscribed_projects.remove(project_id)
+            if subscription:
+                db.delete(subscription)
                 db.commit()
+                await invalidate_api_cache(project_ids=[project_id])
                 project = db.query(Project).get(project_id)
                 await query.edit_message_text(f"✅ Вы успешно отписались от проекта {project.name}")
             else:
@@ -498,6 +668,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if project:
                 project.is_active = not project.is_active
                 db.commit()
+                await invalidate_api_cache([project.token], [project_id])
                 await query.edit_message_text(
                     f"Статус проекта {project.name} изменен на: "
                     f"{'✅ Активен' if project.is_active else '❌ Неактивен'}"
@@ -507,8 +678,10 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             project_id = int(data.split("_")[2])
             project = db.query(Project).get(project_id)
             if project:
+                old_token = project.token
                 project.token = str(uuid.uuid4())
                 db.commit()
+                await invalidate_api_cache([old_token, project.token])
                 await query.edit_message_text(
                     f"Для проекта {project.name} сгенерирован новый токен:\n"
                     f"{project.token}"
@@ -518,15 +691,24 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             project_id = int(data.split("_")[1])
             project = db.query(Project).get(project_id)
             if project:
-                # Удаляем проект из подписок всех пользователей
-                subscribers = db.query(Subscriber).all()
-                for subscriber in subscribers:
-                    if subscriber.subscribed_projects and project_id in subscriber.subscribed_projects:
-                        subscriber.subscribed_projects.remove(project_id)
+                # Удаляем подписки на проект одним запросом по индексу
+                db.query(Subscription).filter(Subscription.project_id == project_id).delete(synchronize_session=False)
+
+                # Группы ошибок без проекта не нужны; записи ошибок остаются, как и раньше
+                db.query(ErrorLog).filter(ErrorLog.project_id == project_id).update(
+                    {ErrorLog.group_id: None}, synchronize_session=False
+                )
+                db.query(ErrorGroup).filter(ErrorGroup.project_id == project_id).delete(synchronize_session=False)
+                # Счетчики статистики проекта удаляются в той же транзакции
+                db.query(ErrorCounter).filter(ErrorCounter.project_id == project_id).delete(synchronize_session=False)
+                # Сегменты архива: строки реестра в той же транзакции, файлы - после коммита
+                archive_files = delete_project_segments(db, project_id)
                 
                 # Удаляем сам проект
                 db.delete(project)
                 db.commit()
+                remove_segment_files(archive_files)
+                await invalidate_api_cache([project.token], [project_id])
                 await query.edit_message_text(f"✅ Проект {project.name} успешно удален")
 
     finally:
@@ -556,19 +738,19 @@ def create_application() -> Application:
     application.add_handler(CommandHandler("subscribe", subscribe))
     application.add_handler(CommandHandler("unsubscribe", unsubscribe))
     application.add_handler(CommandHandler("mysubs", mysubs))
+    application.add_handler(CommandHandler("search", search))
+    application.add_handler(CommandHandler("resolve", resolve))
     application.add_handler(CommandHandler("listprojects", listprojects))
     application.add_handler(CommandHandler("editproject", editproject))
     application.add_handler(CommandHandler("deleteproject", deleteproject))
     application.add_handler(CommandHandler("addadmin", addadmin))
+    application.add_handler(CommandHandler("setretention", setretention))
+    application.add_handler(CommandHandler("settimeout", settimeout))
     application.add_handler(CommandHandler("broadcast", broadcast))
     
     # Добавляем обработчик кнопок
     application.add_handler(CallbackQueryHandler(button_callback))
 
-    # Настраиваем периодическую задачу
-    job_queue = application.job_queue
-    job_queue.run_repeating(check_projects_status, interval=3600, first=10)
-
     return application
 
 def main() -> None:
@@ -1,5 +1,7 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 import os
 from dotenv import load_dotenv
@@ -8,9 +10,93 @@ load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./error_monitor.db")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# PRAGMA для SQLite: API и бот пишут в один файл из двух процессов.
+# WAL не дает читателям блокировать писателя, busy_timeout заставляет ждать
+# освобождения блокировки вместо немедленного "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # Отрицательное значение - размер в КиБ
+
+def to_async_url(url: str) -> str:
+    """
+    Подбирает асинхронный драйвер для URL синхронного движка:
+    aiosqlite для SQLite, asyncpg для PostgreSQL
+    """
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefix in ("postgresql+psycopg2:", "postgresql:", "postgres:"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg:" + url[len(prefix):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(SQLALCHEMY_DATABASE_URL))
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Выставляет PRAGMA на каждое новое соединение SQLite
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+    finally:
+        cursor.close()
+
+def pool_options(url: str, is_async: bool = False) -> dict:
+    """
+    Параметры пула соединений из переменных окружения DB_POOL_*.
+
+    Для асинхронного движка на SQLite по умолчанию одно соединение:
+    писатель у SQLite один, и запросы ждут соединение в пуле асинхронно.
+    """
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith(":")):
+        # Базе в памяти пул не нужен: у каждого соединения была бы своя база
+        return {}
+
+    single_writer = url.startswith("sqlite") and is_async
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "1" if single_writer else "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "0" if single_writer else "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "-1")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "0") == "1",
+    }
+    if single_writer:
+        # По умолчанию aiosqlite работает через NullPool
+        options["poolclass"] = AsyncAdaptedQueuePool
+    return options
+
+def create_sync_engine(url: str = SQLALCHEMY_DATABASE_URL, tuned: bool = True):
+    """
+    Синхронный движок для бота и скриптов; tuned=False - настройки SQLAlchemy по умолчанию
+    """
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **pool_options(url))
+    if url.startswith("sqlite"):
+        event.listen(engine, "connect", set_sqlite_pragmas)
+    return engine
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL):
+    """
+    Асинхронный движок для API: запросы не блокируют event loop
+    """
+    engine = create_async_engine(url, **pool_options(url, is_async=True))
+    if url.startswith("sqlite"):
+        event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
+    return engine
+
+engine = create_sync_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -18,4 +104,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,18 +1,131 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+
 from .database import engine
-from .models import Base
+from .models import Base, Project, Subscriber, Subscription
+from .search import create_search_index
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def migrate():
+def copy_json_subscriptions(db: Session) -> int:
+    """
+    Переносит подписки из subscribers.subscribed_projects в таблицу subscriptions.
+    Выполняется только пока таблица пуста, чтобы не вернуть отмененные подписки.
+    """
+    if db.query(Subscription).first() is not None:
+        return 0
+
+    existing_projects = {project_id for (project_id,) in db.query(Project.id)}
+    copied = 0
+    for subscriber in db.query(Subscriber).filter(Subscriber.subscribed_projects != None):
+        for project_id in set(subscriber.subscribed_projects or []):
+            if project_id in existing_projects:
+                db.add(Subscription(project_id=project_id, subscriber_id=subscriber.id, min_severity='info'))
+                copied += 1
+    db.commit()
+    return copied
+
+def add_missing_columns(bind=engine) -> int:
+    """
+    Добавляет колонки из моделей, которых нет в уже существующих таблицах
+    (create_all не меняет существующие таблицы)
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = 0
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    raise RuntimeError(f"Column {table.name}.{column.name} is NOT NULL without a server default")
+                ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                table_name = bind.dialect.identifier_preparer.format_table(table)
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+                logger.info(f"Added column {table.name}.{column.name}")
+                added += 1
+    return added
+
+def create_missing_indexes(bind=engine) -> int:
+    """
+    Создает индексы из моделей, которых нет в уже существующих таблицах
+    (create_all создает индексы только вместе с новой таблицей)
+    """
+    existing = {
+        index["name"]
+        for table in inspect(bind).get_table_names()
+        for index in inspect(bind).get_indexes(table)
+    }
+    created = 0
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind)
+                created += 1
+    return created
+
+def seed_total_counters(conn) -> int:
+    """
+    Итоги за все время для только что созданной error_counters, как в ревизии
+    add_error_counters: появления сгруппированных ошибок и старые записи без группы
+    """
+    return conn.execute(text("""
+        INSERT INTO error_counters (project_id, period, period_start, severity_level, count)
+        SELECT project_id, 'total', '1970-01-01 00:00:00.000000', severity_level, SUM(count)
+        FROM (
+            SELECT project_id, COALESCE(severity_level, 'error') AS severity_level, count
+            FROM error_groups
+            UNION ALL
+            SELECT project_id, COALESCE(severity_level, 'error'), 1
+            FROM error_logs
+            WHERE group_id IS NULL AND project_id IS NOT NULL
+        ) AS occurrences
+        GROUP BY project_id, severity_level
+    """)).rowcount
+
+def migrate(bind=engine):
     try:
-        # Создаем все таблицы
-        Base.metadata.create_all(engine)
+        had_counters = inspect(bind).has_table("error_counters")
+
+        # Создаем новые таблицы, затем добавляем новые колонки в старые:
+        # индексы ниже ссылаются на эти колонки
+        Base.metadata.create_all(bind)
+
+        added = add_missing_columns(bind)
+        if added:
+            logger.info(f"Added {added} missing columns")
+
+        created = create_missing_indexes(bind)
+        if created:
+            logger.info(f"Created {created} missing indexes")
+
+        if not had_counters:
+            with bind.begin() as conn:
+                seeded = seed_total_counters(conn)
+            if seeded:
+                logger.info(f"Seeded {seeded} total error counters")
+
+        # Полнотекстовый индекс для баз, созданных до его появления
+        with bind.begin() as conn:
+            if create_search_index(conn):
+                logger.info("Created full-text search index for error_logs")
+
+        with Session(bind) as db:
+            copied = copy_json_subscriptions(db)
+            if copied:
+                logger.info(f"Copied {copied} subscriptions from JSON column")
+
         logger.info("Database migration completed successfully")
     except Exception as e:
         logger.error(f"Error during migration: {e}")
         raise
 
 if __name__ == "__main__":
-    migrate() 
\ No newline at end of file
+    migrate()
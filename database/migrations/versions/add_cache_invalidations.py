@@ -0,0 +1,32 @@
+"""add cache_invalidations for cache invalidation across API processes
+
+Revision ID: add_cache_invalidations
+Revises: add_leader_lease
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_cache_invalidations'
+down_revision: Union[str, None] = 'add_leader_lease'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'cache_invalidations',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('token', sa.String, nullable=True),
+        sa.Column('project_id', sa.Integer, nullable=True),
+        sa.Column('created_at', sa.DateTime, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('cache_invalidations')
@@ -0,0 +1,41 @@
+"""add error_archives registry of cold error segments
+
+Revision ID: add_error_archives
+Revises: add_error_search
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_error_archives'
+down_revision: Union[str, None] = 'add_error_search'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'error_archives',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('projects.id'), nullable=False),
+        sa.Column('period_start', sa.DateTime, nullable=False),
+        sa.Column('path', sa.String, nullable=False),
+        sa.Column('row_count', sa.Integer, nullable=False),
+        sa.Column('size_bytes', sa.Integer, nullable=False),
+        sa.Column('first_created_at', sa.DateTime, nullable=False),
+        sa.Column('last_created_at', sa.DateTime, nullable=False),
+        sa.Column('min_id', sa.Integer, nullable=False),
+        sa.Column('max_id', sa.Integer, nullable=False),
+        sa.Column('frames', sa.JSON, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=True),
+        sa.UniqueConstraint('project_id', 'period_start', name='uq_error_archives_project_month'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('error_archives')
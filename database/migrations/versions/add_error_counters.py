@@ -0,0 +1,53 @@
+"""add error_counters table
+
+Revision ID: add_error_counters
+Revises: add_heartbeat_timeout
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_error_counters'
+down_revision: Union[str, None] = 'add_heartbeat_timeout'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'error_counters',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('projects.id'), nullable=False),
+        sa.Column('period', sa.String(8), nullable=False),
+        sa.Column('period_start', sa.DateTime, nullable=False),
+        sa.Column('severity_level', sa.String, nullable=False),
+        sa.Column('count', sa.Integer, nullable=False, server_default='0'),
+        sa.UniqueConstraint('project_id', 'period', 'period_start', 'severity_level', name='uq_error_counters_bucket'),
+    )
+    op.create_index('ix_error_counters_period_start', 'error_counters', ['period', 'period_start'])
+
+    # Итоги за все время: появления сгруппированных ошибок и старые записи без группы.
+    # Минутные, часовые и суточные счетчики копятся с момента миграции
+    op.execute("""
+        INSERT INTO error_counters (project_id, period, period_start, severity_level, count)
+        SELECT project_id, 'total', '1970-01-01 00:00:00.000000', severity_level, SUM(count)
+        FROM (
+            SELECT project_id, COALESCE(severity_level, 'error') AS severity_level, count
+            FROM error_groups
+            UNION ALL
+            SELECT project_id, COALESCE(severity_level, 'error'), 1
+            FROM error_logs
+            WHERE group_id IS NULL AND project_id IS NOT NULL
+        ) AS occurrences
+        GROUP BY project_id, severity_level
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_error_counters_period_start', 'error_counters')
+    op.drop_table('error_counters')
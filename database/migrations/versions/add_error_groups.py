@@ -0,0 +1,49 @@
+"""add error_groups table and error_logs.group_id
+
+Revision ID: add_error_groups
+Revises: add_subscriptions
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_error_groups'
+down_revision: Union[str, None] = 'add_subscriptions'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'error_groups',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('projects.id'), nullable=False),
+        sa.Column('fingerprint', sa.String(40), nullable=False),
+        sa.Column('error_type', sa.String, nullable=False),
+        sa.Column('message_template', sa.String, nullable=False),
+        sa.Column('severity_level', sa.String, nullable=True),
+        sa.Column('first_seen', sa.DateTime, nullable=True),
+        sa.Column('last_seen', sa.DateTime, nullable=True),
+        sa.Column('count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('sample_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('is_resolved', sa.Boolean, nullable=True),
+        sa.UniqueConstraint('project_id', 'fingerprint', name='uq_error_groups_project_fingerprint'),
+    )
+    # Старые записи остаются без группы (group_id = NULL)
+    with op.batch_alter_table('error_logs') as batch_op:
+        batch_op.add_column(sa.Column('group_id', sa.Integer, nullable=True))
+        batch_op.create_foreign_key('fk_error_logs_group_id', 'error_groups', ['group_id'], ['id'])
+    op.create_index('ix_error_logs_group_id', 'error_logs', ['group_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_error_logs_group_id', 'error_logs')
+    with op.batch_alter_table('error_logs') as batch_op:
+        batch_op.drop_constraint('fk_error_logs_group_id', type_='foreignkey')
+        batch_op.drop_column('group_id')
+    op.drop_table('error_groups')
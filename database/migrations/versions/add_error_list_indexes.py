@@ -0,0 +1,27 @@
+"""add error_logs indexes for filtered error pages
+
+Revision ID: add_error_list_indexes
+Revises: add_error_counters
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_error_list_indexes'
+down_revision: Union[str, None] = 'add_error_counters'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_error_logs_project_severity_created', 'error_logs', ['project_id', 'severity_level', 'created_at'])
+    op.create_index('ix_error_logs_project_type_created', 'error_logs', ['project_id', 'error_type', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_error_logs_project_type_created', 'error_logs')
+    op.drop_index('ix_error_logs_project_severity_created', 'error_logs')
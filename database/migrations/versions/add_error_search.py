@@ -0,0 +1,28 @@
+"""add full-text search index for error_logs
+
+Revision ID: add_error_search
+Revises: add_error_list_indexes
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+from database.search import create_search_index, drop_search_index
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_error_search'
+down_revision: Union[str, None] = 'add_error_list_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # FTS5 в SQLite, tsvector с GIN-индексом в PostgreSQL; уже записанные ошибки индексируются
+    create_search_index(op.get_bind())
+
+
+def downgrade() -> None:
+    drop_search_index(op.get_bind())
@@ -0,0 +1,47 @@
+"""add heartbeat_rollups table and projects.heartbeat_retention_days
+
+Revision ID: add_heartbeat_rollups
+Revises: add_query_indexes
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_heartbeat_rollups'
+down_revision: Union[str, None] = 'add_query_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('projects', sa.Column('heartbeat_retention_days', sa.Integer, nullable=True))
+    op.create_table(
+        'heartbeat_rollups',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('projects.id'), nullable=False),
+        sa.Column('period', sa.String(8), nullable=False),
+        sa.Column('period_start', sa.DateTime, nullable=False),
+        sa.Column('count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('versions', sa.JSON, nullable=True),
+        sa.Column('statuses', sa.JSON, nullable=True),
+        sa.Column('first_seen', sa.DateTime, nullable=True),
+        sa.Column('last_seen', sa.DateTime, nullable=True),
+        sa.Column('gaps', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('max_gap_seconds', sa.Integer, nullable=False, server_default='0'),
+        sa.UniqueConstraint('project_id', 'period', 'period_start', name='uq_heartbeat_rollups_project_period'),
+    )
+    op.create_index('ix_heartbeat_rollups_period_start', 'heartbeat_rollups', ['period', 'period_start'])
+    op.create_index('ix_heartbeats_created_at', 'heartbeats', ['created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_heartbeats_created_at', 'heartbeats')
+    op.drop_index('ix_heartbeat_rollups_period_start', 'heartbeat_rollups')
+    op.drop_table('heartbeat_rollups')
+    with op.batch_alter_table('projects') as batch_op:
+        batch_op.drop_column('heartbeat_retention_days')
@@ -0,0 +1,27 @@
+"""add projects.heartbeat_timeout
+
+Revision ID: add_heartbeat_timeout
+Revises: add_heartbeat_rollups
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_heartbeat_timeout'
+down_revision: Union[str, None] = 'add_heartbeat_rollups'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('projects', sa.Column('heartbeat_timeout', sa.Integer, nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('projects') as batch_op:
+        batch_op.drop_column('heartbeat_timeout')
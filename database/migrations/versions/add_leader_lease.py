@@ -0,0 +1,44 @@
+"""add leases, digest_entries and projects.heartbeat_alerted_at for multi-process API
+
+Revision ID: add_leader_lease
+Revises: add_error_archives
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_leader_lease'
+down_revision: Union[str, None] = 'add_error_archives'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('projects', sa.Column('heartbeat_alerted_at', sa.DateTime, nullable=True))
+    op.create_table(
+        'leases',
+        sa.Column('name', sa.String, primary_key=True),
+        sa.Column('holder', sa.String, nullable=False),
+        sa.Column('expires_at', sa.DateTime, nullable=False),
+    )
+    op.create_table(
+        'digest_entries',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('chat_id', sa.Integer, nullable=False),
+        sa.Column('project_id', sa.Integer, nullable=False),
+        sa.Column('error_type', sa.String, nullable=False),
+        sa.Column('count', sa.Integer, nullable=False, server_default='0'),
+        sa.UniqueConstraint('chat_id', 'project_id', 'error_type', name='uq_digest_entries_chat_project_type'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('digest_entries')
+    op.drop_table('leases')
+    with op.batch_alter_table('projects') as batch_op:
+        batch_op.drop_column('heartbeat_alerted_at')
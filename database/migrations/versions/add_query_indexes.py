@@ -0,0 +1,32 @@
+"""add composite indexes on error_logs and heartbeats
+
+Revision ID: add_query_indexes
+Revises: add_error_groups
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_query_indexes'
+down_revision: Union[str, None] = 'add_error_groups'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_error_logs_project_created', 'error_logs', ['project_id', 'created_at'])
+    op.create_index('ix_error_logs_project_resolved_created', 'error_logs', ['project_id', 'is_resolved', 'created_at'])
+    op.create_index('ix_error_logs_created_at', 'error_logs', ['created_at'])
+    op.create_index('ix_heartbeats_project_created', 'heartbeats', ['project_id', 'created_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_heartbeats_project_created', 'heartbeats')
+    op.drop_index('ix_error_logs_created_at', 'error_logs')
+    op.drop_index('ix_error_logs_project_resolved_created', 'error_logs')
+    op.drop_index('ix_error_logs_project_created', 'error_logs')
@@ -0,0 +1,65 @@
+"""add subscriptions table
+
+Revision ID: add_subscriptions
+Revises: add_last_heartbeat
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'add_subscriptions'
+down_revision: Union[str, None] = 'add_last_heartbeat'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _project_ids(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [int(project_id) for project_id in value]
+
+
+def upgrade() -> None:
+    subscriptions = op.create_table(
+        'subscriptions',
+        sa.Column('project_id', sa.Integer, sa.ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('subscriber_id', sa.Integer, sa.ForeignKey('subscribers.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('min_severity', sa.String, nullable=False, server_default='info'),
+        sa.Column('created_at', sa.DateTime, nullable=True),
+    )
+    op.create_index('ix_subscriptions_subscriber_id', 'subscriptions', ['subscriber_id'])
+
+    # Переносим подписки из JSON-колонки subscribers.subscribed_projects
+    bind = op.get_bind()
+    existing_projects = {row[0] for row in bind.execute(sa.text("SELECT id FROM projects"))}
+    rows = []
+    for subscriber_id, subscribed in bind.execute(sa.text("SELECT id, subscribed_projects FROM subscribers")):
+        for project_id in set(_project_ids(subscribed)):
+            if project_id in existing_projects:
+                rows.append({"project_id": project_id, "subscriber_id": subscriber_id, "min_severity": "info"})
+    if rows:
+        op.bulk_insert(subscriptions, rows)
+
+
+def downgrade() -> None:
+    # Возвращаем подписки в JSON-колонку
+    bind = op.get_bind()
+    projects_by_subscriber = {}
+    for project_id, subscriber_id in bind.execute(sa.text("SELECT project_id, subscriber_id FROM subscriptions")):
+        projects_by_subscriber.setdefault(subscriber_id, []).append(project_id)
+    for subscriber_id, project_ids in projects_by_subscriber.items():
+        bind.execute(
+            sa.text("UPDATE subscribers SET subscribed_projects = :projects WHERE id = :id"),
+            {"projects": json.dumps(sorted(project_ids)), "id": subscriber_id}
+        )
+
+    op.drop_index('ix_subscriptions_subscriber_id', 'subscriptions')
+    op.drop_table('subscriptions')
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
+from database.search import register_search_index
+
 Base = declarative_base()
 
 class Project(Base):
@@ -16,9 +18,15 @@ class Project(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
     last_heartbeat = Column(DateTime, nullable=True)  # Добавляем поле для последнего heartbeat
+    heartbeat_retention_days = Column(Integer, nullable=True)  # Срок хранения сырых heartbeat; None - HEARTBEAT_RETENTION_DAYS
+    heartbeat_timeout = Column(Integer, nullable=True)  # Сколько секунд ждать heartbeat до уведомления; None - HEARTBEAT_TIMEOUT
+    heartbeat_alerted_at = Column(DateTime, nullable=True)  # Когда уведомили о пропуске heartbeat; одно уведомление на пропуск
 
     error_logs = relationship("ErrorLog", back_populates="project")
+    error_groups = relationship("ErrorGroup", back_populates="project")
     heartbeats = relationship("Heartbeat", back_populates="project")
+    heartbeat_rollups = relationship("HeartbeatRollup", back_populates="project", cascade="all, delete-orphan")
+    subscriptions = relationship("Subscription", back_populates="project", cascade="all, delete-orphan")
 
 class Subscriber(Base):
     __tablename__ = 'subscribers'
@@ -27,15 +35,65 @@ class Subscriber(Base):
     telegram_id = Column(Integer, unique=True, nullable=False)
     full_name = Column(String, nullable=True)
     is_admin = Column(Boolean, default=False)
-    subscribed_projects = Column(JSON, default=list)
+    subscribed_projects = Column(JSON, default=list)  # Устарело: подписки хранятся в таблице subscriptions
     notification_level = Column(String, default='error')  # error/warning/info
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    subscriptions = relationship("Subscription", back_populates="subscriber", cascade="all, delete-orphan")
+
+class Subscription(Base):
+    __tablename__ = 'subscriptions'
+    __table_args__ = (
+        Index('ix_subscriptions_subscriber_id', 'subscriber_id'),
+    )
+
+    project_id = Column(Integer, ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+    subscriber_id = Column(Integer, ForeignKey('subscribers.id', ondelete='CASCADE'), primary_key=True)
+    min_severity = Column(String, nullable=False, default='info')  # info/warning/error/critical
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    project = relationship("Project", back_populates="subscriptions")
+    subscriber = relationship("Subscriber", back_populates="subscriptions")
+
+class ErrorGroup(Base):
+    __tablename__ = 'error_groups'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'fingerprint', name='uq_error_groups_project_fingerprint'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    fingerprint = Column(String(40), nullable=False)  # sha1 от типа, шаблона сообщения и верхних кадров стека
+    error_type = Column(String, nullable=False)
+    message_template = Column(String, nullable=False)
+    severity_level = Column(String, default='error')
+    first_seen = Column(DateTime, default=datetime.utcnow)
+    last_seen = Column(DateTime, default=datetime.utcnow)
+    count = Column(Integer, nullable=False, default=0)  # Всего появлений
+    sample_count = Column(Integer, nullable=False, default=0)  # Сохранено полных записей в error_logs
+    is_resolved = Column(Boolean, default=False)
+
+    project = relationship("Project", back_populates="error_groups")
+    error_logs = relationship("ErrorLog", back_populates="group")
+
 class ErrorLog(Base):
     __tablename__ = 'error_logs'
+    __table_args__ = (
+        Index('ix_error_logs_group_id', 'group_id'),
+        # Ошибки проекта за период и последние ошибки проекта
+        Index('ix_error_logs_project_created', 'project_id', 'created_at'),
+        # Нерешенные ошибки проекта, новые сначала
+        Index('ix_error_logs_project_resolved_created', 'project_id', 'is_resolved', 'created_at'),
+        # Окна по времени без проекта: общая статистика и очистка старых записей
+        Index('ix_error_logs_created_at', 'created_at'),
+        # Страницы ошибок проекта с фильтром по важности или типу
+        Index('ix_error_logs_project_severity_created', 'project_id', 'severity_level', 'created_at'),
+        Index('ix_error_logs_project_type_created', 'project_id', 'error_type', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey('projects.id'))
+    group_id = Column(Integer, ForeignKey('error_groups.id'), nullable=True)
     error_type = Column(String, nullable=False)
     error_message = Column(String, nullable=False)
     stack_trace = Column(String, nullable=True)
@@ -45,9 +103,18 @@ class ErrorLog(Base):
     is_resolved = Column(Boolean, default=False)
 
     project = relationship("Project", back_populates="error_logs")
+    group = relationship("ErrorGroup", back_populates="error_logs")
+
+# Полнотекстовый индекс (database.search) создается и удаляется вместе с error_logs
+register_search_index(ErrorLog.__table__)
 
 class Heartbeat(Base):
     __tablename__ = 'heartbeats'
+    __table_args__ = (
+        Index('ix_heartbeats_project_created', 'project_id', 'created_at'),
+        # Окна свертки и удаление по сроку хранения
+        Index('ix_heartbeats_created_at', 'created_at'),
+    )
 
     id = Column(Integer, primary_key=True)
     project_id = Column(Integer, ForeignKey('projects.id'))
@@ -56,4 +123,106 @@ class Heartbeat(Base):
     additional_data = Column(JSON, default=dict)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    project = relationship("Project", back_populates="heartbeats") 
\ No newline at end of file
+    project = relationship("Project", back_populates="heartbeats")
+
+class HeartbeatRollup(Base):
+    """
+    Сводка heartbeat проекта за час или за сутки
+    """
+    __tablename__ = 'heartbeat_rollups'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'period', 'period_start', name='uq_heartbeat_rollups_project_period'),
+        Index('ix_heartbeat_rollups_period_start', 'period', 'period_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    period = Column(String(8), nullable=False)  # 'hour', 'day'
+    period_start = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    versions = Column(JSON, default=list)  # Версии, присланные за период
+    statuses = Column(JSON, default=dict)  # Число heartbeat по статусам
+    first_seen = Column(DateTime, nullable=True)
+    last_seen = Column(DateTime, nullable=True)
+    gaps = Column(Integer, nullable=False, default=0)  # Перерывы дольше HEARTBEAT_GAP_SECONDS
+    max_gap_seconds = Column(Integer, nullable=False, default=0)
+
+    project = relationship("Project", back_populates="heartbeat_rollups")
+
+class ErrorCounter(Base):
+    """
+    Счетчик ошибок проекта по важности за минуту, час, сутки или за все время
+    """
+    __tablename__ = 'error_counters'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'period', 'period_start', 'severity_level', name='uq_error_counters_bucket'),
+        # Окна по всем проектам и очистка старых минутных и часовых счетчиков
+        Index('ix_error_counters_period_start', 'period', 'period_start'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    period = Column(String(8), nullable=False)  # 'minute', 'hour', 'day', 'total'
+    period_start = Column(DateTime, nullable=False)  # Для 'total' - 1970-01-01
+    severity_level = Column(String, nullable=False, default='error')
+    count = Column(Integer, nullable=False, default=0)
+
+class ErrorArchive(Base):
+    """
+    Сегмент холодного архива (api.archive): ошибки проекта за календарный месяц в файле zstd NDJSON
+    """
+    __tablename__ = 'error_archives'
+    __table_args__ = (
+        UniqueConstraint('project_id', 'period_start', name='uq_error_archives_project_month'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
+    period_start = Column(DateTime, nullable=False)  # Первое число месяца
+    path = Column(String, nullable=False)  # Относительно ERROR_ARCHIVE_DIR
+    row_count = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime, nullable=False)  # Самая старая ошибка сегмента
+    last_created_at = Column(DateTime, nullable=False)  # Самая новая
+    min_id = Column(Integer, nullable=False)
+    max_id = Column(Integer, nullable=False)
+    frames = Column(JSON, nullable=False)  # [смещение, длина, created_at и id первой строки] кадров zstd
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Lease(Base):
+    """
+    Аренда фоновых задач-одиночек (api.leader): их выполняет процесс API, держащий строку
+    """
+    __tablename__ = 'leases'
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)  # хост:pid:случайный суффикс процесса
+    expires_at = Column(DateTime, nullable=False)  # UTC
+
+class DigestEntry(Base):
+    """
+    Общее окно сводки уведомлений для нескольких процессов API (api.notifications.SharedErrorDigest).
+    error_type '*' - число уведомлений пары (чат, проект) за интервал, остальные - отложенные в сводку
+    """
+    __tablename__ = 'digest_entries'
+    __table_args__ = (
+        UniqueConstraint('chat_id', 'project_id', 'error_type', name='uq_digest_entries_chat_project_type'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer, nullable=False)
+    project_id = Column(Integer, nullable=False)
+    error_type = Column(String, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+class CacheInvalidation(Base):
+    """
+    Журнал сбросов кэшей для нескольких процессов API (api.cache.SharedInvalidations):
+    каждый процесс применяет записи с id больше последней прочитанной
+    """
+    __tablename__ = 'cache_invalidations'
+
+    id = Column(Integer, primary_key=True)
+    token = Column(String, nullable=True)  # Сбросить проект по токену
+    project_id = Column(Integer, nullable=True)  # Сбросить подписчиков и срок heartbeat проекта
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
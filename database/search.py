@@ -0,0 +1,111 @@
+"""
+Полнотекстовый индекс error_logs по типу, сообщению и трейсбеку.
+
+SQLite: FTS5-таблица error_logs_fts с внешним содержимым (тексты хранятся
+только в error_logs), синхронизируется триггерами на вставку, изменение и
+удаление. PostgreSQL: вычисляемая колонка search_vector (tsvector) с GIN-индексом.
+Конфигурация 'simple' без стемминга: в трейсбеках имена, а не слова языка.
+
+Индекс создается вместе с таблицей error_logs (create_all), для
+существующих баз - database.migrate или миграцией add_error_search.
+"""
+from sqlalchemy import event, inspect, text
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS error_logs_fts USING fts5(
+        error_type, error_message, stack_trace,
+        content='error_logs', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS error_logs_fts_insert AFTER INSERT ON error_logs BEGIN
+        INSERT INTO error_logs_fts(rowid, error_type, error_message, stack_trace)
+        VALUES (new.id, new.error_type, new.error_message, new.stack_trace);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS error_logs_fts_delete AFTER DELETE ON error_logs BEGIN
+        INSERT INTO error_logs_fts(error_logs_fts, rowid, error_type, error_message, stack_trace)
+        VALUES ('delete', old.id, old.error_type, old.error_message, old.stack_trace);
+    END
+    """,
+    # Только при изменении индексируемых полей: смена is_resolved или group_id индекс не трогает
+    """
+    CREATE TRIGGER IF NOT EXISTS error_logs_fts_update
+    AFTER UPDATE OF error_type, error_message, stack_trace ON error_logs BEGIN
+        INSERT INTO error_logs_fts(error_logs_fts, rowid, error_type, error_message, stack_trace)
+        VALUES ('delete', old.id, old.error_type, old.error_message, old.stack_trace);
+        INSERT INTO error_logs_fts(rowid, error_type, error_message, stack_trace)
+        VALUES (new.id, new.error_type, new.error_message, new.stack_trace);
+    END
+    """,
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS error_logs_fts_update",
+    "DROP TRIGGER IF EXISTS error_logs_fts_delete",
+    "DROP TRIGGER IF EXISTS error_logs_fts_insert",
+    "DROP TABLE IF EXISTS error_logs_fts",
+]
+
+POSTGRES_DDL = [
+    """
+    ALTER TABLE error_logs ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(error_type, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(error_message, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(stack_trace, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_error_logs_search_vector ON error_logs USING GIN (search_vector)",
+]
+
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS ix_error_logs_search_vector",
+    "ALTER TABLE error_logs DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def has_search_index(connection) -> bool:
+    if connection.dialect.name == "sqlite":
+        return "error_logs_fts" in inspect(connection).get_table_names()
+    if connection.dialect.name == "postgresql":
+        return any(column["name"] == "search_vector" for column in inspect(connection).get_columns("error_logs"))
+    return False
+
+
+def create_search_index(connection) -> bool:
+    """
+    Создает индекс, если его нет, и индексирует уже записанные ошибки.
+    Возвращает True, если индекс создан
+    """
+    if connection.dialect.name == "sqlite":
+        statements = SQLITE_DDL
+    elif connection.dialect.name == "postgresql":
+        statements = POSTGRES_DDL
+    else:
+        return False
+    if has_search_index(connection):
+        return False
+
+    for statement in statements:
+        connection.execute(text(statement))
+    if connection.dialect.name == "sqlite":
+        # Колонка PostgreSQL вычисляется сама, FTS5 заполняем из error_logs
+        connection.execute(text("INSERT INTO error_logs_fts(error_logs_fts) VALUES ('rebuild')"))
+    return True
+
+
+def drop_search_index(connection):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(connection.dialect.name, [])
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+def register_search_index(table):
+    """
+    Создает и удаляет индекс вместе с таблицей error_logs
+    """
+    event.listen(table, "after_create", lambda target, connection, **kw: create_search_index(connection))
+    event.listen(table, "before_drop", lambda target, connection, **kw: drop_search_index(connection))
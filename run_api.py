@@ -1,5 +1,13 @@
+import os
+
 import uvicorn
-from api.main import app
- 
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="localhost", port=8000) 
\ No newline at end of file
+    # Несколько процессов принимают запросы параллельно, фоновые задачи-одиночки
+    # выполняет один из них (api.leader). Для workers > 1 uvicorn нужен путь к приложению
+    uvicorn.run(
+        "api.main:app",
+        host=os.getenv("API_HOST", "localhost"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", "1"))
+    )
@@ -10,6 +10,10 @@ def run_migrations():
     if os.path.exists(db_path):
         os.remove(db_path)
         print("🗑️ Старая база данных удалена")
+    # Файлы журнала WAL от старой базы не должны достаться новой
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
     
     # Создаем все таблицы заново
     Base.metadata.create_all(engine)
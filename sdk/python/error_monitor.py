@@ -1,17 +1,485 @@
 import requests
+from requests.adapters import HTTPAdapter
 import traceback
 from datetime import datetime
 import logging
 import json
-from typing import Optional, Dict, Any
+import gzip
+import os
+import random
+import struct
+import zlib
+import atexit
+from typing import Optional, Dict, Any, Deque, List, Tuple, Union
 import threading
-from queue import Queue
+from collections import deque
 import time
 import platform
 import sys
-import aiohttp
 import asyncio
 
+try:
+    import aiohttp
+except ImportError:  # Асинхронный транспорт: pip install error-monitor-sdk[async]
+    aiohttp = None
+
+try:
+    import msgpack
+except ImportError:  # wire_format="msgpack": pip install error-monitor-sdk[msgpack]
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # compress="zstd": pip install error-monitor-sdk[zstd]
+    zstandard = None
+
+# Что отбрасывать при переполнении очереди: самое старое событие или новое
+DROP_POLICIES = ("oldest", "newest")
+
+# Сколько ближайших к месту ошибки кадров входит в отпечаток для схлопывания повторов
+DEDUP_FRAMES = 5
+_DIGITS = str.maketrans("", "", "0123456789")
+
+# Сколько close() при выходе процесса ждет отправки, прежде чем сохранить очередь в журнал
+ATEXIT_TIMEOUT = 2.0
+
+# Тела меньше этого размера не сжимаются: сжатие им почти не помогает
+COMPRESS_MIN_SIZE = 1024
+
+WIRE_FORMATS = ("json", "msgpack")
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def check_codec(wire_format: str, compress: Union[bool, str]):
+    """
+    Проверяет формат и сжатие транспорта и наличие нужных библиотек
+    """
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(f"wire_format must be one of {WIRE_FORMATS}")
+    if wire_format == "msgpack" and msgpack is None:
+        raise ImportError("wire_format='msgpack' requires msgpack: pip install error-monitor-sdk[msgpack]")
+    if isinstance(compress, str):
+        if compress not in COMPRESSIONS:
+            raise ValueError(f"compress must be a bool or one of {COMPRESSIONS}")
+        if compress == "zstd" and zstandard is None:
+            raise ImportError("compress='zstd' requires zstandard: pip install error-monitor-sdk[zstd]")
+
+
+def encode_body(
+    payload: Dict[str, Any],
+    compress: Union[bool, str] = True,
+    min_size: int = COMPRESS_MIN_SIZE,
+    wire_format: str = "json"
+) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Сериализует тело запроса в JSON или msgpack и сжимает его, если оно
+    достаточно большое; compress=True - gzip, "zstd" - zstd, False - без сжатия
+    """
+    if wire_format == "msgpack":
+        body = msgpack.packb(payload, default=str, use_bin_type=True)
+        headers = {"Content-Type": "application/msgpack"}
+    else:
+        body = json.dumps(payload, default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+
+    encoding = "gzip" if compress is True else compress
+    if encoding and len(body) >= min_size:
+        if encoding == "zstd":
+            body = zstandard.ZstdCompressor(level=3).compress(body)
+        else:
+            # Уровень 1: почти тот же размер для повторяющегося JSON, в разы меньше CPU
+            body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+class RequestsTransport:
+    """
+    Синхронный транспорт для приложений с потоками: одна keep-alive сессия
+    requests с пулом соединений, поэтому TCP/TLS-рукопожатие не повторяется
+    на каждую отправку
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        timeout: float = 5,
+        pool_connections: int = 1,
+        pool_maxsize: int = 4,
+        compress: Union[bool, str] = True,
+        wire_format: str = "json"
+    ):
+        check_codec(wire_format, compress)
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.compress = compress
+        self.wire_format = wire_format
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, path: str, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """
+        Отправляет POST на {api_url}/{path}, возвращает (код ответа, тело ответа)
+        """
+        body, headers = encode_body(payload, self.compress, wire_format=self.wire_format)
+        response = self.session.post(f"{self.api_url}/{path}", data=body, headers=headers, timeout=self.timeout)
+        return response.status_code, response.text
+
+    def close(self):
+        self.session.close()
+
+
+class AiohttpTransport:
+    """
+    Асинхронный транспорт для asyncio-приложений: одна долгоживущая
+    aiohttp-сессия на все отправки вместо новой сессии на каждый вызов
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        timeout: float = 10,
+        limit: int = 10,
+        compress: Union[bool, str] = True,
+        wire_format: str = "json"
+    ):
+        check_codec(wire_format, compress)
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.limit = limit
+        self.compress = compress
+        self.wire_format = wire_format
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if aiohttp is None:
+            raise ImportError("AiohttpTransport requires aiohttp: pip install error-monitor-sdk[async]")
+        # Сессия создается внутри работающего event loop при первой отправке
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def send(self, path: str, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """
+        Отправляет POST на {api_url}/{path}, возвращает (код ответа, тело ответа)
+        """
+        body, headers = encode_body(payload, self.compress, wire_format=self.wire_format)
+        async with self._get_session().post(f"{self.api_url}/{path}", data=body, headers=headers) as response:
+            return response.status, await response.text()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+class WebSocketTransport:
+    """
+    Потоковый транспорт для сервисов с непрерывным потоком ошибок: пакеты
+    уходят сообщениями по одному долгоживущему WebSocket (/log/ws) вместо
+    отдельного POST на каждый пакет. Сервер подтверждает каждое сообщение
+    после записи; при обрыве соединение открывается заново при следующей
+    отправке. Остальные запросы (heartbeat) идут через RequestsTransport
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        timeout: float = 10,
+        compress: Union[bool, str] = True,
+        fallback: Optional[RequestsTransport] = None
+    ):
+        if aiohttp is None:
+            raise ImportError("WebSocketTransport requires aiohttp: pip install error-monitor-sdk[async]")
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        # permessage-deflate вместо Content-Encoding: сжимается каждое сообщение
+        self.compress = bool(compress)
+        self.fallback = fallback or RequestsTransport(self.api_url, timeout=timeout, compress=compress)
+        # Свой event loop: send вызывается из синхронного потока отправителя
+        self._loop = asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._ws: Optional["aiohttp.ClientWebSocketResponse"] = None
+        self._header: Optional[Dict[str, Any]] = None
+        self._seq = 0
+
+    async def _connect(self, header: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+        # Возвращает (код, причина), если сервер отказал в потоке
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        self._ws = await self._session.ws_connect(
+            f"{self.api_url}/log/ws", compress=15 if self.compress else 0, timeout=self.timeout
+        )
+        self._seq = 0
+        await self._ws.send_str(json.dumps(header, default=str))
+        message = await self._ws.receive(self.timeout)
+        if message.type == aiohttp.WSMsgType.TEXT:
+            self._header = header
+            return None
+        await self._disconnect()
+        code = message.data if message.type == aiohttp.WSMsgType.CLOSE else None
+        if code == 4401:
+            return 401, message.extra or "Invalid project token"
+        if code == 4400:
+            return 400, message.extra or "Invalid stream header"
+        raise ConnectionError(f"WebSocket handshake failed: {message.type}")
+
+    async def _disconnect(self):
+        if self._ws is not None:
+            await self._ws.close()
+        self._ws = None
+        self._header = None
+
+    async def _send_batch(self, payload: Dict[str, Any]) -> Tuple[int, str]:
+        header = {"project_token": payload.get("project_token"), "context": payload.get("context") or {}}
+        if self._ws is None or self._ws.closed or header != self._header:
+            await self._disconnect()
+            refused = await self._connect(header)
+            if refused:
+                return refused
+
+        lines = "\n".join(json.dumps(event, default=str) for event in payload["errors"])
+        try:
+            await self._ws.send_str(lines)
+            self._seq += 1
+            message = await self._ws.receive(self.timeout)
+        except Exception:
+            await self._disconnect()
+            raise
+        if message.type != aiohttp.WSMsgType.TEXT:
+            await self._disconnect()
+            if message.type == aiohttp.WSMsgType.CLOSE and message.data == 4401:
+                return 401, message.extra or "Invalid project token"
+            raise ConnectionError(f"WebSocket closed: {message.type}")
+
+        ack = json.loads(message.data)
+        if ack.get("ack") == self._seq:
+            return 200, message.data
+        if ack.get("nack") == self._seq:
+            return 503, ack.get("detail", "")
+        # Ответ не на это сообщение: состояние потока неизвестно, начинаем заново
+        await self._disconnect()
+        raise ConnectionError(f"Unexpected WebSocket reply: {message.data}")
+
+    def send(self, path: str, payload: Dict[str, Any]) -> Tuple[int, str]:
+        """
+        Пакет ошибок - сообщением в поток (ответ 200 после подтверждения
+        сервера), остальное - обычным POST
+        """
+        if path != "log":
+            return self.fallback.send(path, payload)
+        with self._lock:
+            try:
+                return self._loop.run_until_complete(
+                    asyncio.wait_for(self._send_batch(payload), self.timeout * 2)
+                )
+            except asyncio.TimeoutError:
+                # Сообщение могло уйти наполовину: поток открывается заново
+                self._loop.run_until_complete(self._disconnect())
+                raise
+
+    def close(self):
+        with self._lock:
+            if not self._loop.is_closed():
+                self._loop.run_until_complete(self._disconnect())
+                if self._session is not None:
+                    self._loop.run_until_complete(self._session.close())
+                    self._session = None
+                self._loop.close()
+        self.fallback.close()
+
+
+class DiskSpool:
+    """
+    Журнал неотправленных событий на диске.
+
+    События дописываются в файлы-сегменты (запись: длина, crc32, JSON);
+    каждый дописанный пакет - одна запись в файл и один fsync. Позиция
+    чтения хранится в cursor.json, прочитанные сегменты удаляются.
+    Если журнал больше max_bytes, удаляются самые старые сегменты.
+    Оборванная при сбое запись в конце сегмента пропускается.
+    Каталог журнала должен принадлежать одному процессу.
+    """
+
+    HEADER = struct.Struct(">II")
+    SUFFIX = ".spool"
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, segment_bytes: int = 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(1, min(segment_bytes, max_bytes // 4))
+        os.makedirs(path, exist_ok=True)
+
+        self._sizes: Dict[int, int] = {}
+        for name in os.listdir(path):
+            if name.endswith(self.SUFFIX) and name[:-len(self.SUFFIX)].isdigit():
+                seq = int(name[:-len(self.SUFFIX)])
+                self._sizes[seq] = os.path.getsize(self._file(seq))
+        self._segments = sorted(self._sizes)
+        self._read_seq, self._read_offset = self._load_cursor()
+        # Сегменты после перезапуска только читаются: запись идет в новый
+        self._writer = None
+        self._write_seq: Optional[int] = None
+
+        # Метрики
+        self.appended = 0
+        self.evicted = 0
+        self.corrupt = 0
+
+        for seq in [seq for seq in self._segments if seq < self._read_seq]:
+            self._remove(seq)
+        self._normalize_cursor()
+
+    def _file(self, seq: int) -> str:
+        return os.path.join(self.path, f"{seq:012d}{self.SUFFIX}")
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.path, "cursor.json")) as f:
+                cursor = json.load(f)
+            return int(cursor["segment"]), int(cursor["offset"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0, 0
+
+    def _save_cursor(self):
+        tmp = os.path.join(self.path, "cursor.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"segment": self._read_seq, "offset": self._read_offset}, f)
+        os.replace(tmp, os.path.join(self.path, "cursor.json"))
+
+    def _normalize_cursor(self):
+        # Сегмент курсора удален (вытеснен или дочитан) - читаем со следующего
+        if self._read_seq not in self._sizes:
+            later = [seq for seq in self._segments if seq > self._read_seq]
+            if later:
+                self._read_seq, self._read_offset = later[0], 0
+
+    def _remove(self, seq: int):
+        try:
+            os.remove(self._file(seq))
+        except FileNotFoundError:
+            pass
+        self._segments.remove(seq)
+        del self._sizes[seq]
+
+    @property
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+    def empty(self) -> bool:
+        self._normalize_cursor()
+        if not self._segments or self._read_seq not in self._sizes:
+            return True
+        return self._read_seq == self._segments[-1] and self._read_offset >= self._sizes[self._read_seq]
+
+    def append(self, events: List[Dict[str, Any]]):
+        """
+        Дописывает события одной записью в файл и одним fsync
+        """
+        data = []
+        for event in events:
+            body = json.dumps(event, default=str).encode("utf-8")
+            data.append(self.HEADER.pack(len(body), zlib.crc32(body)))
+            data.append(body)
+        data = b"".join(data)
+
+        if self._writer is None or self._sizes[self._write_seq] >= self.segment_bytes:
+            self._roll()
+        self._writer.write(data)
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._sizes[self._write_seq] += len(data)
+        self.appended += len(events)
+        self._evict()
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._write_seq = max(self._segments[-1] if self._segments else 0, self._read_seq) + 1
+        self._writer = open(self._file(self._write_seq), "ab")
+        self._segments.append(self._write_seq)
+        self._sizes[self._write_seq] = 0
+        self._normalize_cursor()
+
+    def _evict(self):
+        # Вытесняем самые старые сегменты, текущий сегмент записи не трогаем
+        while self.size > self.max_bytes and len(self._segments) > 1:
+            seq = self._segments[0]
+            offset = self._read_offset if seq == self._read_seq else 0
+            self.evicted += sum(1 for _ in self._scan(seq, offset))
+            self._remove(seq)
+            if seq == self._read_seq:
+                self._read_seq, self._read_offset = self._segments[0], 0
+                self._save_cursor()
+
+    def _scan(self, seq: int, offset: int):
+        """
+        Записи сегмента начиная с offset: (тело, смещение после записи)
+        """
+        with open(self._file(seq), "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+                length, crc = self.HEADER.unpack(header)
+                body = f.read(length)
+                if len(body) < length or zlib.crc32(body) != crc:
+                    return
+                offset += self.HEADER.size + length
+                yield body, offset
+
+    def peek(self, max_events: int) -> Tuple[List[Dict[str, Any]], Tuple[int, int]]:
+        """
+        Читает до max_events событий от курсора, не сдвигая его;
+        возвращает события и позицию для ack
+        """
+        self._normalize_cursor()
+        events: List[Dict[str, Any]] = []
+        seq, offset = self._read_seq, self._read_offset
+        while len(events) < max_events and seq in self._sizes:
+            for body, offset in self._scan(seq, offset):
+                events.append(json.loads(body))
+                if len(events) >= max_events:
+                    return events, (seq, offset)
+            if seq == self._write_seq:
+                break
+            if offset < self._sizes[seq]:
+                # Оборванная запись после сбоя: остаток сегмента не читается
+                self.corrupt += 1
+            later = [later for later in self._segments if later > seq]
+            if not later:
+                # Сегмент дочитан до конца, других нет
+                offset = self._sizes[seq]
+                break
+            seq, offset = later[0], 0
+        return events, (seq, offset)
+
+    def ack(self, position: Tuple[int, int]):
+        """
+        Сдвигает курсор за отправленные события и удаляет дочитанные сегменты
+        """
+        self._read_seq, self._read_offset = position
+        if self._read_seq != self._write_seq and self._read_offset >= self._sizes.get(self._read_seq, 0):
+            # Дочитанный сегмент, в который больше не пишут, не нужен
+            self._read_seq, self._read_offset = self._read_seq + 1, 0
+        for seq in [seq for seq in self._segments if seq < self._read_seq]:
+            self._remove(seq)
+        self._normalize_cursor()
+        self._save_cursor()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
 class ErrorMonitor:
     def __init__(
         self,
@@ -19,17 +487,87 @@ class ErrorMonitor:
         api_url: str = "http://localhost:8000/api/v1",
         batch_size: int = 10,
         flush_interval: int = 60,
-        heartbeat_interval: int = 3600  # 1 час
+        heartbeat_interval: int = 3600,  # 1 час
+        max_queue_size: int = 10000,
+        drop_policy: str = "oldest",
+        transport: Optional[Union[RequestsTransport, WebSocketTransport]] = None,
+        async_transport: Optional[AiohttpTransport] = None,
+        compress: Union[bool, str] = True,
+        wire_format: str = "json",
+        stream: bool = False,
+        spool_dir: Optional[str] = None,
+        spool_max_bytes: int = 50 * 1024 * 1024,
+        retry_backoff: float = 1.0,
+        max_retry_backoff: float = 300.0,
+        dedup_window: float = 60.0,
+        dedup_max_keys: int = 1000,
+        sample_rates: Optional[Dict[str, float]] = None,
+        default_sample_rate: float = 1.0
     ):
         self.project_token = project_token
         self.api_url = api_url.rstrip('/')
         self.batch_size = batch_size
         self.flush_interval = flush_interval
         self.heartbeat_interval = heartbeat_interval
+        self.start_time = time.time()
+
+        # Транспорты можно подменить (например, общим на несколько мониторов);
+        # stream=True - пакеты ошибок идут по одному WebSocket строками JSON
+        if stream and wire_format != "json":
+            raise ValueError("stream=True sends JSON lines over WebSocket and does not support wire_format='msgpack'")
+        if transport is None and stream:
+            transport = WebSocketTransport(
+                self.api_url, compress=compress,
+                fallback=RequestsTransport(self.api_url, compress=compress, wire_format=wire_format)
+            )
+        self.transport = transport or RequestsTransport(self.api_url, compress=compress, wire_format=wire_format)
+        self.async_transport = async_transport or AiohttpTransport(self.api_url, compress=compress, wire_format=wire_format)
         
-        self.error_queue = Queue()
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}")
+        self.max_queue_size = max_queue_size
+        self.drop_policy = drop_policy
+        self.retry_backoff = retry_backoff
+        self.max_retry_backoff = max_retry_backoff
+
+        # Повторы одной ошибки за dedup_window секунд схлопываются в одно событие
+        # со счетчиком; sample_rates - доля отправляемых ошибок по имени типа
+        self.dedup_window = dedup_window
+        self.dedup_max_keys = dedup_max_keys
+        self.sample_rates = dict(sample_rates or {})
+        self.default_sample_rate = default_sample_rate
+
+        # Журнал на диске: неотправленные события переживают недоступность API и перезапуск
+        self.spool = DiskSpool(spool_dir, max_bytes=spool_max_bytes) if spool_dir else None
+
+        # Очередь ошибок и все поля отправителя защищены одним условием:
+        # log_error только кладет событие и будит поток, сеть - в отправителе
+        self._cond = threading.Condition()
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._flush_at: Optional[float] = None  # Срок отправки неполного пакета
+        self._retry_at = 0.0  # После неудачной отправки не пытаемся раньше
+        self._failures = 0  # Неудачных отправок подряд
+        self._spooled = self.spool is not None and not self.spool.empty()
+        self._closed = False
+        # Отпечаток -> [первое событие окна, число повторов]; окна истекают по порядку
+        self._dedup: Dict[Tuple, List[Any]] = {}
+        self._dedup_order: Deque[Tuple[float, Tuple]] = deque()
+        self._next_heartbeat = time.monotonic() + heartbeat_interval
+        self._inflight = 0  # Событий в пакете, который отправляется сейчас
+        self._flush_requested = False
+        self._flush_round = 0
+        self._stopping = False
+
         self.last_flush = datetime.now()
         self.last_heartbeat = datetime.now()
+
+        # Метрики
+        self.sent = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed_sends = 0
+        self.deduplicated = 0
+        self.sampled_out = 0
         
         # Системная информация для heartbeat
         self.system_info = {
@@ -39,41 +577,212 @@ class ErrorMonitor:
             "machine": platform.machine()
         }
         
-        # Запускаем фоновые потоки
-        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-        self.heartbeat_thread = threading.Thread(target=self._heartbeat_worker, daemon=True)
-        
-        self.worker_thread.start()
-        self.heartbeat_thread.start()
-        
         self.logger = logging.getLogger('error_monitor')
         self.heartbeat_task = None
 
-    def _worker(self):
-        """Фоновый процесс для отправки ошибок"""
-        while True:
-            try:
-                # Проверяем, нужно ли отправить накопленные ошибки
-                if (datetime.now() - self.last_flush).seconds >= self.flush_interval:
-                    self.flush()
-                
-                # Ждем немного перед следующей проверкой
-                time.sleep(1)
-            except Exception as e:
-                self.logger.error(f"Error in worker thread: {e}")
+        # Один фоновый поток отправляет и ошибки, и heartbeat
+        self.sender_thread = threading.Thread(target=self._sender, name="error-monitor-sender", daemon=True)
+        self.sender_thread.start()
+        if self.spool is not None:
+            # При выходе процесса очередь из памяти уходит в журнал
+            atexit.register(self.close, ATEXIT_TIMEOUT)
+
+    def _must_spill(self, now: float) -> bool:
+        # API недоступен или журнал еще не разобран: полный пакет уходит на диск
+        return (self.spool is not None and len(self._pending) >= self.batch_size
+                and (now < self._retry_at or self._spooled))
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        """
+        Через сколько секунд отправителю есть что делать (0 - сейчас, None - стоп)
+        """
+        if self._stopping:
+            return None
+        if self._must_spill(now):
+            return 0
+        wakeups = [self._next_heartbeat]
+        if self._dedup_order:
+            wakeups.append(self._dedup_order[0][0])
+        if self._pending:
+            if self._flush_requested or len(self._pending) >= self.batch_size:
+                wakeups.append(self._retry_at)
+            else:
+                wakeups.append(max(self._flush_at or now, self._retry_at))
+        if self._spooled:
+            wakeups.append(self._retry_at)
+        elif self._flush_requested and not self._pending:
+            return 0
+        return max(0.0, min(wakeups) - now)
 
-    def _heartbeat_worker(self):
-        """Фоновый процесс для отправки heartbeat"""
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _sender(self):
+        """Фоновый поток: ждет заполнения пакета или срока и отправляет"""
         while True:
+            with self._cond:
+                while True:
+                    wait = self._next_wakeup(time.monotonic())
+                    if wait is None or wait == 0:
+                        break
+                    self._cond.wait(wait)
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                self._expire_dedup(now)
+                heartbeat_due = now >= self._next_heartbeat
+                if heartbeat_due:
+                    self._next_heartbeat = now + self.heartbeat_interval
+
+                # Журнал старше очереди в памяти, поэтому отправляется первым
+                batch, spill, from_spool = [], False, False
+                if self._must_spill(now):
+                    batch, spill = self._take_batch(), True
+                elif now >= self._retry_at:
+                    if self._spooled:
+                        from_spool = True
+                    elif self._pending:
+                        batch = self._take_batch()
+                self._inflight = len(batch)
+                if not batch and not from_spool and not self._pending and not self._spooled:
+                    self._finish_flush_round()
+
             try:
-                if (datetime.now() - self.last_heartbeat).seconds >= self.heartbeat_interval:
-                    self.send_heartbeat()
-                time.sleep(10)
+                if spill:
+                    self._spill(batch)
+                elif from_spool:
+                    self._send_spooled()
+                elif batch:
+                    self._send_batch(batch)
+                if heartbeat_due:
+                    self.send_heartbeat_sync()
             except Exception as e:
-                self.logger.error(f"Error in heartbeat thread: {e}")
+                self.logger.error(f"Error in sender thread: {e}")
+
+    def _post(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        Отправляет пакет; False - стоит повторить позже
+        """
+        try:
+            # Токен и system_info передаются один раз на пакет, а не в каждом событии
+            status, text = self.transport.send("log", {
+                "project_token": self.project_token,
+                "context": {"system_info": self.system_info},
+                "errors": batch
+            })
+        except Exception as e:
+            self.logger.error(f"Failed to flush errors: {e}")
+            return False
+        if status in (200, 202):
+            return True
+        if 400 <= status < 500 and status not in (408, 429):
+            # Пакет отклонен (неверный токен или формат): повтор не поможет
+            self.logger.error(f"API rejected {len(batch)} errors: {status} {text}")
+            with self._cond:
+                self.rejected += len(batch)
+            return True
+        self.logger.error(f"Failed to flush errors: API returned {status}: {text}")
+        return False
+
+    def _schedule_retry(self):
+        # Вызывается под self._cond: экспоненциальная пауза со случайным разбросом,
+        # чтобы клиенты не возвращались к поднявшемуся API одновременно
+        self.failed_sends += 1
+        self._failures += 1
+        delay = min(self.max_retry_backoff, self.retry_backoff * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + delay / 2 + random.uniform(0, delay / 2)
+
+    def _spool_append(self, batch: List[Dict[str, Any]]) -> bool:
+        try:
+            self.spool.append(batch)
+            return True
+        except OSError as e:
+            # Диск недоступен или переполнен: дальше работаем только в памяти
+            self.logger.error(f"Failed to write error spool, spooling disabled: {e}")
+            with self._cond:
+                self.spool = None
+                self._spooled = False
+            return False
+
+    def _requeue(self, batch: List[Dict[str, Any]]):
+        # Вызывается под self._cond: пакет возвращается в начало очереди в памяти
+        self._pending.extendleft(reversed(batch))
+        while len(self._pending) > self.max_queue_size:
+            self.dropped += 1
+            if self.drop_policy == "oldest":
+                self._pending.popleft()
+            else:
+                self._pending.pop()
+
+    def _spill(self, batch: List[Dict[str, Any]]):
+        spooled = self._spool_append(batch)
+        with self._cond:
+            self._inflight = 0
+            if spooled:
+                self._spooled = True
+            else:
+                self._requeue(batch)
+
+    def _send_batch(self, batch: List[Dict[str, Any]]):
+        if self._post(batch):
+            with self._cond:
+                self._inflight = 0
+                self.sent += len(batch)
+                self._failures = 0
+                self.last_flush = datetime.now()
+                self._flush_at = time.monotonic() + self.flush_interval if self._pending else None
+                if not self._pending and not self._spooled:
+                    self._finish_flush_round()
+            return
+
+        spooled = self.spool is not None and self._spool_append(batch)
+        with self._cond:
+            self._inflight = 0
+            if spooled:
+                self._spooled = True
+            else:
+                self._requeue(batch)
+            self._schedule_retry()
+            self._finish_flush_round()
+
+    def _send_spooled(self):
+        try:
+            events, position = self.spool.peek(self.batch_size)
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Failed to read error spool, spooling disabled: {e}")
+            with self._cond:
+                self.spool = None
+                self._spooled = False
+            return
 
-    def send_heartbeat(self):
-        """Отправка сигнала, что проект работает"""
+        if events and not self._post(events):
+            with self._cond:
+                self._schedule_retry()
+                self._finish_flush_round()
+            return
+
+        self.spool.ack(position)
+        spooled = not self.spool.empty()
+        with self._cond:
+            self._spooled = spooled
+            self.sent += len(events)
+            self._failures = 0
+            self.last_flush = datetime.now()
+            if not self._pending and not self._spooled:
+                self._finish_flush_round()
+
+    def _finish_flush_round(self):
+        # Вызывается под self._cond: будим ждущих в flush()
+        if self._flush_requested:
+            self._flush_requested = False
+            self._flush_round += 1
+            self._cond.notify_all()
+
+    def send_heartbeat_sync(self):
+        """Отправка сигнала, что проект работает (из фонового потока)"""
         try:
             heartbeat_data = {
                 "project_token": self.project_token,
@@ -82,14 +791,10 @@ class ErrorMonitor:
                 "system_info": self.system_info
             }
             
-            response = requests.post(
-                f"{self.api_url}/heartbeat",
-                json=heartbeat_data,
-                timeout=5
-            )
+            status, text = self.transport.send("heartbeat", heartbeat_data)
             
-            if response.status_code != 200:
-                raise Exception(f"API returned {response.status_code}: {response.text}")
+            if status != 200:
+                raise Exception(f"API returned {status}: {text}")
             
             self.last_heartbeat = datetime.now()
             self.logger.debug("Heartbeat sent successfully")
@@ -104,64 +809,140 @@ class ErrorMonitor:
         context: Optional[Dict[str, Any]] = None
     ):
         """
-        Логирование ошибки
+        Логирование ошибки.
+
+        Повтор уже отправленной ошибки в пределах dedup_window только
+        увеличивает счетчик: трейсбек не форматируется, событие не создается
         """
         try:
+            rate = self.sample_rates.get(error.__class__.__name__, self.default_sample_rate)
+            if rate < 1.0 and random.random() >= rate:
+                with self._cond:
+                    self.sampled_out += 1
+                return
+
+            key = self._fingerprint(error) if self.dedup_window > 0 else None
+            if key is not None and self._count_duplicate(key):
+                return
+
             error_data = {
-                "project_token": self.project_token,
                 "error": {
                     "type": error.__class__.__name__,
                     "message": str(error),
                     "stack_trace": ''.join(traceback.format_tb(error.__traceback__)),
                     "severity": severity,
                     "timestamp": datetime.now().isoformat(),
-                    "context": {
-                        **(context or {}),
-                        "system_info": self.system_info
-                    }
+                    "context": context or {}
                 }
             }
             
-            # Добавляем ошибку в очередь
-            self.error_queue.put(error_data)
-            
-            # Если накопилось достаточно ошибок, отправляем их
-            if self.error_queue.qsize() >= self.batch_size:
-                self.flush()
+            self._enqueue(error_data, key)
                 
         except Exception as e:
             self.logger.error(f"Failed to log error: {e}")
 
-    def flush(self):
+    @staticmethod
+    def _fingerprint(error: Exception) -> Tuple:
         """
-        Отправка накопленных ошибок на сервер
+        Дешевый отпечаток без форматирования трейсбека: тип, сообщение
+        без цифр и файл/строка ближайших к месту ошибки кадров
         """
-        errors = []
-        try:
-            # Собираем все ошибки из очереди
-            while not self.error_queue.empty() and len(errors) < self.batch_size:
-                errors.append(self.error_queue.get_nowait())
-            
-            if not errors:
+        frames = []
+        tb = error.__traceback__
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code.co_filename, tb.tb_lineno))
+            tb = tb.tb_next
+        return (
+            error.__class__.__name__,
+            str(error).translate(_DIGITS)[:200],
+            tuple(frames[-DEDUP_FRAMES:])
+        )
+
+    def _count_duplicate(self, key: Tuple) -> bool:
+        with self._cond:
+            self._expire_dedup(time.monotonic())
+            entry = self._dedup.get(key)
+            if entry is None:
+                return False
+            entry[1] += 1
+            self.deduplicated += 1
+            return True
+
+    def _expire_dedup(self, now: float, force: bool = False):
+        # Вызывается под self._cond: по закрытым окнам отправляем число повторов
+        while self._dedup_order and (force or self._dedup_order[0][0] <= now):
+            _, key = self._dedup_order.popleft()
+            entry = self._dedup.pop(key, None)
+            if entry is not None and entry[1]:
+                first, repeats = entry
+                self._push({
+                    **first,
+                    "error": {**first["error"], "count": repeats, "timestamp": datetime.now().isoformat()}
+                })
+
+    def _enqueue(self, error_data: Dict[str, Any], key: Optional[Tuple] = None):
+        """
+        Кладет событие в очередь, не блокируясь на сети, и открывает окно
+        схлопывания повторов
+        """
+        with self._cond:
+            self._push(error_data)
+            if key is not None and len(self._dedup) < self.dedup_max_keys:
+                self._dedup[key] = [error_data, 0]
+                self._dedup_order.append((time.monotonic() + self.dedup_window, key))
+                if len(self._dedup_order) == 1:
+                    self._cond.notify()
+
+    def _push(self, error_data: Dict[str, Any]):
+        """
+        Вызывается под self._cond: при переполнении очереди отбрасывает
+        самое старое или новое событие по drop_policy
+        """
+        if len(self._pending) >= self.max_queue_size:
+            self.dropped += 1
+            if self.drop_policy == "newest":
                 return
-            
-            # Отправляем пакет ошибок
-            response = requests.post(
-                f"{self.api_url}/log",
-                json={"errors": errors},
-                timeout=5
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"API returned {response.status_code}: {response.text}")
-            
-            self.last_flush = datetime.now()
-            
-        except Exception as e:
-            self.logger.error(f"Failed to flush errors: {e}")
-            # Возвращаем ошибки обратно в очередь
-            for error in errors:
-                self.error_queue.put(error)
+            self._pending.popleft()
+        self._pending.append(error_data)
+        if len(self._pending) == 1:
+            self._flush_at = time.monotonic() + self.flush_interval
+            self._cond.notify()
+        elif len(self._pending) == self.batch_size:
+            self._cond.notify()
+
+    def flush(self, timeout: Optional[float] = 10.0) -> bool:
+        """
+        Просит фоновый поток отправить все накопленные ошибки и ждет
+        результата не дольше timeout секунд
+
+        :return: True, если очередь отправлена полностью
+        """
+        with self._cond:
+            # Незакрытые окна схлопывания тоже отправляем
+            self._expire_dedup(time.monotonic(), force=True)
+            if not (self._pending or self._inflight or self._spooled) or not self.sender_thread.is_alive():
+                return not (self._pending or self._spooled)
+            target = self._flush_round + 1
+            self._flush_requested = True
+            self._retry_at = 0.0
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: self._flush_round >= target, timeout)
+            return not (self._pending or self._inflight or self._spooled)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": len(self._pending) + self._inflight,
+                "capacity": self.max_queue_size,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "failed_sends": self.failed_sends,
+                "deduplicated": self.deduplicated,
+                "sampled_out": self.sampled_out,
+                "spool_bytes": self.spool.size if self.spool is not None else 0,
+                "spool_evicted": self.spool.evicted if self.spool is not None else 0,
+            }
 
     def __enter__(self):
         return self
@@ -191,13 +972,8 @@ class ErrorMonitor:
                 }
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/api/v1/log",
-                    json=error_data,
-                    timeout=10
-                ) as response:
-                    return response.status == 200
+            status, _ = await self.async_transport.send("log", error_data)
+            return status == 200
 
         except Exception as e:
             self.logger.error(f"Failed to send error: {e}")
@@ -220,13 +996,8 @@ class ErrorMonitor:
                 "timestamp": datetime.utcnow().isoformat()
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.api_url}/api/v1/heartbeat",
-                    json=heartbeat_data,
-                    timeout=10
-                ) as response:
-                    return response.status == 200
+            status, _ = await self.async_transport.send("heartbeat", heartbeat_data)
+            return status == 200
 
         except Exception as e:
             self.logger.error(f"Failed to send heartbeat: {e}")
@@ -266,6 +1037,37 @@ class ErrorMonitor:
         if self.heartbeat_task and not self.heartbeat_task.done():
             self.heartbeat_task.cancel()
 
+    def close(self, timeout: Optional[float] = 10.0):
+        """
+        Отправляет оставшиеся ошибки, останавливает фоновый поток
+        и закрывает соединения синхронного транспорта
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self.sender_thread.join(timeout)
+        if self.spool is not None and not self.sender_thread.is_alive():
+            # Что не успели отправить, дожидается следующего запуска в журнале
+            with self._cond:
+                rest = list(self._pending)
+                self._pending.clear()
+            if rest and self._spool_append(rest):
+                self.logger.info(f"Spooled {len(rest)} unsent errors to {self.spool.path}")
+            if self.spool is not None:
+                self.spool.close()
+        self.transport.close()
+
+    async def aclose(self):
+        """
+        Закрывает общую aiohttp-сессию; вызывать перед остановкой event loop
+        """
+        self.stop_heartbeat()
+        await self.async_transport.close()
+
 # Пример использования:
 if __name__ == "__main__":
     monitor = ErrorMonitor(
@@ -7,6 +7,11 @@ setup(
     install_requires=[
         "requests>=2.25.0",
     ],
+    extras_require={
+        "async": ["aiohttp>=3.7.0"],
+        "msgpack": ["msgpack>=1.0.0"],
+        "zstd": ["zstandard>=0.21.0"],
+    },
     author="Your Name",
     author_email="your.email@example.com",
     description="SDK for Error Monitor Bot",
@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+os.environ.setdefault("NOTIFICATION_BOT_FAKE", "1")
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from database.models import Base, Project
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "test.db"
+
+
+@pytest.fixture
+def engine(db_path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def project(db):
+    project = Project(name="bot", type="bot", token="token-1")
+    db.add(project)
+    db.commit()
+    return project
+
+
+@pytest.fixture
+def run_async(db_path):
+    """
+    Выполняет корутину от AsyncSession на той же базе
+    """
+    def run(function):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+            try:
+                async with AsyncSession(engine) as session:
+                    return await function(session)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def run_sessions(db_path):
+    """
+    Выполняет корутину scenario(sessions) с фабрикой AsyncSession на той же базе,
+    как у фоновых задач API
+    """
+    def run(scenario):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+            try:
+                return await scenario(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
+
+
+@pytest.fixture
+def api_client(monkeypatch, db_path, engine):
+    """
+    Клиент API на временной базе с пулом async-движка в одно соединение,
+    как у SQLite по умолчанию; ожидание соединения - не дольше 2 секунд
+    """
+    # api.main импортируется долго; тестам без API он не нужен
+    import api.main
+    from api.main import app
+    from fastapi.testclient import TestClient
+    from database.database import create_async_db_engine, get_async_db
+
+    monkeypatch.setenv("DB_POOL_TIMEOUT", "2")
+    async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{db_path}")
+    sessions = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    monkeypatch.setattr(api.main, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(api.main, "INGEST_MODE", "direct")
+    # Фоновые задачи API (аренда, уведомления) в тесте не нужны и ходят в рабочую базу
+    monkeypatch.setattr(app.router, "on_startup", [])
+    monkeypatch.setattr(app.router, "on_shutdown", [])
+
+    async def get_test_db():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_async_db] = get_test_db
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+    asyncio.run(async_engine.dispose())
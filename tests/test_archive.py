@@ -0,0 +1,92 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from api import archive
+from api.archive import archive_month, delete_project_segments, remove_segment_files
+from database.models import ErrorArchive, ErrorLog, Project
+
+MONTH = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def archived(tmp_path, db, project):
+    db.add_all(
+        ErrorLog(project_id=project.id, error_type="KeyError", error_message=f"error {i}",
+                 severity_level="error", is_resolved=False, created_at=MONTH + timedelta(days=i))
+        for i in range(40)
+    )
+    db.commit()
+    directory = str(tmp_path / "archive")
+    assert archive_month(db, project.id, MONTH, directory=directory) == (31, 31)
+    return directory
+
+
+def test_pages_continue_into_archive(monkeypatch, api_client, project, archived):
+    monkeypatch.setattr("api.archive.ERROR_ARCHIVE_DIR", archived)
+
+    response = api_client.get(
+        f"/api/v1/projects/{project.id}/errors", params={"limit": 20}, headers={"X-Project-Token": project.token}
+    )
+    assert response.status_code == 200
+    errors = response.json()["errors"]
+    # Первые 9 строк из error_logs (февраль), остальные - из архива
+    assert [error["error_message"] for error in errors] == [f"error {i}" for i in range(39, 19, -1)]
+
+
+def test_aware_time_window(monkeypatch, api_client, project, archived):
+    monkeypatch.setattr("api.archive.ERROR_ARCHIVE_DIR", archived)
+    since = (MONTH + timedelta(days=10)).astimezone(timezone.utc)
+
+    response = api_client.get(
+        f"/api/v1/projects/{project.id}/errors", params={"since": since.isoformat(), "limit": 100},
+        headers={"X-Project-Token": project.token}
+    )
+    assert response.status_code == 200
+    assert len(response.json()["errors"]) == 30
+
+    response = api_client.get(
+        "/api/v1/search", params={"q": "KeyError", "project_id": project.id, "since": since.isoformat()},
+        headers={"X-Project-Token": project.token}
+    )
+    assert response.status_code == 200
+
+
+def test_project_segments_removed(db, project, archived):
+    files = delete_project_segments(db, project.id, archived)
+    db.commit()
+    remove_segment_files(files)
+
+    assert db.query(ErrorArchive).count() == 0
+    assert not os.path.exists(os.path.join(archived, f"project-{project.id}"))
+
+
+def test_archive_disabled_without_zstandard(monkeypatch, db, project, archived):
+    monkeypatch.setattr("api.archive.zstandard", None)
+    from api.archive import archive_errors
+
+    result = archive_errors(db, MONTH + timedelta(days=400), after_months=1, directory=archived)
+    assert result["segments"] == 0
+    assert db.query(ErrorLog).count() == 9
+
+
+def test_archived_rows_deleted_in_chunks(monkeypatch, tmp_path, db, project):
+    db.add_all(
+        ErrorLog(project_id=project.id, error_type="KeyError", error_message=f"error {i}",
+                 severity_level="error", is_resolved=False, created_at=MONTH + timedelta(days=i))
+        for i in range(10)
+    )
+    db.commit()
+    chunks = []
+    delete_chunk = archive.delete_archived_chunk
+
+    def recording_chunk(db, segment, chunk_size):
+        chunks.append(delete_chunk(db, segment, chunk_size))
+        return chunks[-1]
+
+    monkeypatch.setattr("api.archive.delete_archived_chunk", recording_chunk)
+
+    assert archive_month(db, project.id, MONTH, directory=str(tmp_path), chunk_size=4) == (10, 10)
+    assert chunks == [4, 4, 2]
+    assert db.query(ErrorLog).count() == 0
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from bot.delivery import MAX_RETRY_AFTER_ATTEMPTS, Broadcast
+from database.models import Subscriber, Subscription
+
+
+class ScriptedBot:
+    """
+    Отвечает на отправку в чат очередной ошибкой из errors[chat_id], пока они есть
+    """
+
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(chat_errors) for chat_id, chat_errors in (errors or {}).items()}
+        self.sent = []
+        self.attempts = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = asyncio.get_running_loop().time()
+        self.attempts.append((chat_id, now))
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append((chat_id, now))
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine)
+
+
+@pytest.fixture
+def subscribers(db, project):
+    # Чат 4 - администратор: его не удаляют, даже если он заблокировал бота
+    db.add_all(Subscriber(id=chat_id, telegram_id=chat_id, is_admin=chat_id == 4) for chat_id in range(1, 7))
+    db.add_all(Subscription(project_id=project.id, subscriber_id=chat_id) for chat_id in range(1, 7))
+    db.commit()
+
+
+def broadcast(bot, session_factory, **kwargs):
+    delivery = Broadcast(bot, "text", session_factory, rate=1000, **kwargs)
+    return delivery, asyncio.run(delivery.run())
+
+
+def test_retry_after_pauses_every_sender(session_factory, subscribers):
+    bot = ScriptedBot({1: [RetryAfter(0.2)]})
+
+    delivery, stats = broadcast(bot, session_factory, concurrency=2)
+
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (6, 1, 0)
+    assert sorted(chat_id for chat_id, _ in bot.sent) == list(range(1, 7))
+    # Лимит Telegram общий на бота: после RetryAfter молчат все задачи, а не только чат 1
+    paused_at = bot.attempts[0][1]
+    assert all(sent_at >= paused_at + 0.19 for _, sent_at in bot.sent)
+
+
+def test_retry_after_gives_up_after_max_attempts(session_factory, subscribers):
+    bot = ScriptedBot({1: [RetryAfter(0)] * (MAX_RETRY_AFTER_ATTEMPTS + 1)})
+
+    delivery, stats = broadcast(bot, session_factory)
+
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (5, MAX_RETRY_AFTER_ATTEMPTS, 1)
+
+
+def test_unreachable_subscribers_pruned(db, project, session_factory, subscribers):
+    bot = ScriptedBot({
+        2: [Forbidden("Forbidden: bot was blocked by the user")],
+        3: [BadRequest("Chat not found")],
+        4: [Forbidden("Forbidden: bot was blocked by the user")],
+        5: [BadRequest("Message is too long")],
+    })
+
+    delivery, stats = broadcast(bot, session_factory)
+
+    assert stats == {"total": 6, "sent": 2, "failed": 1, "blocked": 3, "pruned": 2, "retried": 0}
+    assert delivery.pruned_project_ids == {project.id}
+    db.expire_all()
+    assert sorted(db.scalars(select(Subscriber.id))) == [1, 4, 5, 6]
+    assert sorted(db.scalars(select(Subscription.subscriber_id))) == [1, 4, 5, 6]
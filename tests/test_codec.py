@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+import json
+
+from api.codec import RequestDecompressionMiddleware
+
+
+class Recorder:
+    """
+    Приложение за middleware: запоминает тело, которое дошло до обработчика
+    """
+
+    def __init__(self):
+        self.bodies = []
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        self.bodies.append(message["body"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+
+def call(middleware, chunks, headers=()):
+    """
+    Отправляет тело по частям (бесконечно, если chunks - генератор);
+    возвращает статус ответа, тело ответа и сколько частей прочитано
+    """
+    chunks = iter(chunks)
+    received = 0
+    responses = []
+
+    async def receive():
+        nonlocal received
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        received += 1
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        responses.append(message)
+
+    scope = {"type": "http", "path": "/api/v1/log", "headers": [(b"content-encoding", b"gzip"), *headers]}
+    asyncio.run(middleware(scope, receive, send))
+    body = b"".join(message.get("body", b"") for message in responses[1:])
+    return responses[0]["status"], body, received
+
+
+def endless():
+    while True:
+        yield b"x" * 1000
+
+
+def test_gzip_body_reaches_handler_decompressed():
+    app = Recorder()
+    payload = json.dumps({"errors": [{"message": "a"}]}).encode()
+    compressed = gzip.compress(payload)
+
+    status, _, _ = call(RequestDecompressionMiddleware(app), [compressed[:10], compressed[10:]])
+
+    assert status == 200
+    assert app.bodies == [payload]
+
+
+def test_compressed_body_over_limit_is_not_read_to_the_end():
+    app = Recorder()
+
+    status, body, received = call(RequestDecompressionMiddleware(app, max_size=5000), endless())
+
+    assert status == 413
+    assert json.loads(body)["detail"] == "Compressed body is too large"
+    assert received == 6
+    assert app.bodies == []
+
+
+def test_content_length_over_limit_is_rejected_before_reading():
+    status, _, received = call(
+        RequestDecompressionMiddleware(Recorder(), max_size=5000), endless(), [(b"content-length", b"100000")]
+    )
+
+    assert (status, received) == (413, 0)
+
+
+def test_decompressed_body_over_limit():
+    compressed = gzip.compress(b" " * 100000)
+
+    status, body, _ = call(RequestDecompressionMiddleware(Recorder(), max_size=5000), [compressed])
+
+    assert status == 413
+    assert json.loads(body)["detail"] == "Decompressed body is too large"
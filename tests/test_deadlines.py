@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from api.deadlines import DeadlineScheduler
+
+START = datetime(2026, 3, 10, 9)
+
+
+class Expired:
+    """
+    Обработчик пропусков: запоминает их и возвращает заданный новый срок
+    """
+
+    def __init__(self, next_deadline=None, failing=()):
+        self.calls = []
+        self.next_deadline = next_deadline
+        self.failing = set(failing)
+
+    async def __call__(self, project_id, deadline):
+        self.calls.append((project_id, deadline))
+        if project_id in self.failing:
+            raise RuntimeError("handler failed")
+        return self.next_deadline
+
+
+def check(scheduler, seconds):
+    asyncio.run(scheduler.check(START + timedelta(seconds=seconds)))
+
+
+def test_missed_deadline_expires_once():
+    expired = Expired()
+    scheduler = DeadlineScheduler(expired, default_timeout=60)
+    scheduler.touch(1, START)
+
+    check(scheduler, 59)
+    assert expired.calls == []
+    check(scheduler, 61)
+    check(scheduler, 120)
+    assert expired.calls == [(1, START + timedelta(seconds=60))]
+    assert scheduler.deadline(1) is None
+
+
+def test_heartbeats_move_deadline_without_growing_heap():
+    expired = Expired()
+    scheduler = DeadlineScheduler(expired, default_timeout=60)
+    for second in range(0, 100, 10):
+        scheduler.touch(1, START + timedelta(seconds=second))
+
+    assert scheduler.stats()["heap"] == 1
+    check(scheduler, 100)
+    assert expired.calls == []
+    # Запись в куче перенесена на последний срок
+    assert scheduler.stats()["heap"] == 1
+    check(scheduler, 151)
+    assert expired.calls == [(1, START + timedelta(seconds=150))]
+
+
+def test_project_timeout_and_remove():
+    expired = Expired()
+    scheduler = DeadlineScheduler(expired, default_timeout=3600)
+    scheduler.set_timeout(1, 30)
+    for project_id in (1, 2, 3):
+        scheduler.touch(project_id, START)
+    scheduler.remove(3)
+
+    check(scheduler, 31)
+    assert expired.calls == [(1, START + timedelta(seconds=30))]
+    check(scheduler, 3601)
+    assert [project_id for project_id, _ in expired.calls] == [1, 2]
+
+
+def test_handler_result_reschedules_and_errors_do_not_stop_check():
+    later = START + timedelta(seconds=200)
+    expired = Expired(next_deadline=later, failing={1})
+    scheduler = DeadlineScheduler(expired, default_timeout=60)
+    scheduler.touch(1, START)
+    scheduler.touch(2, START)
+
+    check(scheduler, 61)
+
+    assert [project_id for project_id, _ in expired.calls] == [1, 2]
+    assert scheduler.deadline(1) is None
+    assert scheduler.deadline(2) == later
+    assert scheduler.rescheduled == 1
+
+
+def test_timer_wakes_for_earlier_deadline():
+    expired = Expired()
+    scheduler = DeadlineScheduler(expired, default_timeout=3600)
+
+    async def scenario():
+        scheduler.start()
+        try:
+            # Таймер спит до далекого срока, новый ближний срок его будит
+            scheduler.schedule(1, datetime.utcnow() + timedelta(hours=1))
+            await asyncio.sleep(0.01)
+            scheduler.schedule(2, datetime.utcnow() + timedelta(seconds=0.05))
+            for _ in range(50):
+                if expired.calls:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert [project_id for project_id, _ in expired.calls] == [2]
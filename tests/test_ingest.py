@@ -0,0 +1,106 @@
+import pytest
+from sqlalchemy import func, select
+
+from api.counters import count_errors
+from api.ingest import (
+    InvalidPayload,
+    build_error_rows,
+    ingest_error_events,
+    insert_error_rows,
+    parse_error_payload,
+    resolve_error_group,
+)
+from database.models import ErrorGroup, ErrorLog
+
+
+def test_batch_shares_token_and_context():
+    token, events = parse_error_payload({
+        "context": {"host": "web-1", "env": "prod"},
+        "errors": [
+            {"project_token": "token-1", "error": {"type": "KeyError", "message": "a", "context": {"env": "dev"}}},
+            {"type": "ValueError", "message": "b"},
+        ],
+    })
+
+    assert token == "token-1"
+    assert [event["context"] for event in events] == [{"host": "web-1", "env": "dev"}, {"host": "web-1", "env": "prod"}]
+
+
+def test_single_error_payload():
+    token, events = parse_error_payload({"project_token": "token-1", "error": {"type": "KeyError", "message": "a"}})
+
+    assert (token, events) == ("token-1", [{"type": "KeyError", "message": "a"}])
+
+
+@pytest.mark.parametrize("payload", [
+    {"errors": []},
+    {"errors": [{"project_token": "token-1", "error": {}}, {"project_token": "token-2", "error": {}}]},
+    {"errors": [{"type": 1}]},
+    {"errors": [{"count": 0}]},
+    {"errors": [{}], "context": "not an object"},
+])
+def test_invalid_batch_is_rejected_whole(payload):
+    with pytest.raises(InvalidPayload):
+        parse_error_payload(payload)
+
+
+def test_batch_rows_are_written_at_once(db, project):
+    _, events = parse_error_payload({"errors": [{"message": "a"}, {"type": "KeyError", "severity": "critical"}]})
+    insert_error_rows(db, build_error_rows(project.id, events))
+    db.commit()
+
+    rows = db.query(ErrorLog).order_by(ErrorLog.id).all()
+    assert [(row.error_type, row.error_message, row.severity_level) for row in rows] == [
+        ("Unknown", "a", "error"),
+        ("KeyError", "No message provided", "critical"),
+    ]
+
+
+def event(message="user 1 not found", severity="error"):
+    return {"type": "KeyError", "message": message, "severity": severity}
+
+
+def test_events_with_same_fingerprint_share_group(db, project):
+    notify = ingest_error_events(db, project.id, [event("user 1 not found"), event("user 2 not found")])
+    db.commit()
+
+    assert len(notify) == 1
+    assert notify[0]["reopened"] is False
+    group = db.get(ErrorGroup, notify[0]["group_id"])
+    assert group.count == 2
+    assert db.scalar(select(func.count()).select_from(ErrorLog).where(ErrorLog.group_id == group.id)) == 2
+
+
+def test_known_group_is_not_notified_again(db, project):
+    ingest_error_events(db, project.id, [event()])
+    db.commit()
+
+    assert ingest_error_events(db, project.id, [event()]) == []
+    db.commit()
+    assert db.scalar(select(ErrorGroup.count)) == 2
+
+
+def test_resolved_group_reopens(db, project):
+    group_id = ingest_error_events(db, project.id, [event()])[0]["group_id"]
+    db.commit()
+
+    assert resolve_error_group(db, group_id) is not None
+    db.commit()
+    assert db.get(ErrorGroup, group_id).is_resolved
+    assert db.scalars(select(ErrorLog.is_resolved)).all() == [True]
+
+    notify = ingest_error_events(db, project.id, [event()])
+    db.commit()
+    assert [(item["group_id"], item["reopened"]) for item in notify] == [(group_id, True)]
+    assert not db.get(ErrorGroup, group_id).is_resolved
+
+
+def test_resolve_unknown_group(db, project):
+    assert resolve_error_group(db, 404) is None
+
+
+def test_counters_follow_ingest(db, project):
+    ingest_error_events(db, project.id, [event(), event(severity="critical"), {**event(), "count": 3}])
+    db.commit()
+
+    assert count_errors(db) == {project.id: {"error": 4, "critical": 1}}
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+from api.liveness import LivenessTracker
+from database.models import HeartbeatRollup, Project
+
+START = datetime(2026, 3, 10, 9)
+
+
+def beats(run_sessions, tracker, project_id, *signals):
+    """
+    Отправляет heartbeat (минута, статус, версия) и возвращает изменения по каждому
+    """
+    async def scenario(sessions):
+        tracker.session_factory = sessions
+        changes = []
+        for minute, status, version in signals:
+            async with sessions() as db:
+                changes.append(await tracker.beat(db, project_id, status, version, now=START + timedelta(minutes=minute)))
+        return changes
+    return run_sessions(scenario)
+
+
+def flush(run_sessions, tracker):
+    async def scenario(sessions):
+        tracker.session_factory = sessions
+        await tracker.flush()
+    run_sessions(scenario)
+
+
+def test_only_transitions_are_reported(run_sessions, project):
+    tracker = LivenessTracker(None, dead_after=600)
+
+    changes = beats(
+        run_sessions, tracker, project.id,
+        (0, "ok", "1.0"), (1, "ok", "1.0"), (2, "ok", "1.1"), (3, "degraded", "1.1"), (4, "degraded", None)
+    )
+
+    assert changes == [
+        ["Первый heartbeat проекта"],
+        [],
+        ["Новая версия: 1.0 → 1.1"],
+        ["Статус: ok → degraded"],
+        [],
+    ]
+    assert (tracker.beats, tracker.transitions) == (5, 3)
+
+
+def test_back_after_silence_or_mark_dead(run_sessions, project):
+    tracker = LivenessTracker(None, dead_after=600)
+    beats(run_sessions, tracker, project.id, (0, "ok", "1.0"))
+
+    assert beats(run_sessions, tracker, project.id, (20, "ok", "1.0")) == [["Проект снова на связи"]]
+
+    tracker.mark_dead(project.id)
+    assert beats(run_sessions, tracker, project.id, (21, "ok", "1.0")) == [["Проект снова на связи"]]
+
+
+def test_flush_writes_last_heartbeat_and_hourly_rollup(run_sessions, db, project):
+    tracker = LivenessTracker(None, gap_seconds=300)
+    beats(run_sessions, tracker, project.id, (0, "ok", "1.0"), (1, "ok", "1.0"), (30, "ok", "1.0"))
+
+    flush(run_sessions, tracker)
+
+    db.expire_all()
+    assert db.get(Project, project.id).last_heartbeat == START + timedelta(minutes=30)
+    rollup = db.query(HeartbeatRollup).one()
+    assert (rollup.period_start, rollup.count, rollup.gaps) == (START, 3, 1)
+    assert tracker.stats()["pending"] == 0
+
+
+def test_flush_never_moves_last_heartbeat_back(run_sessions, db, project):
+    project.last_heartbeat = START + timedelta(hours=1)
+    db.commit()
+    tracker = LivenessTracker(None, rollups=False)
+    beats(run_sessions, tracker, project.id, (0, "ok", "1.0"))
+
+    flush(run_sessions, tracker)
+
+    db.expire_all()
+    assert db.get(Project, project.id).last_heartbeat == START + timedelta(hours=1)
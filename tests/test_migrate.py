@@ -0,0 +1,68 @@
+import shutil
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+
+from api.counters import count_errors
+from api.ingest import ingest_error_events
+from database.migrate import migrate
+from database.models import ErrorLog, Project, Subscription
+
+BASELINE_DB = Path(__file__).resolve().parent.parent / "error_monitor.db"
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    """
+    Копия базы в схеме до группировки ошибок, сводок и архива
+    """
+    if not BASELINE_DB.exists():
+        pytest.skip("error_monitor.db not found")
+    path = tmp_path / "baseline.db"
+    shutil.copy(BASELINE_DB, path)
+    engine = create_engine(f"sqlite:///{path}")
+    yield engine
+    engine.dispose()
+
+
+def columns(engine, table):
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def test_upgrades_baseline(baseline):
+    assert "group_id" not in columns(baseline, "error_logs")
+    with baseline.connect() as conn:
+        errors = conn.scalar(text("SELECT COUNT(*) FROM error_logs"))
+
+    migrate(baseline)
+
+    assert "group_id" in columns(baseline, "error_logs")
+    assert {"heartbeat_timeout", "heartbeat_retention_days", "heartbeat_alerted_at"} <= columns(baseline, "projects")
+    assert "ix_error_logs_project_created" in {index["name"] for index in inspect(baseline).get_indexes("error_logs")}
+
+    with Session(baseline) as db:
+        # Старые записи без группы вошли в итоговые счетчики
+        assert sum(sum(counts.values()) for counts in count_errors(db).values()) == errors
+        assert db.query(Subscription).count() > 0
+
+        project = db.scalars(select(Project)).first()
+        ingest_error_events(db, project.id, [{"type": "KeyError", "message": "after migration"}])
+        db.commit()
+        assert db.query(ErrorLog).count() == errors + 1
+
+
+def test_is_idempotent(baseline):
+    migrate(baseline)
+    indexes = {index["name"] for index in inspect(baseline).get_indexes("error_logs")}
+    with Session(baseline) as db:
+        subscriptions = db.query(Subscription).count()
+        counters = count_errors(db)
+
+    migrate(baseline)
+
+    assert {index["name"] for index in inspect(baseline).get_indexes("error_logs")} == indexes
+    with Session(baseline) as db:
+        assert db.query(Subscription).count() == subscriptions
+        assert count_errors(db) == counters
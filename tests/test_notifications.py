@@ -0,0 +1,165 @@
+import asyncio
+
+from api.notifications import ErrorDigest, FakeBot, NotificationQueue
+
+
+class RetryAfter(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+class FlakyBot(FakeBot):
+    """
+    Отвечает ошибкой на первые failures отправок
+    """
+
+    def __init__(self, failures, error):
+        super().__init__()
+        self.failures = failures
+        self.error = error
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return await super().send_message(chat_id, text, parse_mode, **kwargs)
+
+
+def run_queue(queue, scenario):
+    async def main():
+        await queue.start()
+        try:
+            await scenario()
+        finally:
+            await queue.stop(timeout=1.0)
+    asyncio.run(main())
+
+
+def test_full_queue_drops_new_messages():
+    queue = NotificationQueue(FakeBot(), maxsize=2)
+
+    assert queue.notify([1, 2, 3], "text") == 2
+    assert (queue.stats()["depth"], queue.stats()["dropped"]) == (2, 1)
+
+
+def test_workers_deliver_every_message():
+    bot = FakeBot()
+    queue = NotificationQueue(bot, workers=2, global_rate=1000)
+
+    async def scenario():
+        queue.notify(range(10), "text")
+        await queue.queue.join()
+
+    run_queue(queue, scenario)
+
+    assert sorted(message["chat_id"] for message in bot.sent) == list(range(10))
+    assert (queue.sent, queue.failed) == (10, 0)
+
+
+def test_retry_after_is_retried():
+    bot = FlakyBot(1, RetryAfter(0))
+    queue = NotificationQueue(bot)
+
+    async def scenario():
+        queue.enqueue(1, "text")
+        await queue.queue.join()
+
+    run_queue(queue, scenario)
+
+    assert (queue.sent, queue.retried, len(bot.sent)) == (1, 1, 1)
+
+
+def test_failed_send_does_not_stop_worker():
+    bot = FlakyBot(1, RuntimeError("chat not found"))
+    queue = NotificationQueue(bot, workers=1)
+
+    async def scenario():
+        queue.notify([1, 2], "text")
+        await queue.queue.join()
+
+    run_queue(queue, scenario)
+
+    assert (queue.sent, queue.failed) == (1, 1)
+    assert [message["chat_id"] for message in bot.sent] == [2]
+
+
+def test_rate_limited_chat_keeps_order_and_does_not_stall_others():
+    bot = FakeBot()
+    queue = NotificationQueue(bot, workers=1, global_rate=1000, chat_rate=50, chat_burst=1)
+
+    async def scenario():
+        for i in range(4):
+            queue.enqueue(1, f"message {i}")
+        queue.enqueue(2, "other chat")
+        await queue.queue.join()
+
+    run_queue(queue, scenario)
+
+    texts = [message["text"] for message in bot.sent]
+    assert [text for text in texts if text != "other chat"] == [f"message {i}" for i in range(4)]
+    assert texts.index("other chat") < texts.index("message 3")
+    assert queue.deferred == 3
+
+
+def slow_chat_queue(**kwargs):
+    # Лимит чата не пополнится за время теста: все сообщения после первого откладываются
+    return NotificationQueue(FakeBot(), workers=1, global_rate=1000, chat_rate=0.001, chat_burst=1, **kwargs)
+
+
+def run_without_drain(queue, scenario):
+    async def main():
+        await queue.start()
+        try:
+            return await scenario()
+        finally:
+            await queue.stop(timeout=0.1)
+    return asyncio.run(main())
+
+
+def test_chat_backlog_is_bounded():
+    queue = slow_chat_queue(chat_backlog=2)
+
+    async def scenario():
+        queue.notify([1] * 5, "text")
+        await asyncio.sleep(0.05)
+        return queue.stats()
+
+    stats = run_without_drain(queue, scenario)
+
+    assert (stats["sent"], stats["deferred_depth"], stats["dropped"]) == (1, 2, 2)
+    assert stats["depth"] == 2
+
+
+def test_deferred_messages_take_queue_capacity():
+    queue = slow_chat_queue(maxsize=3)
+
+    async def scenario():
+        queue.notify([1] * 3, "text")
+        await asyncio.sleep(0.05)
+        # Одно сообщение отправлено, два ждут лимита чата: в емкости осталось одно место
+        return queue.notify([2, 3], "text")
+
+    assert run_without_drain(queue, scenario) == 1
+    assert queue.dropped == 1
+
+
+def test_digest_collapses_errors_over_threshold():
+    queue = NotificationQueue(FakeBot())
+    digest = ErrorDigest(queue, threshold=2, interval=60)
+
+    async def scenario():
+        for error_type in ["KeyError", "KeyError", "KeyError", "ValueError", "KeyError"]:
+            await digest.alert([1], 7, "shop", error_type, f"{error_type} in shop")
+        await digest.flush()
+        # Новый интервал: порог снова не исчерпан
+        await digest.alert([1], 7, "shop", "KeyError", "KeyError in shop")
+
+    asyncio.run(scenario())
+
+    texts = [queue.queue.get_nowait()[1] for _ in range(queue.queue.qsize())]
+    assert texts[:2] == ["KeyError in shop"] * 2
+    assert "3 новых ошибок" in texts[2]
+    assert "2 × KeyError" in texts[2] and "1 × ValueError" in texts[2]
+    assert texts[3] == "KeyError in shop"
+    assert (digest.passed, digest.suppressed, digest.digests) == (3, 3, 1)
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.pagination import InvalidCursor, decode_cursor, encode_cursor, list_errors
+from database.models import ErrorLog, Project
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def errors(db, project):
+    # По три ошибки на одну и ту же секунду: курсор должен различать их по id
+    db.add_all(
+        ErrorLog(
+            project_id=project.id,
+            error_type=("KeyError", "ValueError")[i % 2],
+            error_message=f"error {i}",
+            severity_level=("error", "critical")[i % 2],
+            is_resolved=i % 3 == 0,
+            created_at=START + timedelta(seconds=i // 3),
+        )
+        for i in range(25)
+    )
+    db.commit()
+    return db.query(ErrorLog).all()
+
+
+def read_all(run_async, project_id, **filters):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = run_async(lambda db: list_errors(db, project_id, cursor=cursor, limit=4, **filters))
+        pages.append(rows)
+        if cursor is None:
+            return pages
+
+
+def expected_ids(errors, condition=lambda error: True):
+    rows = sorted((error for error in errors if condition(error)), key=lambda error: (error.created_at, error.id))
+    return [error.id for error in reversed(rows)]
+
+
+def test_pages_cover_all_rows_in_order(run_async, project, errors):
+    pages = read_all(run_async, project.id)
+
+    assert all(len(page) == 4 for page in pages[:-1])
+    assert [row["id"] for page in pages for row in page] == expected_ids(errors)
+
+
+def test_filters_apply_on_every_page(run_async, project, errors):
+    pages = read_all(run_async, project.id, severity="critical", is_resolved=False)
+
+    assert [row["id"] for page in pages for row in page] == expected_ids(
+        errors, lambda error: error.severity_level == "critical" and not error.is_resolved
+    )
+
+
+def test_time_window(run_async, project, errors):
+    since, until = START + timedelta(seconds=2), START + timedelta(seconds=5)
+    pages = read_all(run_async, project.id, since=since, until=until)
+
+    assert [row["id"] for page in pages for row in page] == expected_ids(
+        errors, lambda error: since <= error.created_at < until
+    )
+
+
+def test_details_only_on_request(run_async, project, errors):
+    rows, _ = run_async(lambda db: list_errors(db, project.id, limit=1))
+    assert "stack_trace" not in rows[0]
+
+    rows, _ = run_async(lambda db: list_errors(db, project.id, limit=1, include_details=True))
+    assert "stack_trace" in rows[0]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(START, 42)) == (START, 42)
+    with pytest.raises(InvalidCursor):
+        decode_cursor("not a cursor")
+
+
+@pytest.fixture
+def other_project(db):
+    project = Project(name="other", type="bot", token="token-2")
+    db.add(project)
+    db.commit()
+    return project
+
+
+@pytest.mark.parametrize("headers, status", [
+    ({}, 401),
+    ({"X-Project-Token": "wrong"}, 401),
+    ({"X-Project-Token": "token-2"}, 403),
+    ({"X-Project-Token": "token-1"}, 200),
+])
+def test_errors_require_project_token(api_client, project, other_project, errors, headers, status):
+    response = api_client.get(f"/api/v1/projects/{project.id}/errors", headers=headers)
+
+    assert response.status_code == status
+    if status == 200:
+        assert len(response.json()["errors"]) == 25
+
+
+def test_errors_for_internal_request(monkeypatch, api_client, project, errors):
+    monkeypatch.setattr("api.main.API_INTERNAL_SECRET", "secret")
+
+    url = f"/api/v1/projects/{project.id}/errors"
+    assert api_client.get(url, headers={"X-Internal-Secret": "wrong"}).status_code == 401
+    assert api_client.get(url, headers={"X-Internal-Secret": "secret"}).status_code == 200
@@ -0,0 +1,13 @@
+import pytest
+
+from benchmarks.check_query_plans import check_plans
+
+
+@pytest.fixture(scope="module")
+def plans():
+    return {description: (ok, plans) for description, ok, plans in check_plans()}
+
+
+def test_queries_use_indexes(plans):
+    failed = {description: plan for description, (ok, plan) in plans.items() if not ok}
+    assert not failed
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import api.retention
+from api.retention import HeartbeatCompactor, delete_heartbeats_chunk, rollup_days, rollup_hours
+from database.models import Heartbeat, HeartbeatRollup
+
+NOW = datetime(2026, 3, 10, 12, 30)
+
+
+def add_beats(db, project, times, version="1.0", status="ok"):
+    db.add_all(Heartbeat(project_id=project.id, created_at=moment, version=version, status=status) for moment in times)
+    db.commit()
+
+
+def rollups(db, period):
+    return db.query(HeartbeatRollup).filter_by(period=period).order_by(HeartbeatRollup.period_start).all()
+
+
+def test_hourly_rollup_counts_versions_statuses_and_gaps(db, project):
+    start = datetime(2026, 3, 10, 9)
+    add_beats(db, project, [start + timedelta(minutes=minute) for minute in range(0, 30, 5)])
+    # Перерыв 40 минут, затем новая версия в следующем часе
+    add_beats(db, project, [start + timedelta(minutes=65)], version="1.1", status="degraded")
+
+    assert rollup_hours(db, NOW, gap_seconds=300) == 2
+
+    first, second = rollups(db, "hour")
+    assert (first.count, first.versions, first.statuses, first.gaps) == (6, ["1.0"], {"ok": 6}, 0)
+    assert (second.count, second.versions, second.statuses) == (1, ["1.1"], {"degraded": 1})
+    assert (second.gaps, second.max_gap_seconds) == (1, 40 * 60)
+
+
+def test_current_hour_is_not_rolled_up(db, project):
+    add_beats(db, project, [NOW - timedelta(minutes=10)])
+
+    assert rollup_hours(db, NOW) == 0
+
+
+def test_daily_rollup_merges_closed_days(db, project):
+    add_beats(db, project, [datetime(2026, 3, 8, hour) for hour in range(0, 24, 6)])
+    rollup_hours(db, NOW)
+
+    assert rollup_days(db, NOW) == 1
+    day, = rollups(db, "day")
+    assert (day.period_start, day.count) == (datetime(2026, 3, 8), 4)
+    # Повторный проход не создает сутки заново
+    assert rollup_days(db, NOW) == 0
+
+
+def test_raw_heartbeats_are_kept_until_rolled_up(db, project):
+    add_beats(db, project, [NOW - timedelta(days=30)])
+
+    assert delete_heartbeats_chunk(db, None, NOW - timedelta(days=7), 100) == 0
+    assert db.query(Heartbeat).count() == 1
+
+
+def test_compactor_deletes_expired_heartbeats_in_chunks(monkeypatch, run_sessions, db, project):
+    old = NOW - timedelta(days=10)
+    add_beats(db, project, [old + timedelta(minutes=minute) for minute in range(10)])
+    add_beats(db, project, [NOW - timedelta(hours=2)])
+    chunks = []
+
+    def delete_chunk(*args):
+        deleted = delete_heartbeats_chunk(*args)
+        chunks.append(deleted)
+        return deleted
+
+    monkeypatch.setattr(api.retention, "delete_heartbeats_chunk", delete_chunk)
+
+    async def scenario(sessions):
+        compactor = HeartbeatCompactor(sessions, retention_days=7, chunk_size=3)
+        await compactor.run_once(NOW)
+        return compactor.stats()
+
+    stats = run_sessions(scenario)
+
+    # Каждая порция - отдельная транзакция не больше chunk_size строк
+    assert chunks == [3, 3, 3, 1]
+    assert stats["deleted_heartbeats"] == 10
+    assert [created for created, in db.query(Heartbeat.created_at)] == [NOW - timedelta(hours=2)]
+    # Удаленные записи остались в сводках
+    assert sum(rollup.count for rollup in rollups(db, "hour")) == 11
+    assert stats["daily_rollups"] == 1
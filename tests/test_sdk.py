@@ -0,0 +1,347 @@
+"""
+Python SDK (sdk/python/error_monitor.py) без сети: транспорт-заглушка
+или локальный сервер aiohttp
+"""
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import error_monitor
+from error_monitor import AiohttpTransport, DiskSpool, ErrorMonitor, RequestsTransport, encode_body
+
+
+class StubTransport:
+    """
+    Транспорт-заглушка: запоминает пакеты; status - ответ API или исключение
+    """
+
+    def __init__(self, status=200):
+        self.status = status
+        self.batches = []
+        self.heartbeats = 0
+        self.calls = 0
+        self.arrived = threading.Event()
+        self.lock = threading.Lock()
+
+    def send(self, path, payload):
+        with self.lock:
+            self.calls += 1
+            if path == "heartbeat":
+                self.heartbeats += 1
+                return 200, "ok"
+            if isinstance(self.status, Exception):
+                raise self.status
+            if self.status == 200:
+                self.batches.append(payload["errors"])
+                self.arrived.set()
+            return self.status, "stub"
+
+    def events(self):
+        with self.lock:
+            return [event for batch in self.batches for event in batch]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def make_monitor():
+    monitors = []
+
+    def make(transport, **kwargs):
+        options = {"batch_size": 3, "flush_interval": 60, "heartbeat_interval": 3600, "dedup_window": 0}
+        monitor = ErrorMonitor("token-1", transport=transport, **{**options, **kwargs})
+        monitors.append(monitor)
+        return monitor
+
+    yield make
+    for monitor in monitors:
+        monitor.close(timeout=1)
+
+
+def raise_and_log(monitor, error):
+    try:
+        raise error
+    except Exception as e:
+        monitor.log_error(e)
+
+
+def test_small_bodies_are_not_compressed():
+    body, headers = encode_body({"errors": [{"message": "short"}]})
+
+    assert "Content-Encoding" not in headers
+    assert json.loads(body) == {"errors": [{"message": "short"}]}
+
+
+def test_large_bodies_are_gzipped():
+    payload = {"errors": [{"message": "x" * 100, "index": i} for i in range(50)]}
+    body, headers = encode_body(payload)
+
+    assert headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body)) == payload
+    assert len(body) < len(json.dumps(payload))
+
+
+def test_requests_transport_reuses_one_pooled_session():
+    transport = RequestsTransport("http://api.test/api/v1/", pool_maxsize=8)
+    sent = []
+
+    class Response:
+        status_code = 200
+        text = "ok"
+
+    def post(url, data, headers, timeout):
+        sent.append((url, headers))
+        return Response()
+
+    transport.session.post = post
+    session = transport.session
+
+    assert transport.send("log", {"errors": []}) == (200, "ok")
+    assert transport.send("heartbeat", {}) == (200, "ok")
+    assert transport.session is session
+    assert [url for url, _ in sent] == ["http://api.test/api/v1/log", "http://api.test/api/v1/heartbeat"]
+    assert transport.session.get_adapter("http://api.test")._pool_maxsize == 8
+    transport.close()
+
+
+def test_aiohttp_transport_keeps_connection_alive():
+    peers = []
+
+    async def handler(request):
+        peers.append(request.transport.get_extra_info("peername"))
+        return web.Response(text="ok")
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/api/v1/log", handler)
+        async with TestServer(app) as server:
+            transport = AiohttpTransport(str(server.make_url("/api/v1")))
+            try:
+                results = [await transport.send("log", {"errors": [{"message": str(i)}]}) for i in range(3)]
+                session = transport._session
+            finally:
+                await transport.close()
+        return results, session
+
+    results, session = asyncio.run(scenario())
+
+    assert results == [(200, "ok")] * 3
+    # Одна сессия и одно TCP-соединение на все отправки
+    assert len(set(peers)) == 1
+    assert session.closed
+
+
+def test_full_batch_is_sent_without_waiting_for_interval(make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport)
+    started = time.monotonic()
+
+    for i in range(3):
+        raise_and_log(monitor, KeyError(i))
+
+    assert transport.arrived.wait(2)
+    assert time.monotonic() - started < 1
+    assert [len(batch) for batch in transport.batches] == [3]
+
+
+def test_partial_batch_waits_for_flush_interval(make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport, flush_interval=0.3)
+
+    raise_and_log(monitor, KeyError(1))
+
+    assert not transport.arrived.wait(0.1)
+    assert transport.arrived.wait(2)
+    assert len(transport.events()) == 1
+
+
+def test_next_wakeup(make_monitor):
+    monitor = make_monitor(StubTransport(), flush_interval=30, heartbeat_interval=100)
+
+    with monitor._cond:
+        now = time.monotonic()
+        # Пусто: спать до heartbeat
+        assert 99 < monitor._next_wakeup(now) <= 100
+        # Неполный пакет: до срока отправки
+        monitor._pending.append({"error": {}})
+        monitor._flush_at = now + 30
+        assert monitor._next_wakeup(now) == pytest.approx(30)
+        # Пауза после неудачной отправки позже срока
+        monitor._retry_at = now + 45
+        assert monitor._next_wakeup(now) == pytest.approx(45)
+        monitor._pending.clear()
+        monitor._retry_at = 0.0
+        # flush() без событий завершает раунд сразу
+        monitor._flush_requested = True
+        assert monitor._next_wakeup(now) == 0
+        monitor._flush_requested = False
+        monitor._stopping = True
+        assert monitor._next_wakeup(now) is None
+        monitor._stopping = False
+
+
+def test_heartbeat_from_sender_thread(make_monitor):
+    transport = StubTransport()
+    make_monitor(transport, heartbeat_interval=0.1)
+
+    time.sleep(0.5)
+
+    assert transport.heartbeats >= 2
+
+
+def test_flush_waits_for_delivery(make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport, batch_size=100)
+    for i in range(5):
+        raise_and_log(monitor, KeyError(i))
+
+    assert monitor.flush(timeout=2)
+    assert len(transport.events()) == 5
+    assert monitor.stats()["queued"] == 0
+
+
+def test_flush_returns_after_failed_round(make_monitor):
+    transport = StubTransport(status=503)
+    monitor = make_monitor(transport, retry_backoff=60)
+    raise_and_log(monitor, KeyError(1))
+    started = time.monotonic()
+
+    # Раунд заканчивается неудачной попыткой, а не истечением timeout
+    assert not monitor.flush(timeout=5)
+    assert time.monotonic() - started < 1
+    assert (monitor.stats()["queued"], monitor.failed_sends) == (1, 1)
+
+
+def test_spool_cursor_survives_restart(tmp_path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append([{"n": 1}, {"n": 2}])
+    spool.append([{"n": 3}])
+
+    events, position = spool.peek(2)
+    assert events == [{"n": 1}, {"n": 2}]
+    # Без ack курсор не двигается
+    assert spool.peek(2)[0] == events
+    spool.ack(position)
+    spool.close()
+
+    spool = DiskSpool(str(tmp_path))
+    events, position = spool.peek(10)
+    assert events == [{"n": 3}]
+    spool.ack(position)
+    assert spool.empty()
+
+
+def test_torn_record_is_skipped(tmp_path):
+    spool = DiskSpool(str(tmp_path))
+    spool.append([{"n": 1}])
+    spool.append([{"n": 2}])
+    spool.close()
+    segment, = [os.path.join(tmp_path, name) for name in os.listdir(tmp_path) if name.endswith(".spool")]
+    # Сбой посреди записи последнего события
+    os.truncate(segment, os.path.getsize(segment) - 3)
+
+    spool = DiskSpool(str(tmp_path))
+    spool.append([{"n": 3}])
+    events, _ = spool.peek(10)
+
+    assert events == [{"n": 1}, {"n": 3}]
+    assert spool.corrupt == 1
+
+
+def test_oldest_segments_are_evicted(tmp_path):
+    spool = DiskSpool(str(tmp_path), max_bytes=4096, segment_bytes=1024)
+    for n in range(40):
+        spool.append([{"n": n, "padding": "x" * 200}])
+
+    assert spool.size <= 4096
+    assert spool.evicted > 0
+    events, _ = spool.peek(100)
+    # Остались самые новые события, без пропусков
+    assert [event["n"] for event in events] == list(range(40 - len(events), 40))
+    assert spool.evicted + len(events) == 40
+
+
+def test_retry_backoff_is_jittered_and_capped(make_monitor):
+    monitor = make_monitor(StubTransport(), retry_backoff=1, max_retry_backoff=8)
+
+    with monitor._cond:
+        for delay in (1, 2, 4, 8, 8):
+            monitor._schedule_retry()
+            wait = monitor._retry_at - time.monotonic()
+            assert delay / 2 - 0.01 <= wait <= delay
+        monitor._failures = 0
+        monitor._retry_at = 0.0
+
+
+def test_events_survive_outage_and_restart(tmp_path, make_monitor):
+    monitor = make_monitor(StubTransport(status=ConnectionError("API is down")), batch_size=2, spool_dir=str(tmp_path))
+    for i in range(5):
+        raise_and_log(monitor, KeyError(i))
+    # Что не ушло в API, при закрытии осталось в журнале
+    monitor.close(timeout=1)
+    assert not DiskSpool(str(tmp_path)).empty()
+
+    transport = StubTransport()
+    monitor = make_monitor(transport, batch_size=2, spool_dir=str(tmp_path))
+
+    assert monitor.flush(timeout=2)
+    assert [event["error"]["message"] for event in transport.events()] == [str(i) for i in range(5)]
+
+
+def test_repeats_collapse_into_one_counted_event(make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport, batch_size=100, dedup_window=60)
+    for i in range(5):
+        # Сообщения отличаются только числом - это повтор той же ошибки
+        raise_and_log(monitor, KeyError(f"user {i} not found"))
+    raise_and_log(monitor, ValueError("other"))
+
+    assert monitor.flush(timeout=2)
+
+    events = [event["error"] for event in transport.events()]
+    assert [(event["type"], event.get("count")) for event in events] == [
+        ("KeyError", None), ("ValueError", None), ("KeyError", 4)
+    ]
+    assert monitor.stats()["deduplicated"] == 4
+
+
+def test_dedup_keys_are_bounded(make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport, batch_size=100, dedup_window=60, dedup_max_keys=1)
+    raise_and_log(monitor, KeyError("a"))
+    raise_and_log(monitor, ValueError("b"))
+    raise_and_log(monitor, ValueError("b"))
+
+    assert monitor.flush(timeout=2)
+
+    # Для ValueError окно не открылось: каждый повтор - отдельное событие
+    assert [event["error"]["type"] for event in transport.events()] == ["KeyError", "ValueError", "ValueError"]
+
+
+def test_sampling_by_error_type(monkeypatch, make_monitor):
+    transport = StubTransport()
+    monitor = make_monitor(transport, batch_size=100, sample_rates={"KeyError": 0.5, "ValueError": 0.0})
+    draws = iter([0.1, 0.9, 0.4, 0.0])
+    monkeypatch.setattr(error_monitor.random, "random", lambda: next(draws))
+
+    for _ in range(3):
+        raise_and_log(monitor, KeyError("sampled"))
+    raise_and_log(monitor, ValueError("never sent"))
+    raise_and_log(monitor, TypeError("always sent"))
+
+    assert monitor.flush(timeout=2)
+    assert [event["error"]["type"] for event in transport.events()] == ["KeyError", "KeyError", "TypeError"]
+    assert monitor.stats()["sampled_out"] == 2
+
+
+def test_stream_rejects_msgpack():
+    with pytest.raises(ValueError):
+        ErrorMonitor("token-1", stream=True, wire_format="msgpack")
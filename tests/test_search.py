@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.search import InvalidSearchQuery, render_highlight, search_errors, to_fts_query, to_tsquery
+from database.models import ErrorLog, Project
+
+NOW = datetime(2026, 10, 25, 3, 30)
+
+
+def test_fts_query_quotes_words():
+    assert to_fts_query('say "hi" Timeout*') == '"say" """hi""" "Timeout"*'
+
+
+def test_tsquery_quotes_words_and_keeps_prefix():
+    assert to_tsquery("it's Timeout* a\\b") == "'it''s' & 'Timeout':* & 'a\\\\b'"
+
+
+def test_empty_query():
+    with pytest.raises(InvalidSearchQuery):
+        to_tsquery("* !!")
+
+
+def test_window_does_not_depend_on_id_order(db, project):
+    # После перевода часов назад новые ошибки получают меньшее created_at, чем старые
+    db.add_all([
+        ErrorLog(project_id=project.id, error_type="KeyError", error_message="before switch",
+                 created_at=NOW, severity_level="error"),
+        ErrorLog(project_id=project.id, error_type="KeyError", error_message="after switch",
+                 created_at=NOW - timedelta(minutes=50), severity_level="error"),
+    ])
+    db.commit()
+
+    results = search_errors(db, "KeyError", since=NOW - timedelta(hours=1), until=NOW + timedelta(minutes=1))
+    assert sorted(result["message"] for result in results) == ["after switch", "before switch"]
+
+    results = search_errors(db, "switch", project_ids=[project.id], since=NOW - timedelta(minutes=55), until=NOW)
+    assert [render_highlight(result["message"]) for result in results] == ["after <mark>switch</mark>"]
+
+
+@pytest.fixture
+def searchable(db, project):
+    other = Project(name="other", type="bot", token="token-2")
+    db.add(other)
+    db.flush()
+    db.add_all(
+        ErrorLog(project_id=project_id, error_type="KeyError", error_message="lost", severity_level="error")
+        for project_id in (project.id, other.id)
+    )
+    db.commit()
+    return other
+
+
+@pytest.mark.parametrize("in_project, headers, status", [
+    (True, {}, 401),
+    (True, {"X-Project-Token": "token-2"}, 403),
+    (True, {"X-Project-Token": "token-1"}, 200),
+    # Поиск по всем проектам - только для бота
+    (False, {"X-Project-Token": "token-1"}, 403),
+])
+def test_search_requires_project_token(api_client, project, searchable, in_project, headers, status):
+    params = {"q": "lost", "project_id": project.id} if in_project else {"q": "lost"}
+    response = api_client.get("/api/v1/search", params=params, headers=headers)
+
+    assert response.status_code == status
+    if status == 200:
+        assert len(response.json()["results"]) == 1
+
+
+def test_search_all_projects_for_internal_request(monkeypatch, api_client, searchable):
+    monkeypatch.setattr("api.main.API_INTERNAL_SECRET", "secret")
+
+    response = api_client.get("/api/v1/search", params={"q": "lost"}, headers={"X-Internal-Secret": "secret"})
+
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 2
@@ -0,0 +1,49 @@
+import pytest
+
+from api.streaming import STREAM_BATCH_DETAILS, StreamResult
+from database.models import ErrorLog, Project
+
+
+@pytest.fixture
+def client(api_client, db):
+    db.add(Project(name="stream", type="bot", token="stream-token"))
+    db.commit()
+    return api_client
+
+
+def test_idle_websocket_does_not_hold_connection(client, db):
+    with client.websocket_connect("/api/v1/log/ws") as websocket:
+        websocket.send_json({"project_token": "stream-token"})
+        assert websocket.receive_json()["status"] == "ready"
+        websocket.send_text('{"type": "KeyError", "message": "over websocket"}')
+        assert websocket.receive_json()["accepted"] == 1
+
+        # Сокет простаивает; другие запросы получают соединение из пула
+        response = client.get("/api/v1/projects")
+        assert response.status_code == 200
+        assert [project["name"] for project in response.json()["projects"]] == ["stream"]
+
+    assert db.query(ErrorLog).filter(ErrorLog.error_message == "over websocket").count() == 1
+
+
+def test_http_stream(client, db):
+    body = b'{"project_token": "stream-token"}\n{"type": "KeyError", "message": "over stream"}\nnot json\n'
+    response = client.post("/api/v1/log/stream", content=body)
+
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["accepted"], result["rejected"], result["batch_count"]) == (1, 1, 1)
+    assert db.query(ErrorLog).filter(ErrorLog.error_message == "over stream").count() == 1
+
+
+def test_stream_result_keeps_bounded_tail():
+    result = StreamResult()
+    for _ in range(STREAM_BATCH_DETAILS * 3):
+        result.ack(2)
+
+    summary = result.to_dict()
+    assert summary["accepted"] == STREAM_BATCH_DETAILS * 6
+    assert summary["batch_count"] == STREAM_BATCH_DETAILS * 3
+    assert [batch["batch"] for batch in summary["batches"]] == list(
+        range(STREAM_BATCH_DETAILS * 2 + 1, STREAM_BATCH_DETAILS * 3 + 1)
+    )
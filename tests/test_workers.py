@@ -0,0 +1,100 @@
+"""
+Два процесса API на одной базе: у каждого свои кэши и состояние heartbeat
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from api.cache import ProjectTokenCache, SharedInvalidations, SubscriberCache
+from api.liveness import LivenessTracker
+from database.models import HeartbeatRollup, Project
+
+
+def run_workers(db_path, scenario):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        try:
+            await scenario(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+    asyncio.run(main())
+
+
+class Worker:
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.projects = ProjectTokenCache(negative_ttl=30)
+        self.subscribers = SubscriberCache()
+        self.invalidations = SharedInvalidations(sessions, self.apply)
+
+    async def apply(self, tokens, project_ids):
+        for token in tokens:
+            self.projects.invalidate(token)
+        for project_id in project_ids:
+            self.subscribers.invalidate(project_id)
+
+    async def lookup(self, token):
+        async with self.sessions() as db:
+            return await self.projects.lookup(db, token)
+
+
+def test_invalidation_reaches_other_workers(db_path, db):
+    async def scenario(sessions):
+        first, second = Worker(sessions), Worker(sessions)
+        for worker in (first, second):
+            await worker.invalidations.poll()
+
+        # SDK прислал токен раньше, чем бот создал проект: оба процесса запомнили "неверный токен"
+        assert await first.lookup("new-token") is None
+        assert await second.lookup("new-token") is None
+
+        db.add(Project(name="new", type="bot", token="new-token"))
+        db.commit()
+        # Запрос бота на сброс попал во второй процесс
+        await second.apply(["new-token"], [1])
+        await second.invalidations.publish(["new-token"], [1])
+        assert await second.lookup("new-token") is not None
+
+        await first.invalidations.poll()
+        assert await first.lookup("new-token") is not None
+        assert first.invalidations.stats()["applied"] == 2
+
+    run_workers(db_path, scenario)
+
+
+def test_new_worker_skips_old_invalidations(db_path, engine):
+    async def scenario(sessions):
+        applied = []
+
+        async def apply(tokens, project_ids):
+            applied.append((tokens, project_ids))
+
+        await SharedInvalidations(sessions, apply).publish(["old"], [])
+        worker = SharedInvalidations(sessions, apply)
+        await worker.poll()
+        await worker.poll()
+        assert applied == []
+
+    run_workers(db_path, scenario)
+
+
+def test_gaps_use_heartbeats_of_all_workers(db_path, db, project):
+    started = datetime(2026, 1, 1, 10)
+
+    async def scenario(sessions):
+        # Heartbeat раз в минуту по кругу шести процессов: каждый процесс сам
+        # видит сигнал раз в 6 минут, дольше порога перерыва в 5 минут
+        workers = [LivenessTracker(sessions, gap_seconds=300, shared=True) for _ in range(6)]
+        for minute in range(60):
+            async with sessions() as session:
+                await workers[minute % 6].beat(session, project.id, "ok", "1.0", now=started + timedelta(minutes=minute))
+            for worker in workers:
+                await worker.flush()
+                await worker.sync()
+
+    run_workers(db_path, scenario)
+    db.expire_all()
+    rollup = db.query(HeartbeatRollup).filter_by(project_id=project.id, period="hour").one()
+    assert rollup.count == 60
+    assert rollup.gaps == 0